@@ -1,12 +1,24 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
-from database import DatabaseConnection
+from database import DatabaseConnection, AsyncDatabaseConnection, AsyncSession, PoolTimeoutError
 from weather_simulator import WeatherSimulator
 from smart_pole_simulator import SmartPoleSimulator
 from power_meter_simulator import PowerMeterSimulator
 from flow_meter_simulator import FlowMeterSimulator
+from rollups import ROLLUP_METRICS, ALL_GROUP, FLEET_BUCKET_MINUTES
+from pagination import encode_cursor, decode_cursor, InvalidCursorError
+from downsampling import lttb_indices
+from export import EXPORT_TABLES, EXPORT_FORMATS, EXPORT_CHUNK_ROWS, export_query, encoder
+from response_cache import ResponseCache, CachedResponse, etag_matches
+from ingest import (INGEST_FORMATS, INGEST_MAX_BYTES, IngestError, BatchTooLargeError, IngestWriteError,
+                    parse_body, store_readings, local_naive)
+from urllib.parse import urlencode
+import numpy as np
+import os
 import uvicorn
 
 app = FastAPI(
@@ -19,8 +31,181 @@ app = FastAPI(
     }
 )
 
-# Database connection
-db = DatabaseConnection()
+# Database connection pool; every request borrows its own connection and
+# queries run on a bounded thread pool so the event loop never blocks
+db_pool = DatabaseConnection()
+async_db = AsyncDatabaseConnection(db_pool)
+
+async def get_db():
+    """Borrow a pooled connection for the duration of one request"""
+    try:
+        async with async_db.connection() as db:
+            yield db
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+async def get_heavy_db():
+    """Borrow a pooled connection for time-range and aggregate queries"""
+    try:
+        async with async_db.connection(heavy=True) as db:
+            yield db
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+# Response cache for listings and statistics: path -> (invalidation groups, TTL in seconds).
+# Write handlers invalidate their groups; each uvicorn worker has its own cache, so a write
+# made through another worker shows up once the TTL expires
+DEVICE_CACHE_TTL = float(os.getenv('API_CACHE_TTL_DEVICES', '60'))
+STATISTICS_CACHE_TTL = float(os.getenv('API_CACHE_TTL_STATISTICS', '10'))
+CACHED_ROUTES = {
+    "/categories": (frozenset({"categories"}), DEVICE_CACHE_TTL),
+    "/smart-poles": (frozenset({"smart-poles"}), DEVICE_CACHE_TTL),
+    "/power-meters": (frozenset({"power-meters"}), DEVICE_CACHE_TTL),
+    "/flow-meters": (frozenset({"flow-meters"}), DEVICE_CACHE_TTL),
+    "/statistics/power-consumption": (frozenset({"power-meters", "statistics"}), STATISTICS_CACHE_TTL),
+    "/statistics/flow-rates": (frozenset({"flow-meters", "statistics"}), STATISTICS_CACHE_TTL)
+}
+CACHE_STATUS_HEADER = "X-Cache"
+response_cache = ResponseCache(int(os.getenv('API_CACHE_MAX_ENTRIES', '1024')))
+
+def cached_reply(request, entry, cache_status):
+    """Response for a cached entry: 304 when the client already has its ETag"""
+    headers = {"ETag": entry.etag, CACHE_STATUS_HEADER: cache_status}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, status_code=entry.status_code, headers={**entry.headers, **headers})
+
+@app.middleware("http")
+async def cache_responses(request: Request, call_next):
+    """Serve GETs of CACHED_ROUTES from the response cache, computing each missing entry once"""
+    route = CACHED_ROUTES.get(request.url.path) if request.method == "GET" else None
+    if route is None or route[1] <= 0:
+        return await call_next(request)
+
+    groups, ttl = route
+    key = f"{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}"
+    entry = response_cache.get(key)
+    if entry is not None:
+        response_cache.hits += 1
+        return cached_reply(request, entry, "HIT")
+
+    # Concurrent misses wait for the first one instead of all querying the database
+    try:
+        async with response_cache.lock(key):
+            entry = response_cache.get(key)
+            if entry is not None:
+                response_cache.hits += 1
+                return cached_reply(request, entry, "HIT")
+
+            response_cache.misses += 1
+            generation = response_cache.generation(groups)
+            response = await call_next(request)
+            if response.status_code != 200:
+                return response
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+            entry = CachedResponse(response.status_code, headers, body, groups, ttl)
+            response_cache.put(key, entry, generation)
+    finally:
+        response_cache.release(key)
+    return cached_reply(request, entry, "MISS")
+
+async def commit_and_invalidate(db, *groups):
+    """Commit a write handler's changes, then drop the cached responses they affect
+
+    Committing first means a request that misses the cache right after the
+    invalidation already reads the new data.
+    """
+    await db.commit()
+    response_cache.invalidate(*groups)
+
+# Keyset pagination: list endpoints fetch one row past the page and return an
+# opaque cursor for the last row in the X-Next-Cursor header while more remain
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def parse_cursor(cursor, *types):
+    """Decode a cursor query parameter, rejecting malformed ones with 400"""
+    try:
+        return decode_cursor(cursor, *types)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def paginate(rows, limit, response, key):
+    """Trim the lookahead row and set the next-page cursor from key(last row)"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
+
+def where_clause(conditions):
+    """Join SQL conditions into a WHERE clause (empty when there are none)"""
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+READINGS_PAGE_MAX = 1000
+
+def readings_window(meter_id, start, end, order, cursor):
+    """WHERE clause and params for one meter's readings in [start, end) after a (timestamp, id) cursor"""
+    start, end = local_naive(start), local_naive(end)
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    conditions, params = ["meter_id = %s"], [meter_id]
+    if start:
+        conditions.append("timestamp >= %s")
+        params.append(start)
+    if end:
+        conditions.append("timestamp < %s")
+        params.append(end)
+    if cursor:
+        # Row comparison matches the (meter_id, timestamp, id) index, so each page is one index range scan
+        conditions.append(f"(timestamp, id) {'<' if order == 'desc' else '>'} (%s, %s)")
+        params.extend(parse_cursor(cursor, datetime, int))
+    return where_clause(conditions), params
+
+# Reading columns returned by the readings endpoints (id last, for cursors)
+POWER_READING_COLUMNS = """timestamp, voltage_v, current_a, power_w, power_factor, energy_kwh,
+               frequency_hz, voltage_l1_v, voltage_l2_v, voltage_l3_v,
+               current_l1_a, current_l2_a, current_l3_a,
+               power_l1_w, power_l2_w, power_l3_w, id"""
+FLOW_READING_COLUMNS = "timestamp, flow_rate, total_volume, temperature_c, pressure_bar, density, id"
+
+# Metrics the readings endpoints can downsample on
+POWER_DOWNSAMPLE_METRICS = ("power_w", "voltage_v", "current_a", "power_factor", "energy_kwh", "frequency_hz")
+FLOW_DOWNSAMPLE_METRICS = ("flow_rate", "total_volume", "temperature_c", "pressure_bar")
+MAX_DOWNSAMPLE_POINTS = 5000
+
+async def downsampled_readings(db, table, columns, meter_id, start, end, metric, points):
+    """One meter's readings in [start, end) reduced to at most points rows with LTTB on metric
+
+    Only (timestamp, id, metric) of the window is scanned; the full rows are then
+    fetched for the kept points, oldest first.
+    """
+    where, params = readings_window(meter_id, start, end, "asc", None)
+    query = f"""
+        SELECT timestamp, id, {metric}
+        FROM {table}
+        {where} AND {metric} IS NOT NULL
+        ORDER BY timestamp, id
+    """
+    series = await db.fetch_all(query, params)
+    if not series:
+        return []
+
+    x = np.array([row[0] for row in series], dtype='datetime64[us]').astype(np.int64).astype(np.float64)
+    y = np.array([row[2] for row in series], dtype=np.float64)
+    keep = lttb_indices(x, y, points)
+
+    # timestamp = ANY(...) lets the planner prune partitions the kept points are not in
+    query = f"""
+        SELECT {columns}
+        FROM {table}
+        WHERE meter_id = %s AND id = ANY(%s) AND timestamp = ANY(%s)
+        ORDER BY timestamp, id
+    """
+    return await db.fetch_all(query, (
+        meter_id,
+        [series[i][1] for i in keep],
+        [series[i][0] for i in keep]
+    ))
 
 # Pydantic models for request/response
 
@@ -69,11 +254,11 @@ class ControlRequest(BaseModel):
 # Initialize database connection
 @app.on_event("startup")
 async def startup_event():
-    db.connect()
+    async_db.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    db.disconnect()
+    async_db.stop()
 
 # Root endpoint
 @app.get("/", tags=["General"])
@@ -93,10 +278,10 @@ async def root():
 
 # Device Categories endpoints
 @app.get("/categories", tags=["Device Categories"], response_model=List[Dict[str, Any]])
-async def list_categories():
+async def list_categories(db: AsyncSession = Depends(get_db)):
     """List all device categories"""
     query = "SELECT category_id, category_name, description FROM device_categories ORDER BY category_name"
-    results = db.fetch_all(query)
+    results = await db.fetch_all(query)
     
     return [
         {
@@ -108,7 +293,7 @@ async def list_categories():
     ]
 
 @app.post("/categories", tags=["Device Categories"], status_code=201)
-async def create_category(category: DeviceCategory):
+async def create_category(category: DeviceCategory, db: AsyncSession = Depends(get_db)):
     """Create a new device category"""
     query = """
         INSERT INTO device_categories (category_id, category_name, description)
@@ -117,13 +302,14 @@ async def create_category(category: DeviceCategory):
     """
     
     try:
-        result = db.fetch_one(query, (
+        result = await db.fetch_one(query, (
             category.category_id,
             category.category_name,
             category.description
         ))
         
         if result:
+            await commit_and_invalidate(db, "categories")
             return {"message": "Device category created successfully", "category_id": result[0]}
         else:
             raise HTTPException(status_code=500, detail="Failed to create device category")
@@ -131,14 +317,14 @@ async def create_category(category: DeviceCategory):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/categories/{category_id}", tags=["Device Categories"])
-async def get_category(category_id: str):
+async def get_category(category_id: str, db: AsyncSession = Depends(get_db)):
     """Get details of a specific device category"""
     query = """
         SELECT category_id, category_name, description
         FROM device_categories
         WHERE category_id = %s
     """
-    result = db.fetch_one(query, (category_id,))
+    result = await db.fetch_one(query, (category_id,))
     
     if not result:
         raise HTTPException(status_code=404, detail="Device category not found")
@@ -150,7 +336,7 @@ async def get_category(category_id: str):
     }
 
 @app.put("/categories/{category_id}", tags=["Device Categories"])
-async def update_category(category_id: str, category: DeviceCategory):
+async def update_category(category_id: str, category: DeviceCategory, db: AsyncSession = Depends(get_db)):
     """Update a device category"""
     query = """
         UPDATE device_categories
@@ -159,7 +345,7 @@ async def update_category(category_id: str, category: DeviceCategory):
         RETURNING category_id
     """
     
-    result = db.fetch_one(query, (
+    result = await db.fetch_one(query, (
         category.category_name,
         category.description,
         category_id
@@ -168,33 +354,51 @@ async def update_category(category_id: str, category: DeviceCategory):
     if not result:
         raise HTTPException(status_code=404, detail="Device category not found")
     
+    await commit_and_invalidate(db, "categories")
     return {
         "message": f"Device category {category_id} updated successfully",
         "category_id": result[0]
     }
 
 @app.delete("/categories/{category_id}", tags=["Device Categories"])
-async def delete_category(category_id: str):
+async def delete_category(category_id: str, db: AsyncSession = Depends(get_db)):
     """Delete a device category"""
     query = "DELETE FROM device_categories WHERE category_id = %s RETURNING category_id"
-    result = db.fetch_one(query, (category_id,))
+    result = await db.fetch_one(query, (category_id,))
     
     if not result:
         raise HTTPException(status_code=404, detail="Device category not found")
     
+    await commit_and_invalidate(db, "categories")
     return {"message": f"Device category {category_id} deleted successfully"}
 
 # Smart Pole endpoints
 @app.get("/smart-poles", tags=["Smart Poles"])
-async def list_smart_poles():
-    """List all smart poles"""
-    query = """
+async def list_smart_poles(
+    response: Response,
+    status: Optional[str] = Query(None, pattern="^(on|off)$"),
+    limit: int = Query(100, ge=1, le=1000, description="Number of poles per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    db: AsyncSession = Depends(get_db)
+):
+    """List smart poles by pole_id, optionally filtered by status, one page at a time"""
+    conditions, params = [], []
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    if cursor:
+        conditions.append("pole_id > %s")
+        params.extend(parse_cursor(cursor, str))
+    query = f"""
         SELECT pole_id, location, latitude, longitude, status, 
                created_at, updated_at
         FROM smart_poles
+        {where_clause(conditions)}
         ORDER BY pole_id
+        LIMIT %s
     """
-    results = db.fetch_all(query)
+    results = await db.fetch_all(query, (*params, limit + 1))
+    results = paginate(results, limit, response, lambda row: (row[0],))
     
     return [
         {
@@ -210,7 +414,7 @@ async def list_smart_poles():
     ]
 
 @app.post("/smart-poles", tags=["Smart Poles"], status_code=201)
-async def create_smart_pole(pole: SmartPole):
+async def create_smart_pole(pole: SmartPole, db: AsyncSession = Depends(get_db)):
     """Create a new smart pole"""
     query = """
         INSERT INTO smart_poles (pole_id, location, latitude, longitude, status)
@@ -219,7 +423,7 @@ async def create_smart_pole(pole: SmartPole):
     """
     
     try:
-        result = db.fetch_one(query, (
+        result = await db.fetch_one(query, (
             pole.pole_id,
             pole.location,
             pole.latitude,
@@ -228,6 +432,7 @@ async def create_smart_pole(pole: SmartPole):
         ))
         
         if result:
+            await commit_and_invalidate(db, "smart-poles")
             return {"message": "Smart pole created successfully", "pole_id": result[0]}
         else:
             raise HTTPException(status_code=500, detail="Failed to create smart pole")
@@ -235,7 +440,7 @@ async def create_smart_pole(pole: SmartPole):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/smart-poles/{pole_id}", tags=["Smart Poles"])
-async def get_smart_pole(pole_id: str):
+async def get_smart_pole(pole_id: str, db: AsyncSession = Depends(get_db)):
     """Get details of a specific smart pole"""
     query = """
         SELECT pole_id, location, latitude, longitude, status, 
@@ -243,7 +448,7 @@ async def get_smart_pole(pole_id: str):
         FROM smart_poles
         WHERE pole_id = %s
     """
-    result = db.fetch_one(query, (pole_id,))
+    result = await db.fetch_one(query, (pole_id,))
     
     if not result:
         raise HTTPException(status_code=404, detail="Smart pole not found")
@@ -259,7 +464,7 @@ async def get_smart_pole(pole_id: str):
     }
 
 @app.put("/smart-poles/{pole_id}", tags=["Smart Poles"])
-async def update_smart_pole(pole_id: str, pole: SmartPole):
+async def update_smart_pole(pole_id: str, pole: SmartPole, db: AsyncSession = Depends(get_db)):
     """Update a smart pole"""
     query = """
         UPDATE smart_poles
@@ -268,7 +473,7 @@ async def update_smart_pole(pole_id: str, pole: SmartPole):
         RETURNING pole_id
     """
     
-    result = db.fetch_one(query, (
+    result = await db.fetch_one(query, (
         pole.location,
         pole.latitude,
         pole.longitude,
@@ -279,13 +484,14 @@ async def update_smart_pole(pole_id: str, pole: SmartPole):
     if not result:
         raise HTTPException(status_code=404, detail="Smart pole not found")
     
+    await commit_and_invalidate(db, "smart-poles")
     return {
         "message": f"Smart pole {pole_id} updated successfully",
         "pole_id": result[0]
     }
 
 @app.put("/smart-poles/{pole_id}/control", tags=["Smart Poles"])
-async def control_smart_pole(pole_id: str, control: ControlRequest):
+async def control_smart_pole(pole_id: str, control: ControlRequest, db: AsyncSession = Depends(get_db)):
     """Control smart pole (turn on/off)"""
     query = """
         UPDATE smart_poles 
@@ -294,11 +500,12 @@ async def control_smart_pole(pole_id: str, control: ControlRequest):
         RETURNING pole_id, status
     """
     
-    result = db.fetch_one(query, (control.status, pole_id))
+    result = await db.fetch_one(query, (control.status, pole_id))
     
     if not result:
         raise HTTPException(status_code=404, detail="Smart pole not found")
     
+    await commit_and_invalidate(db, "smart-poles")
     return {
         "message": f"Smart pole {pole_id} status updated",
         "pole_id": result[0],
@@ -306,26 +513,27 @@ async def control_smart_pole(pole_id: str, control: ControlRequest):
     }
 
 @app.delete("/smart-poles/{pole_id}", tags=["Smart Poles"])
-async def delete_smart_pole(pole_id: str):
+async def delete_smart_pole(pole_id: str, db: AsyncSession = Depends(get_db)):
     """Delete a smart pole"""
     query = "DELETE FROM smart_poles WHERE pole_id = %s RETURNING pole_id"
-    result = db.fetch_one(query, (pole_id,))
+    result = await db.fetch_one(query, (pole_id,))
     
     if not result:
         raise HTTPException(status_code=404, detail="Smart pole not found")
     
+    await commit_and_invalidate(db, "smart-poles")
     return {"message": f"Smart pole {pole_id} deleted successfully"}
 
 # Smart Pole Modules endpoints
 @app.get("/smart-poles/{pole_id}/modules", tags=["Smart Poles"])
-async def list_pole_modules(pole_id: str):
+async def list_pole_modules(pole_id: str, db: AsyncSession = Depends(get_db)):
     """List all modules of a smart pole"""
     query = """
         SELECT module_type, module_name, power_rating_w, status
         FROM smart_pole_modules
         WHERE pole_id = %s
     """
-    results = db.fetch_all(query, (pole_id,))
+    results = await db.fetch_all(query, (pole_id,))
     
     return [
         {
@@ -338,10 +546,10 @@ async def list_pole_modules(pole_id: str):
     ]
 
 @app.post("/smart-poles/{pole_id}/modules", tags=["Smart Poles"], status_code=201)
-async def add_pole_module(pole_id: str, module: SmartPoleModule):
+async def add_pole_module(pole_id: str, module: SmartPoleModule, db: AsyncSession = Depends(get_db)):
     """Add a module to a smart pole"""
     # Verify pole exists
-    pole_check = db.fetch_one("SELECT pole_id FROM smart_poles WHERE pole_id = %s", (pole_id,))
+    pole_check = await db.fetch_one("SELECT pole_id FROM smart_poles WHERE pole_id = %s", (pole_id,))
     if not pole_check:
         raise HTTPException(status_code=404, detail="Smart pole not found")
     
@@ -352,7 +560,7 @@ async def add_pole_module(pole_id: str, module: SmartPoleModule):
     """
     
     try:
-        result = db.fetch_one(query, (
+        result = await db.fetch_one(query, (
             pole_id,
             module.module_type,
             module.module_name,
@@ -361,6 +569,7 @@ async def add_pole_module(pole_id: str, module: SmartPoleModule):
         ))
         
         if result:
+            await commit_and_invalidate(db, "smart-poles")
             return {"message": "Module added successfully", "module_id": result[0]}
         else:
             raise HTTPException(status_code=500, detail="Failed to add module")
@@ -369,25 +578,34 @@ async def add_pole_module(pole_id: str, module: SmartPoleModule):
 
 # Power Meter endpoints
 @app.get("/power-meters", tags=["Power Meters"])
-async def list_power_meters(meter_type: Optional[str] = Query(None, pattern="^(1-phase|3-phase)$")):
-    """List all power meters, optionally filtered by type"""
-    if meter_type:
-        query = """
-            SELECT meter_id, meter_type, location, room_name, building, 
-                   latitude, longitude, status, created_at, updated_at
-            FROM power_meters
-            WHERE meter_type = %s
-            ORDER BY meter_id
-        """
-        results = db.fetch_all(query, (meter_type,))
-    else:
-        query = """
-            SELECT meter_id, meter_type, location, room_name, building, 
-                   latitude, longitude, status, created_at, updated_at
-            FROM power_meters
-            ORDER BY meter_id
-        """
-        results = db.fetch_all(query)
+async def list_power_meters(
+    response: Response,
+    meter_type: Optional[str] = Query(None, pattern="^(1-phase|3-phase)$"),
+    building: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000, description="Number of meters per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    db: AsyncSession = Depends(get_db)
+):
+    """List power meters by meter_id, optionally filtered by type, building and status, one page at a time"""
+    conditions, params = [], []
+    for column, value in (("meter_type", meter_type), ("building", building), ("status", status)):
+        if value:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    if cursor:
+        conditions.append("meter_id > %s")
+        params.extend(parse_cursor(cursor, str))
+    query = f"""
+        SELECT meter_id, meter_type, location, room_name, building, 
+               latitude, longitude, status, created_at, updated_at
+        FROM power_meters
+        {where_clause(conditions)}
+        ORDER BY meter_id
+        LIMIT %s
+    """
+    results = await db.fetch_all(query, (*params, limit + 1))
+    results = paginate(results, limit, response, lambda row: (row[0],))
     
     return [
         {
@@ -406,7 +624,7 @@ async def list_power_meters(meter_type: Optional[str] = Query(None, pattern="^(1
     ]
 
 @app.post("/power-meters", tags=["Power Meters"], status_code=201)
-async def create_power_meter(meter: PowerMeter):
+async def create_power_meter(meter: PowerMeter, db: AsyncSession = Depends(get_db)):
     """Create a new power meter"""
     query = """
         INSERT INTO power_meters (meter_id, meter_type, location, room_name, building, 
@@ -416,7 +634,7 @@ async def create_power_meter(meter: PowerMeter):
     """
     
     try:
-        result = db.fetch_one(query, (
+        result = await db.fetch_one(query, (
             meter.meter_id,
             meter.meter_type,
             meter.location,
@@ -428,6 +646,7 @@ async def create_power_meter(meter: PowerMeter):
         ))
         
         if result:
+            await commit_and_invalidate(db, "power-meters")
             return {"message": "Power meter created successfully", "meter_id": result[0]}
         else:
             raise HTTPException(status_code=500, detail="Failed to create power meter")
@@ -435,7 +654,7 @@ async def create_power_meter(meter: PowerMeter):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/power-meters/{meter_id}", tags=["Power Meters"])
-async def get_power_meter(meter_id: str):
+async def get_power_meter(meter_id: str, db: AsyncSession = Depends(get_db)):
     """Get details of a specific power meter"""
     query = """
         SELECT meter_id, meter_type, location, room_name, building, 
@@ -443,7 +662,7 @@ async def get_power_meter(meter_id: str):
         FROM power_meters
         WHERE meter_id = %s
     """
-    result = db.fetch_one(query, (meter_id,))
+    result = await db.fetch_one(query, (meter_id,))
     
     if not result:
         raise HTTPException(status_code=404, detail="Power meter not found")
@@ -464,20 +683,35 @@ async def get_power_meter(meter_id: str):
 @app.get("/power-meters/{meter_id}/readings", tags=["Power Meters"])
 async def get_power_meter_readings(
     meter_id: str,
-    limit: int = Query(10, ge=1, le=100, description="Number of readings to return")
+    response: Response,
+    start: Optional[datetime] = Query(None, alias="from", description="Start of the window (inclusive)"),
+    end: Optional[datetime] = Query(None, alias="to", description="End of the window (exclusive)"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Newest first (desc) or oldest first (asc)"),
+    limit: int = Query(10, ge=1, le=READINGS_PAGE_MAX, description="Number of readings per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    points: Optional[int] = Query(None, ge=3, le=MAX_DOWNSAMPLE_POINTS,
+                                  description="Downsample the whole window to this many readings (LTTB, oldest first)"),
+    metric: str = Query("power_w", description="Metric that drives downsampling"),
+    db: AsyncSession = Depends(get_heavy_db)
 ):
-    """Get latest readings from a power meter"""
-    query = """
-        SELECT timestamp, voltage_v, current_a, power_w, power_factor, energy_kwh, 
-               frequency_hz, voltage_l1_v, voltage_l2_v, voltage_l3_v,
-               current_l1_a, current_l2_a, current_l3_a,
-               power_l1_w, power_l2_w, power_l3_w
-        FROM power_meter_readings
-        WHERE meter_id = %s
-        ORDER BY timestamp DESC
-        LIMIT %s
-    """
-    results = db.fetch_all(query, (meter_id, limit))
+    """Get readings from a power meter, newest first by default, one page at a time or downsampled"""
+    if points:
+        if metric not in POWER_DOWNSAMPLE_METRICS:
+            raise HTTPException(status_code=400,
+                                detail=f"Cannot downsample on metric. Use one of: {', '.join(POWER_DOWNSAMPLE_METRICS)}")
+        results = await downsampled_readings(db, "power_meter_readings", POWER_READING_COLUMNS,
+                                             meter_id, start, end, metric, points)
+    else:
+        where, params = readings_window(meter_id, start, end, order, cursor)
+        query = f"""
+            SELECT {POWER_READING_COLUMNS}
+            FROM power_meter_readings
+            {where}
+            ORDER BY timestamp {order}, id {order}
+            LIMIT %s
+        """
+        results = await db.fetch_all(query, (*params, limit + 1))
+        results = paginate(results, limit, response, lambda row: (row[0], row[16]))
     
     return [
         {
@@ -504,7 +738,7 @@ async def get_power_meter_readings(
     ]
 
 @app.put("/power-meters/{meter_id}", tags=["Power Meters"])
-async def update_power_meter(meter_id: str, meter: PowerMeter):
+async def update_power_meter(meter_id: str, meter: PowerMeter, db: AsyncSession = Depends(get_db)):
     """Update a power meter"""
     query = """
         UPDATE power_meters
@@ -514,7 +748,7 @@ async def update_power_meter(meter_id: str, meter: PowerMeter):
         RETURNING meter_id
     """
     
-    result = db.fetch_one(query, (
+    result = await db.fetch_one(query, (
         meter.meter_type,
         meter.location,
         meter.room_name,
@@ -528,43 +762,54 @@ async def update_power_meter(meter_id: str, meter: PowerMeter):
     if not result:
         raise HTTPException(status_code=404, detail="Power meter not found")
     
+    await commit_and_invalidate(db, "power-meters")
     return {
         "message": f"Power meter {meter_id} updated successfully",
         "meter_id": result[0]
     }
 
 @app.delete("/power-meters/{meter_id}", tags=["Power Meters"])
-async def delete_power_meter(meter_id: str):
+async def delete_power_meter(meter_id: str, db: AsyncSession = Depends(get_db)):
     """Delete a power meter"""
     query = "DELETE FROM power_meters WHERE meter_id = %s RETURNING meter_id"
-    result = db.fetch_one(query, (meter_id,))
+    result = await db.fetch_one(query, (meter_id,))
     
     if not result:
         raise HTTPException(status_code=404, detail="Power meter not found")
     
+    await commit_and_invalidate(db, "power-meters")
     return {"message": f"Power meter {meter_id} deleted successfully"}
 
 # Flow Meter endpoints
 @app.get("/flow-meters", tags=["Flow Meters"])
-async def list_flow_meters(meter_type: Optional[str] = Query(None, pattern="^(water|gas|steam|oil|air)$")):
-    """List all flow meters, optionally filtered by type"""
-    if meter_type:
-        query = """
-            SELECT meter_id, meter_type, flow_unit, location, building, 
-                   pipe_size_mm, max_flow_rate, status, created_at, updated_at
-            FROM flow_meters
-            WHERE meter_type = %s
-            ORDER BY meter_id
-        """
-        results = db.fetch_all(query, (meter_type,))
-    else:
-        query = """
-            SELECT meter_id, meter_type, flow_unit, location, building, 
-                   pipe_size_mm, max_flow_rate, status, created_at, updated_at
-            FROM flow_meters
-            ORDER BY meter_id
-        """
-        results = db.fetch_all(query)
+async def list_flow_meters(
+    response: Response,
+    meter_type: Optional[str] = Query(None, pattern="^(water|gas|steam|oil|air)$"),
+    building: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000, description="Number of meters per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    db: AsyncSession = Depends(get_db)
+):
+    """List flow meters by meter_id, optionally filtered by type, building and status, one page at a time"""
+    conditions, params = [], []
+    for column, value in (("meter_type", meter_type), ("building", building), ("status", status)):
+        if value:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    if cursor:
+        conditions.append("meter_id > %s")
+        params.extend(parse_cursor(cursor, str))
+    query = f"""
+        SELECT meter_id, meter_type, flow_unit, location, building, 
+               pipe_size_mm, max_flow_rate, status, created_at, updated_at
+        FROM flow_meters
+        {where_clause(conditions)}
+        ORDER BY meter_id
+        LIMIT %s
+    """
+    results = await db.fetch_all(query, (*params, limit + 1))
+    results = paginate(results, limit, response, lambda row: (row[0],))
     
     return [
         {
@@ -583,7 +828,7 @@ async def list_flow_meters(meter_type: Optional[str] = Query(None, pattern="^(wa
     ]
 
 @app.post("/flow-meters", tags=["Flow Meters"], status_code=201)
-async def create_flow_meter(meter: FlowMeter):
+async def create_flow_meter(meter: FlowMeter, db: AsyncSession = Depends(get_db)):
     """Create a new flow meter"""
     query = """
         INSERT INTO flow_meters (meter_id, meter_type, flow_unit, location, building,
@@ -593,7 +838,7 @@ async def create_flow_meter(meter: FlowMeter):
     """
     
     try:
-        result = db.fetch_one(query, (
+        result = await db.fetch_one(query, (
             meter.meter_id,
             meter.meter_type,
             meter.flow_unit,
@@ -605,6 +850,7 @@ async def create_flow_meter(meter: FlowMeter):
         ))
         
         if result:
+            await commit_and_invalidate(db, "flow-meters")
             return {"message": "Flow meter created successfully", "meter_id": result[0]}
         else:
             raise HTTPException(status_code=500, detail="Failed to create flow meter")
@@ -612,7 +858,7 @@ async def create_flow_meter(meter: FlowMeter):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/flow-meters/{meter_id}", tags=["Flow Meters"])
-async def get_flow_meter(meter_id: str):
+async def get_flow_meter(meter_id: str, db: AsyncSession = Depends(get_db)):
     """Get details of a specific flow meter"""
     query = """
         SELECT meter_id, meter_type, flow_unit, location, building,
@@ -620,7 +866,7 @@ async def get_flow_meter(meter_id: str):
         FROM flow_meters
         WHERE meter_id = %s
     """
-    result = db.fetch_one(query, (meter_id,))
+    result = await db.fetch_one(query, (meter_id,))
     
     if not result:
         raise HTTPException(status_code=404, detail="Flow meter not found")
@@ -641,17 +887,35 @@ async def get_flow_meter(meter_id: str):
 @app.get("/flow-meters/{meter_id}/readings", tags=["Flow Meters"])
 async def get_flow_meter_readings(
     meter_id: str,
-    limit: int = Query(10, ge=1, le=100, description="Number of readings to return")
+    response: Response,
+    start: Optional[datetime] = Query(None, alias="from", description="Start of the window (inclusive)"),
+    end: Optional[datetime] = Query(None, alias="to", description="End of the window (exclusive)"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Newest first (desc) or oldest first (asc)"),
+    limit: int = Query(10, ge=1, le=READINGS_PAGE_MAX, description="Number of readings per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    points: Optional[int] = Query(None, ge=3, le=MAX_DOWNSAMPLE_POINTS,
+                                  description="Downsample the whole window to this many readings (LTTB, oldest first)"),
+    metric: str = Query("flow_rate", description="Metric that drives downsampling"),
+    db: AsyncSession = Depends(get_heavy_db)
 ):
-    """Get latest readings from a flow meter"""
-    query = """
-        SELECT timestamp, flow_rate, total_volume, temperature_c, pressure_bar, density
-        FROM flow_meter_readings
-        WHERE meter_id = %s
-        ORDER BY timestamp DESC
-        LIMIT %s
-    """
-    results = db.fetch_all(query, (meter_id, limit))
+    """Get readings from a flow meter, newest first by default, one page at a time or downsampled"""
+    if points:
+        if metric not in FLOW_DOWNSAMPLE_METRICS:
+            raise HTTPException(status_code=400,
+                                detail=f"Cannot downsample on metric. Use one of: {', '.join(FLOW_DOWNSAMPLE_METRICS)}")
+        results = await downsampled_readings(db, "flow_meter_readings", FLOW_READING_COLUMNS,
+                                             meter_id, start, end, metric, points)
+    else:
+        where, params = readings_window(meter_id, start, end, order, cursor)
+        query = f"""
+            SELECT {FLOW_READING_COLUMNS}
+            FROM flow_meter_readings
+            {where}
+            ORDER BY timestamp {order}, id {order}
+            LIMIT %s
+        """
+        results = await db.fetch_all(query, (*params, limit + 1))
+        results = paginate(results, limit, response, lambda row: (row[0], row[6]))
     
     return [
         {
@@ -666,7 +930,7 @@ async def get_flow_meter_readings(
     ]
 
 @app.put("/flow-meters/{meter_id}", tags=["Flow Meters"])
-async def update_flow_meter(meter_id: str, meter: FlowMeter):
+async def update_flow_meter(meter_id: str, meter: FlowMeter, db: AsyncSession = Depends(get_db)):
     """Update a flow meter"""
     query = """
         UPDATE flow_meters
@@ -676,7 +940,7 @@ async def update_flow_meter(meter_id: str, meter: FlowMeter):
         RETURNING meter_id
     """
     
-    result = db.fetch_one(query, (
+    result = await db.fetch_one(query, (
         meter.meter_type,
         meter.flow_unit,
         meter.location,
@@ -690,34 +954,36 @@ async def update_flow_meter(meter_id: str, meter: FlowMeter):
     if not result:
         raise HTTPException(status_code=404, detail="Flow meter not found")
     
+    await commit_and_invalidate(db, "flow-meters")
     return {
         "message": f"Flow meter {meter_id} updated successfully",
         "meter_id": result[0]
     }
 
 @app.delete("/flow-meters/{meter_id}", tags=["Flow Meters"])
-async def delete_flow_meter(meter_id: str):
+async def delete_flow_meter(meter_id: str, db: AsyncSession = Depends(get_db)):
     """Delete a flow meter"""
     query = "DELETE FROM flow_meters WHERE meter_id = %s RETURNING meter_id"
-    result = db.fetch_one(query, (meter_id,))
+    result = await db.fetch_one(query, (meter_id,))
     
     if not result:
         raise HTTPException(status_code=404, detail="Flow meter not found")
     
+    await commit_and_invalidate(db, "flow-meters")
     return {"message": f"Flow meter {meter_id} deleted successfully"}
 
 # Weather Station endpoint
 @app.get("/weather/latest", tags=["Weather Station"])
-async def get_latest_weather():
+async def get_latest_weather(db: AsyncSession = Depends(get_db)):
     """Get latest weather station data"""
     query = """
         SELECT station_id, timestamp, temperature_c, humidity_percent, pressure_hpa,
                wind_speed_ms, wind_direction_deg, rainfall_mm, light_intensity_lux
-        FROM weather_station
+        FROM weather_station_latest
         ORDER BY timestamp DESC
         LIMIT 1
     """
-    result = db.fetch_one(query)
+    result = await db.fetch_one(query)
     
     if not result:
         raise HTTPException(status_code=404, detail="No weather data available")
@@ -735,21 +1001,54 @@ async def get_latest_weather():
     }
 
 # Statistics endpoints
+# Last-hour statistics per meter type, read only from rollups: the window is the last twelve
+# 5-minute fleet_rollups buckets (the current, still open bucket and the eleven before it), so it
+# covers between 55 and 60 minutes. meter_count counts the meters whose latest reading
+# (<table>_latest) falls in the window.
+STATS_BUCKET_MINUTES = FLEET_BUCKET_MINUTES["5min"]
+HOUR_WINDOW_STATS_QUERY = """
+    WITH bounds AS (
+        SELECT date_trunc('hour', LOCALTIMESTAMP)
+               + floor(date_part('minute', LOCALTIMESTAMP) / {minutes}) * INTERVAL '{minutes} minutes'
+               - INTERVAL '{lookback} minutes' AS since
+    ),
+    totals AS (
+        SELECT f.group_key AS meter_type,
+               SUM(f.sum_value) FILTER (WHERE f.metric = '{avg_metric}')
+                   / NULLIF(SUM(f.sample_count) FILTER (WHERE f.metric = '{avg_metric}'), 0) AS avg_value,
+               SUM(f.sum_value) FILTER (WHERE f.metric = '{sum_metric}') AS total_value
+        FROM fleet_rollups f CROSS JOIN bounds b
+        WHERE f.source_table = '{readings}' AND f.bucket_size = '5min'
+          AND f.bucket_start >= b.since AND f.group_key <> '{all_group}'
+        GROUP BY f.group_key
+    ),
+    meters AS (
+        SELECT d.meter_type, COUNT(*) AS meter_count
+        FROM {readings}_latest l
+        JOIN {devices} d ON d.meter_id = l.meter_id
+        CROSS JOIN bounds b
+        WHERE l.timestamp >= b.since
+        GROUP BY d.meter_type
+    )
+    SELECT t.meter_type, COALESCE(m.meter_count, 0) as meter_count, t.avg_value, t.total_value
+    FROM totals t
+    LEFT JOIN meters m ON m.meter_type = t.meter_type
+    ORDER BY t.meter_type
+"""
+
+POWER_STATS_QUERY = HOUR_WINDOW_STATS_QUERY.format(
+    readings="power_meter_readings", devices="power_meters",
+    avg_metric="power_w", sum_metric="energy_kwh", all_group=ALL_GROUP, minutes=STATS_BUCKET_MINUTES,
+    lookback=60 - STATS_BUCKET_MINUTES)
+FLOW_STATS_QUERY = HOUR_WINDOW_STATS_QUERY.format(
+    readings="flow_meter_readings", devices="flow_meters",
+    avg_metric="flow_rate", sum_metric="total_volume", all_group=ALL_GROUP, minutes=STATS_BUCKET_MINUTES,
+    lookback=60 - STATS_BUCKET_MINUTES)
+
 @app.get("/statistics/power-consumption", tags=["Statistics"])
-async def get_power_consumption_stats():
-    """Get power consumption statistics across all meters"""
-    query = """
-        SELECT 
-            pm.meter_type,
-            COUNT(DISTINCT pm.meter_id) as meter_count,
-            AVG(pmr.power_w) as avg_power_w,
-            SUM(pmr.energy_kwh) as total_energy_kwh
-        FROM power_meters pm
-        LEFT JOIN power_meter_readings pmr ON pm.meter_id = pmr.meter_id
-        WHERE pmr.timestamp >= NOW() - INTERVAL '1 hour'
-        GROUP BY pm.meter_type
-    """
-    results = db.fetch_all(query)
+async def get_power_consumption_stats(db: AsyncSession = Depends(get_heavy_db)):
+    """Get power consumption statistics across all meters (last hour)"""
+    results = await db.fetch_all(POWER_STATS_QUERY)
     
     return [
         {
@@ -762,20 +1061,9 @@ async def get_power_consumption_stats():
     ]
 
 @app.get("/statistics/flow-rates", tags=["Statistics"])
-async def get_flow_rate_stats():
-    """Get flow rate statistics across all flow meters"""
-    query = """
-        SELECT 
-            fm.meter_type,
-            COUNT(DISTINCT fm.meter_id) as meter_count,
-            AVG(fmr.flow_rate) as avg_flow_rate,
-            SUM(fmr.total_volume) as total_volume
-        FROM flow_meters fm
-        LEFT JOIN flow_meter_readings fmr ON fm.meter_id = fmr.meter_id
-        WHERE fmr.timestamp >= NOW() - INTERVAL '1 hour'
-        GROUP BY fm.meter_type
-    """
-    results = db.fetch_all(query)
+async def get_flow_rate_stats(db: AsyncSession = Depends(get_heavy_db)):
+    """Get flow rate statistics across all flow meters (last hour)"""
+    results = await db.fetch_all(FLOW_STATS_QUERY)
     
     return [
         {
@@ -787,5 +1075,211 @@ async def get_flow_rate_stats():
         for row in results
     ]
 
+# Rollup endpoints
+ROLLUP_CLASSES = {
+    "weather": "weather_station",
+    "smart-poles": "smart_pole_energy",
+    "power-meters": "power_meter_readings",
+    "flow-meters": "flow_meter_readings"
+}
+
+# Longest window served from hourly buckets when bucket=auto, and longest window overall
+HOURLY_WINDOW_DAYS = 31
+MAX_ROLLUP_WINDOW_DAYS = 366
+
+@app.get("/rollups/{device_class}", tags=["Statistics"])
+async def get_rollups(
+    device_class: str,
+    metric: str = Query(..., description="Rolled-up metric, e.g. power_w or flow_rate"),
+    start: datetime = Query(..., alias="from", description="Start of the window (inclusive)"),
+    end: Optional[datetime] = Query(None, alias="to", description="End of the window (exclusive, default now)"),
+    bucket: str = Query("auto", pattern="^(auto|hour|day)$"),
+    group: str = Query(ALL_GROUP, description="Device group (meter type) or 'all'"),
+    device_id: Optional[str] = Query(None, description="Single device instead of a group"),
+    db: AsyncSession = Depends(get_heavy_db)
+):
+    """Get hourly or daily aggregates of a metric over a time window"""
+    if device_class not in ROLLUP_CLASSES:
+        raise HTTPException(status_code=404, detail=f"Unknown device class. Use one of: {', '.join(ROLLUP_CLASSES)}")
+    source_table = ROLLUP_CLASSES[device_class]
+    if metric not in ROLLUP_METRICS[source_table][1]:
+        raise HTTPException(status_code=400,
+                            detail=f"Metric not rolled up. Use one of: {', '.join(ROLLUP_METRICS[source_table][1])}")
+
+    # Rollup buckets are naive local time, like the readings; times with an offset are converted
+    start, end = local_naive(start), local_naive(end) or datetime.now()
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    days = (end - start).total_seconds() / 86400
+    if days > MAX_ROLLUP_WINDOW_DAYS:
+        raise HTTPException(status_code=400, detail=f"Window longer than {MAX_ROLLUP_WINDOW_DAYS} days")
+    if bucket == "auto":
+        bucket = "hour" if days <= HOURLY_WINDOW_DAYS else "day"
+
+    # Buckets overlapping the window, so a window starting mid-bucket includes that bucket
+    table, key_column, key = ("reading_rollups", "device_id", device_id) if device_id else \
+        ("fleet_rollups", "group_key", group)
+    query = f"""
+        SELECT bucket_start, sample_count, min_value, max_value, sum_value, last_value
+        FROM {table}
+        WHERE source_table = %s AND {key_column} = %s AND metric = %s AND bucket_size = %s
+          AND bucket_start >= date_trunc(%s, %s::timestamp) AND bucket_start < %s
+        ORDER BY bucket_start
+    """
+    results = await db.fetch_all(query, (source_table, key, metric, bucket, bucket, start, end))
+
+    points = [
+        {
+            "bucket_start": row[0].isoformat(),
+            "count": row[1],
+            "min": float(row[2]) if row[2] is not None else None,
+            "max": float(row[3]) if row[3] is not None else None,
+            "avg": float(row[4]) / row[1] if row[1] else None,
+            "sum": float(row[4]) if row[4] is not None else None,
+            "last": float(row[5]) if row[5] is not None else None
+        }
+        for row in results
+    ]
+
+    count = sum(point["count"] for point in points)
+    total = sum(point["sum"] or 0 for point in points)
+    return {
+        "device_class": device_class,
+        "metric": metric,
+        "bucket": bucket,
+        "group": None if device_id else group,
+        "device_id": device_id,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "points": points,
+        "summary": {
+            "count": count,
+            "min": min((p["min"] for p in points if p["min"] is not None), default=None),
+            "max": max((p["max"] for p in points if p["max"] is not None), default=None),
+            "avg": total / count if count else None,
+            "sum": total,
+            "last": points[-1]["last"] if points else None
+        }
+    }
+
+# Export endpoint
+class ConnectionStreamingResponse(StreamingResponse):
+    """Streaming response that releases a borrowed connection however the response ends,
+    including when the client is gone before the body generator is first iterated"""
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Close the generator first so a half-read stream is torn down before the connection goes back
+            if hasattr(self.body_iterator, "aclose"):
+                await self.body_iterator.aclose()
+            await self.release()
+
+@app.get("/export/{table}", tags=["Export"])
+async def export_table(
+    table: str,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson|arrow)$"),
+    compression: str = Query("none", pattern="^(none|gzip|lz4|zstd)$",
+                             description="gzip for csv/ndjson, lz4 or zstd for arrow"),
+    start: Optional[datetime] = Query(None, alias="from", description="Start of the window (inclusive)"),
+    end: Optional[datetime] = Query(None, alias="to", description="End of the window (exclusive)"),
+    device_id: Optional[List[str]] = Query(None, description="Only these devices (repeat for several)")
+):
+    """Stream a reading table as CSV, NDJSON or Arrow IPC straight from a server-side cursor"""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table. Use one of: {', '.join(EXPORT_TABLES)}")
+    media_type, extension, compressions = EXPORT_FORMATS[export_format]
+    if compression not in compressions:
+        raise HTTPException(status_code=400,
+                            detail=f"Compression for {export_format}. Use one of: {', '.join(compressions)}")
+    start, end = local_naive(start), local_naive(end)
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    query, params = export_query(table, start, end, device_id)
+
+    # The connection outlives this handler: it is borrowed here (503 before any
+    # byte is sent) and returned by the response once it has been sent, failed
+    # or was abandoned before the body started
+    context = async_db.connection(heavy=True)
+    try:
+        db = await context.__aenter__()
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    released = False
+
+    async def release(error=None):
+        nonlocal released
+        if not released:
+            released = True
+            await context.__aexit__(type(error) if error else None, error, error.__traceback__ if error else None)
+
+    async def body():
+        try:
+            async for chunk in db.stream(query, params, EXPORT_CHUNK_ROWS, encoder(export_format, compression)):
+                if chunk:
+                    yield chunk
+        except BaseException as e:
+            await release(e)
+            raise
+        await release()
+
+    filename = f"{table}.{extension}" + (".gz" if compression == "gzip" else "")
+    return ConnectionStreamingResponse(body(), release, media_type=media_type,
+                                       headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# Ingest endpoint
+@app.post("/ingest/{device_class}", tags=["Ingest"])
+async def ingest_readings(device_class: str, request: Request):
+    """Bulk load readings sent as a JSON array, NDJSON or CSV (optionally gzipped) with COPY
+
+    Rows are validated column by column rather than one model per row; rows
+    failing validation or naming an unregistered device are rejected and the
+    rest are stored in one transaction, with their rollups and latest values.
+    """
+    if device_class not in ROLLUP_CLASSES:
+        raise HTTPException(status_code=404, detail=f"Unknown device class. Use one of: {', '.join(ROLLUP_CLASSES)}")
+    table = ROLLUP_CLASSES[device_class]
+    media_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    if media_type not in INGEST_FORMATS:
+        raise HTTPException(status_code=415,
+                            detail=f"Unsupported Content-Type. Use one of: {', '.join(INGEST_FORMATS)}")
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if declared > INGEST_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Body larger than {INGEST_MAX_BYTES} bytes")
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > INGEST_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Body larger than {INGEST_MAX_BYTES} bytes")
+
+    # Parsing is CPU-bound, so it runs off the event loop and before a connection is borrowed
+    try:
+        columns, count, errors = await run_in_threadpool(
+            parse_body, table, bytes(body), media_type, request.headers.get("content-encoding"))
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        async with async_db.connection(heavy=True) as db:
+            result = await db.run(store_readings, table, columns, count, errors)
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except IngestWriteError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if result["accepted"]:
+        response_cache.invalidate("statistics")
+    return {"device_class": device_class, "table": table, **result}
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
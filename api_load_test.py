@@ -0,0 +1,99 @@
+"""Measure API latency of fast lookups while slow time-range queries run concurrently
+
+Usage:
+    python api_load_test.py [--url http://localhost:8000] [--slow-clients 8] [--fast-clients 4]
+                            [--requests 50] [--slow-path PATH] [--fast-path PATH]
+
+Run it against the API before and after a change to compare latencies.
+"""
+import argparse
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def timed_get(url):
+    """GET a URL and return (elapsed seconds, HTTP status)"""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return time.perf_counter() - start, status
+
+def client(url, count, results, lock, stop=None):
+    """Issue count sequential requests (or until stop is set) and record latencies"""
+    issued = 0
+    while issued < count and not (stop and stop.is_set()):
+        elapsed, status = timed_get(url)
+        with lock:
+            results.append((elapsed, status))
+        issued += 1
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+def summarize(name, results):
+    """Print latency statistics for one endpoint"""
+    latencies = sorted(elapsed for elapsed, status in results if status == 200)
+    errors = sum(1 for _, status in results if status != 200)
+    if not latencies:
+        print(f"{name:<45} no successful requests ({errors} errors)")
+        return
+    print(f"{name:<45} {len(latencies):>6} "
+          f"{statistics.median(latencies) * 1000:>9.1f} "
+          f"{percentile(latencies, 0.95) * 1000:>9.1f} "
+          f"{latencies[-1] * 1000:>9.1f} {errors:>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--slow-path', default='/statistics/power-consumption')
+    parser.add_argument('--fast-path', default='/weather/latest')
+    parser.add_argument('--slow-clients', type=int, default=8)
+    parser.add_argument('--fast-clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50, help='Requests per fast client')
+    args = parser.parse_args()
+
+    slow_url = args.url.rstrip('/') + args.slow_path
+    fast_url = args.url.rstrip('/') + args.fast_path
+    lock = threading.Lock()
+
+    # Baseline: fast endpoint alone
+    baseline = []
+    client(fast_url, args.requests, baseline, lock)
+
+    # Under load: slow clients keep hammering until the fast clients are done
+    slow_results, fast_results = [], []
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=args.slow_clients + args.fast_clients) as executor:
+        slow_jobs = [executor.submit(client, slow_url, float('inf'), slow_results, lock, stop)
+                     for _ in range(args.slow_clients)]
+        fast_jobs = [executor.submit(client, fast_url, args.requests, fast_results, lock)
+                     for _ in range(args.fast_clients)]
+        for job in fast_jobs:
+            job.result()
+        stop.set()
+        for job in slow_jobs:
+            job.result()
+
+    print(f"\n{'='*85}")
+    print(f"{'Endpoint':<45} {'OK':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9} {'errors':>7}")
+    print(f"{'='*85}")
+    summarize(f"{args.fast_path} (idle)", baseline)
+    summarize(f"{args.fast_path} (under load)", fast_results)
+    summarize(f"{args.slow_path} x{args.slow_clients}", slow_results)
+    print(f"{'='*85}\n")
+
+if __name__ == "__main__":
+    main()
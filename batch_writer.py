@@ -0,0 +1,257 @@
+from contextlib import nullcontext
+from rollups import RollupBuilder, GROUP_COLUMN
+from latest import LatestValues
+import numpy as np
+import psycopg2
+import os
+import time
+
+# Column order of every reading table written by the generator
+TABLE_COLUMNS = {
+    'weather_station': (
+        'station_id', 'timestamp', 'temperature_c', 'humidity_percent', 'pressure_hpa',
+        'wind_speed_ms', 'wind_direction_deg', 'rainfall_mm', 'light_intensity_lux'
+    ),
+    'smart_pole_energy': (
+        'pole_id', 'timestamp', 'power_consumption_w', 'voltage_v', 'current_a',
+        'energy_kwh', 'status'
+    ),
+    'power_meter_readings': (
+        'meter_id', 'timestamp', 'voltage_v', 'current_a', 'power_w', 'power_factor',
+        'energy_kwh', 'frequency_hz', 'voltage_l1_v', 'voltage_l2_v', 'voltage_l3_v',
+        'current_l1_a', 'current_l2_a', 'current_l3_a',
+        'power_l1_w', 'power_l2_w', 'power_l3_w'
+    ),
+    'flow_meter_readings': (
+        'meter_id', 'timestamp', 'flow_rate', 'total_volume', 'temperature_c',
+        'pressure_bar', 'density'
+    )
+}
+
+WRITE_METHODS = ('copy', 'insert')
+
+# Errors meaning the database is unreachable or too slow (statement_timeout cancellations are
+# OperationalErrors too), as opposed to rows it rejects; only batches failing with these are spooled
+UNAVAILABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+def block_rows(values, count):
+    """Convert a column block into row tuples, mapping NaN to None"""
+    columns = []
+    for column in values:
+        if isinstance(column, np.ndarray):
+            items = column.tolist()
+            if column.dtype.kind == 'f':
+                items = [None if item != item else item for item in items]
+            columns.append(items)
+        elif isinstance(column, (list, tuple)):
+            columns.append(column)
+        else:
+            columns.append([column] * count)
+    return list(zip(*columns))
+
+def table_counts(pending, blocks):
+    """Rows per table of pending rows and column blocks"""
+    counts = {table: len(rows) for table, rows in pending.items()}
+    for table, table_blocks in blocks.items():
+        counts[table] = counts.get(table, 0) + sum(block[1] for block in table_blocks)
+    return counts
+
+class BatchWriter:
+    """Buffer generated rows per table and write them in bulk"""
+
+    def __init__(self, db_connection, batch_size=5000, method='copy', rollups=True, metrics=None,
+                 spool=None):
+        if method not in WRITE_METHODS:
+            raise ValueError(f"Invalid write method: {method}. Use 'copy' or 'insert'")
+
+        self.db = db_connection
+        self.batch_size = max(1, int(batch_size))
+        self.method = method
+        
+        # Hourly/daily rollups are merged in the same transaction as the readings
+        self.rollups = RollupBuilder(db_connection) if rollups else None
+
+        # The latest reading of every device is upserted in the same transaction as well
+        self.latest = LatestValues(db_connection)
+
+        # PipelineMetrics receiving stage timings and rows per table (optional)
+        self.metrics = metrics
+
+        # Batches the database cannot take (down, or slower than SPOOL_WRITE_TIMEOUT_MS per
+        # statement) go to a local Spool instead of being lost; a SpoolDrainer replays them.
+        # Batches it rejects fail as without a spool
+        self.spool = spool
+        self.statement_timeout_ms = int(os.getenv('SPOOL_WRITE_TIMEOUT_MS', '30000')) if spool else 0
+
+        # Pending rows and column blocks per table, flushed together in one transaction
+        self.pending = {}
+        self.pending_blocks = {}
+        self.pending_count = 0
+
+        # Throughput statistics
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_spooled = 0
+        self.write_seconds = 0.0
+        self.last_error = None
+
+    def add(self, table, row):
+        """Queue one row; flushes automatically once batch_size rows are pending"""
+        self.pending.setdefault(table, []).append(row)
+        self.pending_count += 1
+
+        if self.pending_count >= self.batch_size:
+            return self.flush()
+        return True
+
+    def add_columns(self, table, columns, count):
+        """Queue a block of count rows given as column arrays keyed by column name
+        
+        Scalar values (e.g. a shared timestamp) are repeated on every row.
+        """
+        if count == 0:
+            return True
+
+        self.pending_blocks.setdefault(table, []).append(
+            ([columns[name] for name in TABLE_COLUMNS[table]], count, columns.get(GROUP_COLUMN))
+        )
+        self.pending_count += count
+
+        if self.pending_count >= self.batch_size:
+            return self.flush()
+        return True
+
+    def flush(self):
+        """Write all pending rows with one COPY/INSERT per table in a single transaction"""
+        if self.pending_count == 0:
+            return True
+
+        pending, blocks, count = self.pending, self.pending_blocks, self.pending_count
+        self.pending = {}
+        self.pending_blocks = {}
+        self.pending_count = 0
+
+        start = time.perf_counter()
+        try:
+            # While older rows wait in the spool, newer ones queue behind them so replay keeps
+            # every device's readings in order
+            if self.spool and (not self.spool.empty() or not self._connected()):
+                return self._spool(pending, blocks, count)
+            if self.statement_timeout_ms:
+                self.db.execute(f"SET LOCAL statement_timeout = {self.statement_timeout_ms}")
+            with self._stage('db_write'):
+                for table, rows in pending.items():
+                    columns = TABLE_COLUMNS[table]
+                    if self.method == 'copy':
+                        self.db.copy_rows(table, columns, rows)
+                    else:
+                        self.db.insert_rows(table, columns, rows, page_size=self.batch_size)
+                for table, table_blocks in blocks.items():
+                    columns = TABLE_COLUMNS[table]
+                    for values, block_count, groups in table_blocks:
+                        if self.method == 'copy':
+                            self.db.copy_columns(table, columns, values, block_count)
+                        else:
+                            self.db.insert_rows(table, columns, block_rows(values, block_count),
+                                                page_size=self.batch_size)
+            if self.rollups:
+                with self._stage('rollups'):
+                    self._write_rollups(pending, blocks)
+            with self._stage('latest'):
+                self._write_latest(pending, blocks)
+            with self._stage('commit'):
+                self.db.commit()
+            self.rows_written += count
+            if self.metrics:
+                self.metrics.count_rows('postgres', table_counts(pending, blocks))
+            return True
+        except Exception as e:
+            print(f"Error writing batch of {count} rows: {e}")
+            self.last_error = e
+            self.db.rollback()
+            if self.rollups:
+                self.rollups.discard()
+            self.latest.discard()
+            # Rows the database rejects (constraint or data errors) would fail again on replay
+            # and hold up every batch queued behind them, so only unavailability is spooled
+            if self.spool and isinstance(e, UNAVAILABLE_ERRORS):
+                return self._spool(pending, blocks, count)
+            self.rows_failed += count
+            if self.metrics:
+                self.metrics.count_rows('postgres', table_counts(pending, blocks), failed=True)
+            return False
+        finally:
+            self.write_seconds += time.perf_counter() - start
+
+    def _connected(self):
+        """Whether the connection is usable, reconnecting once if it was lost"""
+        if self.db.conn is not None and not self.db.conn.closed:
+            return True
+        return self.db.connect()
+
+    def _spool(self, pending, blocks, count):
+        """Append a batch the database could not take to the spool for later replay"""
+        records = [(table, list(zip(*rows)), len(rows), None) for table, rows in pending.items()]
+        records += [(table, values, block_count, groups)
+                    for table, table_blocks in blocks.items()
+                    for values, block_count, groups in table_blocks]
+
+        spooled = {}
+        try:
+            for table, values, block_count, groups in records:
+                self.spool.append(table, values, block_count, groups)
+                spooled[table] = spooled.get(table, 0) + block_count
+        except Exception as e:
+            print(f"Error spooling batch of {count} rows: {e}")
+
+        done = sum(spooled.values())
+        self.rows_spooled += done
+        self.rows_failed += count - done
+        if self.metrics:
+            self.metrics.count_rows('spool', spooled)
+            if done < count:
+                failed = {table: rows - spooled.get(table, 0)
+                          for table, rows in table_counts(pending, blocks).items()}
+                self.metrics.count_rows('postgres', failed, failed=True)
+        return done == count
+
+    def _stage(self, name):
+        """Time a stage of the flush when metrics are collected"""
+        return self.metrics.stage(name) if self.metrics else nullcontext()
+
+    def close(self):
+        """Write any pending rows"""
+        return self.flush()
+
+    def stats(self):
+        """Write counters of this sink"""
+        stats = {'rows_written': self.rows_written, 'rows_failed': self.rows_failed,
+                 'write_seconds': self.write_seconds}
+        if self.spool:
+            stats['rows_spooled'] = self.rows_spooled
+            stats.update({f"spool_{name}": value for name, value in self.spool.stats().items()})
+        return stats
+
+    def _write_rollups(self, pending, blocks):
+        """Fold the rows being flushed into the hourly/daily rollup tables"""
+        for table, rows in pending.items():
+            self.rollups.collect_rows(table, TABLE_COLUMNS[table], rows)
+        for table, table_blocks in blocks.items():
+            for values, block_count, groups in table_blocks:
+                self.rollups.collect(table, dict(zip(TABLE_COLUMNS[table], values)), block_count, groups)
+        self.rollups.write()
+
+    def _write_latest(self, pending, blocks):
+        """Upsert the newest row of every device being flushed into the latest tables"""
+        for table, rows in pending.items():
+            self.latest.collect_rows(table, TABLE_COLUMNS[table], rows)
+        for table, table_blocks in blocks.items():
+            for values, block_count, _ in table_blocks:
+                self.latest.collect(table, TABLE_COLUMNS[table], values, block_count)
+        self.latest.write()
+    
+    def rows_per_second(self):
+        """Average write throughput since the writer was created"""
+        if self.write_seconds <= 0:
+            return 0.0
+        return self.rows_written / self.write_seconds
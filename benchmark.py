@@ -0,0 +1,395 @@
+"""Measure generator throughput at fleet sizes from tens to a million devices
+
+For every fleet size the individual simulators and whole generate_cycle calls
+are timed in a fresh process, reporting generation time, write time, rows/sec,
+peak RSS and allocations. Writes go to an in-process fake database (COPY data
+is encoded but discarded) or, with --db postgres, to the configured database.
+
+Usage:
+    python benchmark.py [--sizes 10,1000,10000,100000,1000000] [--cycles 5]
+                        [--db fake|postgres] [--write-method copy] [--batch-size 5000]
+                        [--seed 42] [--fail-rate 0.05 --fail-error rejected|unavailable]
+                        [--output results.json]
+                        [--compare baseline.json] [--threshold 0.10]
+
+Save the results of one version with --output and run the next version with
+--compare: the run fails (exit status 1) when throughput drops by more than
+--threshold at any fleet size both runs measured.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import psycopg2
+
+from database import DatabaseConnection
+from device_registry import DeviceRegistry
+from main import SmartCityDataGenerator
+from provisioning import split_fleet
+from sim_clock import SimulatedClock
+
+DEFAULT_SIZES = '10,1000,10000,100000'
+
+# Fixed start of the simulated clock (fake database), so runs draw the same readings
+BENCHMARK_START = datetime(2024, 1, 1)
+
+# Simulator timings compared with --compare besides the cycle throughput
+SIMULATORS = ('weather', 'smart_poles', 'power_meters', 'flow_meters')
+
+# Errors the fake database raises with --fail-rate: a lost server (the connection is
+# closed, as psycopg2 does) or a batch the server rejects
+FAIL_ERRORS = {
+    'unavailable': psycopg2.OperationalError,
+    'rejected': psycopg2.IntegrityError
+}
+
+class FakeCursor:
+    """Cursor that accepts every statement and drains COPY data without storing it"""
+
+    def __init__(self, connection=None):
+        self.statements = 0
+        self.copied_bytes = 0
+        self.connection = connection
+
+    def execute(self, query, params=None):
+        self.statements += 1
+
+    def copy_expert(self, query, buffer):
+        self.statements += 1
+        if self.connection is not None:
+            self.connection.check()
+        self.copied_bytes += len(buffer.read())
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    """Connection that commits whatever its cursor accepted
+
+    With a fail_rate, that share of transactions fails at its first COPY with
+    fail_error. closed follows psycopg2: 0 while open, non-zero once lost or closed.
+    """
+
+    def __init__(self, fail_rate=0.0, fail_error='rejected', rng=None):
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.fail_rate = fail_rate
+        self.fail_error = fail_error
+        self.rng = rng or np.random.default_rng()
+        self.in_transaction = False
+
+    def check(self):
+        """Start the transaction on its first COPY, failing it at fail_rate"""
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        if self.in_transaction:
+            return
+        self.in_transaction = True
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            if self.fail_error == 'unavailable':
+                self.closed = 2
+            raise FAIL_ERRORS[self.fail_error](f"simulated {self.fail_error} error")
+
+    def commit(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.in_transaction = False
+        self.commits += 1
+
+    def rollback(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.in_transaction = False
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+class FakeDatabaseConnection(DatabaseConnection):
+    """In-process stand-in for PostgreSQL: every query and COPY runs against FakeCursor
+
+    Writes still go through BatchWriter, rollups and latest tables, so the
+    COPY encoding is measured; only the server's work is left out. fail_rate and
+    fail_error make that share of transactions fail, so the rollback, reconnect
+    and failed-row paths are measured too.
+    """
+
+    def __init__(self, fail_rate=0.0, fail_error='rejected', seed=None):
+        super().__init__()
+        self.fail_rate = fail_rate
+        self.fail_error = fail_error
+        self.rng = np.random.default_rng(seed)
+
+    def connect(self):
+        self.conn = FakeConnection(self.fail_rate, self.fail_error, self.rng)
+        self.cursor = FakeCursor(self.conn)
+        return True
+
+    def disconnect(self):
+        pass
+
+def peak_rss_bytes():
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def registry_fleet(generator, size):
+    """Load the first devices of the database's registry, split like a synthetic fleet of size"""
+    registry = DeviceRegistry(generator.db)
+    registry.load()
+    poles, power_meters, flow_meters = split_fleet(size)
+
+    pole_rows = registry.pole_rows()[:poles]
+    kept = {row[0] for row in pole_rows}
+    generator.pole_sim.load_fleet(pole_rows, [row for row in registry.module_rows() if row[0] in kept])
+    generator.power_meter_sim.load_fleet(registry.power_meter_rows()[:power_meters])
+    generator.flow_meter_sim.load_fleet(registry.flow_meter_rows()[:flow_meters])
+    return len(pole_rows) + min(power_meters, len(registry.power_meter_rows())) + \
+        min(flow_meters, len(registry.flow_meter_rows()))
+
+def create_generator(size, options):
+    """A generator with a fleet of about size devices writing to the benchmark's database
+
+    Returns (generator, devices loaded), or (None, 0) when the database is unavailable.
+    """
+    # Writes are measured without the local spool (not requested): a failed write counts as failed
+    generator = SmartCityDataGenerator(batch_size=options['batch_size'],
+                                       write_method=options['write_method'], seed=options['seed'])
+    if options['db'] == 'fake':
+        generator.db = FakeDatabaseConnection(options['fail_rate'], options['fail_error'], options['seed'])
+        generator.db.connect()
+        generator.writer = generator.create_sink('postgres', None, generator.db)
+        generator.initialize_offline(size)
+        devices = size
+        start = BENCHMARK_START
+    else:
+        if not generator.initialize():
+            return None, 0
+        devices = registry_fleet(generator, size)
+        # Readings go to the current day's partitions
+        start = datetime.now().replace(second=0, microsecond=0)
+        generator.partitions.ensure(start.date(), (start + timedelta(days=1)).date())
+
+    generator.set_clock(SimulatedClock(start))
+    return generator, devices
+
+def time_simulators(generator, cycles, step):
+    """Mean seconds per call of each simulator's vectorized generation"""
+    clock = generator.clock
+    timings = dict.fromkeys(SIMULATORS, 0.0)
+    for _ in range(cycles):
+        start = time.perf_counter()
+        weather = generator.weather_sim.generate_weather_data()
+        timings['weather'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        generator.pole_sim.generate_batch(weather)
+        timings['smart_poles'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        generator.power_meter_sim.generate_batch()
+        timings['power_meters'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        generator.flow_meter_sim.generate_batch()
+        timings['flow_meters'] += time.perf_counter() - start
+        clock.advance(step)
+    return {name: seconds / cycles for name, seconds in timings.items()}
+
+def time_cycles(generator, cycles, step):
+    """Run generate_cycle cycles times; returns (rows, total seconds, write seconds)"""
+    writer = generator.writer
+    rows_before, write_before = writer.rows_written, writer.write_seconds
+    start = time.perf_counter()
+    for _ in range(cycles):
+        generator.generate_cycle(verbose=False, refresh_devices=False)
+        generator.clock.advance(step)
+    elapsed = time.perf_counter() - start
+    return writer.rows_written - rows_before, elapsed, writer.write_seconds - write_before
+
+def trace_cycle(generator, step):
+    """Allocations of one generate_cycle: traced peak, net blocks and garbage collections"""
+    gc.collect()
+    collections_before = sum(stats['collections'] for stats in gc.get_stats())
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        generator.generate_cycle(verbose=False, refresh_devices=False)
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    generator.clock.advance(step)
+    return {
+        'traced_peak_bytes': traced_peak,
+        'retained_blocks': sys.getallocatedblocks() - blocks_before,
+        'gc_collections': sum(stats['collections'] for stats in gc.get_stats()) - collections_before
+    }
+
+def benchmark_size(size, options):
+    """Benchmark one fleet size (runs in its own process, so peak RSS is per size)"""
+    # The generator's progress messages would interleave with the results table
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        return measure_size(size, options)
+
+def measure_size(size, options):
+    """Timings, memory and allocations of one fleet size"""
+    generator, devices = create_generator(size, options)
+    if generator is None:
+        return {'devices': size, 'error': 'database unavailable'}
+    step = timedelta(seconds=options['step_seconds'])
+    try:
+        # Warm-up cycle: first-call allocations and caches are not measured
+        generator.generate_cycle(verbose=False, refresh_devices=False)
+        generator.clock.advance(step)
+
+        simulators = time_simulators(generator, options['cycles'], step)
+        rows, elapsed, write_seconds = time_cycles(generator, options['cycles'], step)
+        allocations = trace_cycle(generator, step)
+        failed = generator.writer.rows_failed
+    finally:
+        generator.cleanup()
+
+    return {
+        'devices': devices,
+        'cycles': options['cycles'],
+        'rows': rows,
+        'rows_per_cycle': rows // options['cycles'],
+        'rows_failed': failed,
+        'cycle_seconds': elapsed / options['cycles'],
+        'generation_seconds': (elapsed - write_seconds) / options['cycles'],
+        'write_seconds': write_seconds / options['cycles'],
+        'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0,
+        'simulator_seconds': simulators,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'allocations': allocations
+    }
+
+def git_revision():
+    """Commit of the working tree, when run from a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def compare(results, baseline, threshold):
+    """Print changes against a baseline run; returns the regressions found"""
+    regressions = []
+    previous = {str(entry['devices']): entry for entry in baseline.get('results', [])}
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'} ({baseline.get('created_at', '?')}):")
+    for entry in results:
+        before = previous.get(str(entry['devices']))
+        if before is None or 'error' in entry or 'error' in before:
+            continue
+        # Throughput: higher is better; simulator times: lower is better
+        checks = [('rows/sec', before['rows_per_sec'], entry['rows_per_sec'], True)]
+        checks += [(f"{name} s", before['simulator_seconds'][name], entry['simulator_seconds'][name], False)
+                   for name in SIMULATORS if name in before.get('simulator_seconds', {})]
+        for metric, old, new, higher_is_better in checks:
+            if old <= 0:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = 'REGRESSION' if worse > threshold else ''
+            print(f"  {entry['devices']:>9} {metric:<16} {old:>14.6g} -> {new:<14.6g} {change:+7.1%} {flag}")
+            if flag:
+                regressions.append((entry['devices'], metric, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma separated fleet sizes (devices)')
+    parser.add_argument('--cycles', type=int, default=5, help='Measured cycles per fleet size')
+    parser.add_argument('--db', choices=['fake', 'postgres'], default='fake',
+                        help='Write to an in-process fake database or the configured PostgreSQL')
+    parser.add_argument('--write-method', choices=['copy', 'insert'], default='copy')
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('BATCH_SIZE', '5000')))
+    parser.add_argument('--step-seconds', type=int, default=60, help='Simulated time between cycles')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='Share of transactions the fake database fails (default 0)')
+    parser.add_argument('--fail-error', choices=sorted(FAIL_ERRORS), default='rejected',
+                        help='Error failed transactions raise: rejected batch or lost server')
+    parser.add_argument('--output', help='Save the results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown reported as a regression (default 0.10)')
+    args = parser.parse_args()
+
+    if args.db == 'fake' and args.write_method == 'insert':
+        parser.error("--write-method insert needs --db postgres (the fake database only takes COPY)")
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    if not sizes or min(sizes) < 1 or args.cycles < 1:
+        parser.error("--sizes and --cycles must be positive")
+    if not 0 <= args.fail_rate <= 1:
+        parser.error("--fail-rate must be between 0 and 1")
+    if args.fail_rate and args.db != 'fake':
+        parser.error("--fail-rate needs --db fake")
+    options = {'db': args.db, 'write_method': args.write_method, 'batch_size': args.batch_size,
+               'step_seconds': args.step_seconds, 'seed': args.seed, 'cycles': args.cycles,
+               'fail_rate': args.fail_rate, 'fail_error': args.fail_error}
+
+    print(f"\n{'='*109}")
+    print(f"{'Devices':>9} {'Rows/cycle':>11} {'Gen (s)':>9} {'Write (s)':>10} {'Rows/sec':>12} "
+          f"{'Failed':>8} {'Peak RSS':>10} {'Traced':>10} {'Blocks':>9} {'GCs':>5}")
+    print(f"{'='*109}")
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        # A fresh process per size, so peak RSS and allocator state do not carry over
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            entry = executor.submit(benchmark_size, size, options).result()
+        results.append(entry)
+        if 'error' in entry:
+            print(f"{size:>9} {entry['error']}")
+            continue
+        allocations = entry['allocations']
+        print(f"{entry['devices']:>9} {entry['rows_per_cycle']:>11} {entry['generation_seconds']:>9.4f} "
+              f"{entry['write_seconds']:>10.4f} {entry['rows_per_sec']:>12,.0f} {entry['rows_failed']:>8} "
+              f"{entry['peak_rss_bytes'] / 2**20:>8.1f}MB {allocations['traced_peak_bytes'] / 2**20:>8.1f}MB "
+              f"{allocations['retained_blocks']:>9} {allocations['gc_collections']:>5}")
+    print(f"{'='*109}")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'options': options,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as stream:
+            json.dump(report, stream, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as stream:
+            regressions = compare(results, json.load(stream), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,71 @@
 import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+import numpy as np
+import asyncio
+import copy
+import io
 import os
 import re
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+def _copy_value(value):
+    """Format a single value for PostgreSQL COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, float) and value != value:
+        return '\\N'  # NaN is stored as NULL
+    text = str(value)
+    if '\\' in text or '\t' in text or '\n' in text or '\r' in text:
+        text = (text.replace('\\', '\\\\').replace('\t', '\\t')
+                    .replace('\n', '\\n').replace('\r', '\\r'))
+    return text
+
+def _copy_column(values, count):
+    """Format a column (numpy array, sequence or scalar) as COPY text values"""
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == 'f':
+            missing = np.isnan(values)
+            if not missing.any():
+                return list(map(str, values.tolist()))
+            # Only format the non-NULL entries (e.g. per-phase columns of 1-phase meters)
+            text = ['\\N'] * count
+            present = np.flatnonzero(~missing)
+            for index, value in zip(present.tolist(), map(str, values[present].tolist())):
+                text[index] = value
+            return text
+        if values.dtype.kind in 'iu':
+            return list(map(str, values.tolist()))
+        if values.dtype.kind == 'U':
+            # Fixed-width strings (e.g. generated IDs) only need escaping if a special character occurs
+            text = values.tolist()
+            joined = ''.join(text)
+            if '\\' in joined or '\t' in joined or '\n' in joined or '\r' in joined:
+                return [_copy_value(value) for value in text]
+            return text
+        return [_copy_value(value) for value in values.tolist()]
+    if isinstance(values, (list, tuple)):
+        return [_copy_value(value) for value in values]
+    return [_copy_value(values)] * count
+
+# NUMERIC as float instead of Decimal, for streamed exports
+NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, 'NUMERIC_AS_FLOAT',
+    lambda value, cursor: float(value) if value is not None else None
+)
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available within the checkout timeout"""
+
 class DatabaseConnection:
     """Handle database connections for smart city data"""
     
@@ -25,6 +85,13 @@ class DatabaseConnection:
         
         self.conn = None
         self.cursor = None
+        
+        # Pooled mode (see create_pool)
+        self.pool = None
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+        self.health_check_seconds = float(os.getenv('DB_POOL_HEALTH_CHECK_SECONDS', '30'))
+        self._pool_slots = None
+        self._last_used = {}
     
     def _parse_database_url(self, url):
         """Parse DATABASE_URL into connection parameters"""
@@ -40,16 +107,22 @@ class DatabaseConnection:
         else:
             raise ValueError("Invalid DATABASE_URL format")
     
+    def _connect_params(self):
+        """Keyword arguments for psycopg2.connect"""
+        return {
+            'host': self.host,
+            'port': self.port,
+            'database': self.database,
+            'user': self.user,
+            'password': self.password,
+            # Reconnect attempts (e.g. by the spool drainer) must not hang on an unreachable server
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '10'))
+        }
+    
     def connect(self):
         """Establish database connection"""
         try:
-            self.conn = psycopg2.connect(
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password
-            )
+            self.conn = psycopg2.connect(**self._connect_params())
             self.cursor = self.conn.cursor()
             print(f"Connected to database: {self.database}")
             return True
@@ -57,6 +130,100 @@ class DatabaseConnection:
             print(f"Error connecting to database: {e}")
             return False
     
+    def create_pool(self, min_size=None, max_size=None, timeout=None):
+        """Switch to pooled mode: keep min_size..max_size connections for connection()"""
+        min_size = min_size if min_size is not None else int(os.getenv('DB_POOL_MIN', '1'))
+        max_size = max_size if max_size is not None else int(os.getenv('DB_POOL_MAX', '10'))
+        if timeout is not None:
+            self.pool_timeout = timeout
+        try:
+            self.pool = ThreadedConnectionPool(min_size, max_size, **self._connect_params())
+            self._pool_slots = threading.BoundedSemaphore(max_size)
+            print(f"Connection pool ready: {self.database} ({min_size}-{max_size} connections)")
+            return True
+        except Exception as e:
+            print(f"Error creating connection pool: {e}")
+            return False
+    
+    def close_pool(self):
+        """Close every pooled connection"""
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
+            print("Connection pool closed")
+    
+    def _checkout(self):
+        """Get a healthy connection from the pool"""
+        while True:
+            conn = self.pool.getconn()
+            if not conn.closed and self._is_healthy(conn):
+                return conn
+            # Broken connection: drop it and let the pool open a new one
+            self.pool.putconn(conn, close=True)
+            self._last_used.pop(id(conn), None)
+    
+    def _is_healthy(self, conn):
+        """Ping connections that have been idle longer than health_check_seconds"""
+        if time.monotonic() - self._last_used.get(id(conn), 0.0) < self.health_check_seconds:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+    
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a pooled connection for one unit of work (e.g. one API request)
+        
+        Yields a DatabaseConnection bound to the borrowed connection. The work is
+        committed on success and rolled back on error or if a query failed, and
+        the connection is returned to the pool. Raises PoolTimeoutError if no
+        connection is free within the checkout timeout.
+        """
+        timeout = self.pool_timeout if timeout is None else timeout
+        if not self._pool_slots.acquire(timeout=timeout):
+            raise PoolTimeoutError(f"No database connection available within {timeout}s")
+        
+        conn = None
+        try:
+            conn = self._checkout()
+            session = copy.copy(self)
+            session.pool = None
+            session.conn = conn
+            session.cursor = conn.cursor()
+            try:
+                yield session
+                if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+                    conn.rollback()
+                else:
+                    conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                session.cursor.close()
+        finally:
+            if conn is not None:
+                self._last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn, close=bool(conn.closed))
+            self._pool_slots.release()
+    
+    def open_listener(self, channel):
+        """Open a dedicated autocommit connection that LISTENs on a NOTIFY channel"""
+        try:
+            conn = psycopg2.connect(**self._connect_params())
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {channel}")
+            return conn
+        except Exception as e:
+            print(f"Error listening on channel {channel}: {e}")
+            return None
+    
     def disconnect(self):
         """Close database connection"""
         if self.cursor:
@@ -102,3 +269,182 @@ class DatabaseConnection:
         except Exception as e:
             print(f"Error fetching data: {e}")
             return None
+    
+    def stream_rows(self, query, params=None, chunk_size=10000):
+        """Yield (cursor description, rows) chunks of a query from a server-side cursor
+        
+        Rows are fetched chunk_size at a time from a named cursor, so memory stays
+        flat whatever the size of the result; NUMERIC columns come back as floats.
+        At least one (possibly empty) chunk is yielded. Must run inside a
+        transaction (e.g. a pooled connection()); errors propagate.
+        """
+        cursor = self.conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        psycopg2.extensions.register_type(NUMERIC_AS_FLOAT, cursor)
+        try:
+            cursor.execute(query, params)
+            rows = cursor.fetchmany(chunk_size)
+            yield cursor.description, rows
+            while len(rows) == chunk_size:
+                rows = cursor.fetchmany(chunk_size)
+                if rows:
+                    yield cursor.description, rows
+        finally:
+            cursor.close()
+    
+    def execute(self, query, params=None):
+        """Execute a statement in the current transaction (caller commits, errors propagate)"""
+        self.cursor.execute(query, params)
+    
+    def copy_rows(self, table, columns, rows):
+        """Bulk load rows into a table with COPY (caller commits)"""
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join([_copy_value(value) for value in row]))
+            buffer.write('\n')
+        buffer.seek(0)
+        query = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+        self.cursor.copy_expert(query, buffer)
+    
+    def copy_columns(self, table, columns, values, count):
+        """Bulk load column arrays into a table with COPY (caller commits)
+        
+        values holds one entry per column: a numpy array or sequence of length
+        count, or a scalar repeated on every row. NaN floats are written as NULL.
+        """
+        text_columns = [_copy_column(column, count) for column in values]
+        buffer = io.StringIO()
+        buffer.write('\n'.join(map('\t'.join, zip(*text_columns))))
+        buffer.write('\n')
+        buffer.seek(0)
+        query = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+        self.cursor.copy_expert(query, buffer)
+    
+    def insert_rows(self, table, columns, rows, page_size=1000):
+        """Insert rows with multi-row INSERT statements (caller commits)"""
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s"
+        execute_values(self.cursor, query, rows, page_size=page_size)
+    
+    def commit(self):
+        """Commit the current transaction"""
+        self.conn.commit()
+    
+    def rollback(self):
+        """Roll back the current transaction (nothing to do if the connection was lost)"""
+        if self.conn and not self.conn.closed:
+            self.conn.rollback()
+
+class AsyncDatabaseConnection:
+    """Awaitable facade over a pooled DatabaseConnection
+    
+    Blocking psycopg2 calls run on a bounded thread pool so they never block the
+    event loop. Checkouts wait for a free connection on the event loop, so a
+    request waiting for the pool never holds a thread that a request holding a
+    connection needs to finish its queries and return it. Heavy queries (time ranges, aggregates) use a separate lane that
+    may hold at most heavy_limit connections, keeping the rest of the pool free
+    for fast lookups.
+    """
+    
+    def __init__(self, db_connection, max_workers=None, heavy_limit=None):
+        self.db = db_connection
+        self.max_workers = max_workers or int(os.getenv('DB_POOL_MAX', '10'))
+        self.heavy_limit = heavy_limit or int(
+            os.getenv('DB_HEAVY_QUERY_LIMIT', str(max(1, self.max_workers // 2)))
+        )
+        self.executor = None
+        self.heavy_slots = None
+        self.checkout_slots = None
+    
+    def start(self):
+        """Create the worker threads and the connection pool"""
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='db')
+        self.heavy_slots = asyncio.Semaphore(self.heavy_limit)
+        self.checkout_slots = asyncio.Semaphore(self.max_workers)
+        return self.db.create_pool(max_size=self.max_workers)
+    
+    def stop(self):
+        """Close the connection pool and the worker threads"""
+        self.db.close_pool()
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+    
+    async def run(self, func, *args):
+        """Run a blocking call on the database thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+    
+    @asynccontextmanager
+    async def connection(self, heavy=False, timeout=None):
+        """Borrow a pooled connection without blocking the event loop"""
+        if heavy:
+            async with self.heavy_slots:
+                async with self._connection(timeout) as session:
+                    yield session
+        else:
+            async with self._connection(timeout) as session:
+                yield session
+    
+    @asynccontextmanager
+    async def _connection(self, timeout):
+        timeout = self.db.pool_timeout if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self.checkout_slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError(f"No database connection available within {timeout}s")
+        try:
+            context = self.db.connection(timeout)
+            session = await self.run(context.__enter__)
+            try:
+                yield AsyncSession(session, self)
+            except BaseException as e:
+                if not await self.run(context.__exit__, type(e), e, e.__traceback__):
+                    raise
+            else:
+                await self.run(context.__exit__, None, None, None)
+        finally:
+            self.checkout_slots.release()
+
+class AsyncSession:
+    """A borrowed connection whose queries are awaited"""
+    
+    def __init__(self, session, async_db):
+        self.session = session
+        self.async_db = async_db
+    
+    async def execute_query(self, query, params=None):
+        """Execute a query"""
+        return await self.async_db.run(self.session.execute_query, query, params)
+    
+    async def fetch_all(self, query, params=None):
+        """Fetch all results from a query"""
+        return await self.async_db.run(self.session.fetch_all, query, params)
+    
+    async def fetch_one(self, query, params=None):
+        """Fetch one result from a query"""
+        return await self.async_db.run(self.session.fetch_one, query, params)
+    
+    async def commit(self):
+        """Commit the work so far (the rest is committed when the connection is returned)"""
+        return await self.async_db.run(self.session.commit)
+    
+    async def run(self, func, *args):
+        """Run func(session, *args) on the database thread pool, e.g. several statements in a row"""
+        return await self.async_db.run(func, self.session, *args)
+    
+    async def stream(self, query, params=None, chunk_size=10000, encode=None):
+        """Async iterate the chunks of stream_rows, optionally passed through encode
+        
+        encode turns the (description, rows) chunks into another iterator (e.g. of
+        bytes); fetching and encoding both run on the database thread pool.
+        """
+        chunks = self.session.stream_rows(query, params, chunk_size)
+        if encode:
+            chunks = encode(chunks)
+        try:
+            while True:
+                chunk = await self.async_db.run(next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            await self.async_db.run(chunks.close)
@@ -0,0 +1,175 @@
+import json
+import time
+
+# NOTIFY channel used by the device triggers in init.sql
+CHANNEL = 'device_registry'
+
+# Device class refreshed when a table changes
+TABLE_CLASSES = {
+    'smart_poles': 'poles',
+    'smart_pole_modules': 'poles',
+    'power_meters': 'power_meters',
+    'flow_meters': 'flow_meters'
+}
+
+DEVICE_CLASSES = ('poles', 'power_meters', 'flow_meters')
+
+class DeviceRegistry:
+    """In-process snapshot of the device fleet, refreshed by LISTEN/NOTIFY"""
+
+    def __init__(self, db_connection, reload_seconds=300):
+        self.db = db_connection
+
+        # Snapshots keyed by device ID
+        self.poles = {}          # pole_id -> (pole_id, status)
+        self.modules = {}        # pole_id -> [(pole_id, module_type, power_rating_w), ...]
+        self.power_meters = {}   # meter_id -> (meter_id, meter_type, room_name, status)
+        self.flow_meters = {}    # meter_id -> (meter_id, meter_type, flow_unit, max_flow_rate, status)
+
+        # Device classes changed since the last poll
+        self.changed = set()
+
+        # Without a listener the snapshot is reloaded in full every reload_seconds
+        self.listener = None
+        self.reload_seconds = reload_seconds
+        self.loaded_at = 0.0
+
+    def load(self):
+        """Load the whole device fleet with one bulk query per table"""
+        self.poles = {row[0]: (row[0], row[1]) for row in self.db.fetch_all(
+            "SELECT pole_id, status FROM smart_poles"
+        )}
+        self.modules = {}
+        self._load_modules(self.db.fetch_all("""
+            SELECT pole_id, module_type, power_rating_w
+            FROM smart_pole_modules
+            WHERE status = 'active'
+        """))
+        self.power_meters = {row[0]: tuple(row) for row in self.db.fetch_all(
+            "SELECT meter_id, meter_type, room_name, status FROM power_meters"
+        )}
+        self.flow_meters = {row[0]: tuple(row) for row in self.db.fetch_all(
+            "SELECT meter_id, meter_type, flow_unit, max_flow_rate, status FROM flow_meters"
+        )}
+
+        self.changed.update(DEVICE_CLASSES)
+        self.loaded_at = time.monotonic()
+        print(f"Device registry loaded: {len(self.poles)} poles, "
+              f"{len(self.power_meters)} power meters, {len(self.flow_meters)} flow meters")
+
+    def _load_modules(self, rows):
+        """Group module rows by pole"""
+        for pole_id, module_type, power_rating in rows:
+            self.modules.setdefault(pole_id, []).append((pole_id, module_type, power_rating))
+
+    def listen(self):
+        """Subscribe to device change notifications"""
+        self.listener = self.db.open_listener(CHANNEL)
+        return self.listener is not None
+
+    def poll(self):
+        """Apply pending change notifications and return the device classes that changed"""
+        if self.listener is None:
+            if time.monotonic() - self.loaded_at >= self.reload_seconds:
+                self.load()
+        else:
+            try:
+                self.listener.poll()
+            except Exception as e:
+                # Notifications may have been missed, so resubscribe and reload everything
+                print(f"Device registry listener lost: {e}")
+                self.listener = None
+                self.listen()
+                self.load()
+            else:
+                self._apply_notifications()
+
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def _apply_notifications(self):
+        """Refetch the devices named by queued notifications, one query per table"""
+        pending = {}
+        reload_all = False
+
+        while self.listener.notifies:
+            notify = self.listener.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+            except ValueError:
+                continue
+            if payload.get('op') == 'reload':
+                reload_all = True
+            elif payload.get('table') in TABLE_CLASSES:
+                pending.setdefault(payload['table'], set()).add(payload['id'])
+
+        if reload_all:
+            self.load()
+            return
+
+        for table, device_ids in pending.items():
+            self._refresh(table, list(device_ids))
+            self.changed.add(TABLE_CLASSES[table])
+
+    def _refresh(self, table, device_ids):
+        """Reload the given devices of one table; missing ones were deleted"""
+        if table == 'smart_poles':
+            rows = self.db.fetch_all(
+                "SELECT pole_id, status FROM smart_poles WHERE pole_id = ANY(%s)", (device_ids,)
+            )
+            self._replace(self.poles, device_ids, {row[0]: (row[0], row[1]) for row in rows})
+
+        elif table == 'smart_pole_modules':
+            for pole_id in device_ids:
+                self.modules.pop(pole_id, None)
+            self._load_modules(self.db.fetch_all("""
+                SELECT pole_id, module_type, power_rating_w
+                FROM smart_pole_modules
+                WHERE status = 'active' AND pole_id = ANY(%s)
+            """, (device_ids,)))
+
+        elif table == 'power_meters':
+            rows = self.db.fetch_all("""
+                SELECT meter_id, meter_type, room_name, status
+                FROM power_meters
+                WHERE meter_id = ANY(%s)
+            """, (device_ids,))
+            self._replace(self.power_meters, device_ids, {row[0]: tuple(row) for row in rows})
+
+        elif table == 'flow_meters':
+            rows = self.db.fetch_all("""
+                SELECT meter_id, meter_type, flow_unit, max_flow_rate, status
+                FROM flow_meters
+                WHERE meter_id = ANY(%s)
+            """, (device_ids,))
+            self._replace(self.flow_meters, device_ids, {row[0]: tuple(row) for row in rows})
+
+    def _replace(self, snapshot, device_ids, rows):
+        """Update snapshot entries for device_ids from freshly fetched rows"""
+        for device_id in device_ids:
+            if device_id in rows:
+                snapshot[device_id] = rows[device_id]
+            else:
+                snapshot.pop(device_id, None)
+
+    def pole_rows(self):
+        """(pole_id, status) rows of every pole, ordered by ID"""
+        return [self.poles[pole_id] for pole_id in sorted(self.poles)]
+
+    def module_rows(self):
+        """(pole_id, module_type, power_rating_w) rows of every active module"""
+        return [module for modules in self.modules.values() for module in modules]
+
+    def power_meter_rows(self):
+        """(meter_id, meter_type, room_name) rows of active power meters, ordered by ID"""
+        return [row[:3] for meter_id, row in sorted(self.power_meters.items()) if row[3] == 'active']
+
+    def flow_meter_rows(self):
+        """(meter_id, meter_type, flow_unit, max_flow_rate) rows of active flow meters, ordered by ID"""
+        return [row[:4] for meter_id, row in sorted(self.flow_meters.items()) if row[4] == 'active']
+
+    def close(self):
+        """Close the listener connection"""
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
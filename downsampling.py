@@ -0,0 +1,36 @@
+import numpy as np
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling
+
+    x must be sorted ascending. The first and last points are always kept; the
+    points between them are split into threshold - 2 buckets and each bucket keeps
+    the point forming the largest triangle with the previously kept point and the
+    average of the next bucket. Returns every index when there is nothing to drop.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    # Bucket boundaries over the interior points [1, count - 1)
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+
+    # Bucket averages from cumulative sums, shifted so bucket i sees bucket i + 1 (the last sees the final point)
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = np.diff(edges)
+    next_x = np.append(((cum_x[edges[1:]] - cum_x[edges[:-1]]) / sizes)[1:], x[-1])
+    next_y = np.append(((cum_y[edges[1:]] - cum_y[edges[:-1]]) / sizes)[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    anchor = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        ax, ay = x[anchor], y[anchor]
+        area = np.abs((ax - next_x[bucket]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[bucket] - ay))
+        anchor = lo + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+    return selected
@@ -8,7 +8,7 @@ SELECT
     MAX(power_consumption_w) as max_power_w,
     COUNT(*) as sample_count
 FROM smart_pole_energy
-WHERE timestamp >= NOW() - INTERVAL '1 hour'
+WHERE timestamp >= LOCALTIMESTAMP - INTERVAL '1 hour'
 GROUP BY pole_id
 ORDER BY avg_power_w DESC;
 
@@ -18,7 +18,7 @@ SELECT
     SUM(energy_kwh) as total_energy_kwh,
     AVG(power_consumption_w) as avg_power_w
 FROM smart_pole_energy
-WHERE timestamp >= NOW() - INTERVAL '24 hours'
+WHERE timestamp >= LOCALTIMESTAMP - INTERVAL '24 hours'
 GROUP BY hour
 ORDER BY hour DESC;
 
@@ -30,7 +30,7 @@ SELECT
     MIN(timestamp) as first_seen,
     MAX(timestamp) as last_seen
 FROM smart_pole_energy
-WHERE timestamp >= NOW() - INTERVAL '1 hour'
+WHERE timestamp >= LOCALTIMESTAMP - INTERVAL '1 hour'
 GROUP BY pole_id, status
 ORDER BY pole_id, status;
 
@@ -44,7 +44,7 @@ SELECT
 FROM weather_station ws
 LEFT JOIN smart_pole_energy spe 
     ON DATE_TRUNC('minute', ws.timestamp) = DATE_TRUNC('minute', spe.timestamp)
-WHERE ws.timestamp >= NOW() - INTERVAL '1 hour'
+WHERE ws.timestamp >= LOCALTIMESTAMP - INTERVAL '1 hour'
 GROUP BY time_minute, ws.temperature_c, ws.humidity_percent, ws.light_intensity_lux
 ORDER BY time_minute DESC;
 
@@ -71,7 +71,7 @@ WITH pole_power AS (
             FROM smart_pole_energy spe
             WHERE spe.pole_id = sp.pole_id 
                 AND spe.status = 'on'
-                AND spe.timestamp >= NOW() - INTERVAL '1 hour'
+                AND spe.timestamp >= LOCALTIMESTAMP - INTERVAL '1 hour'
         ) as avg_actual_power_w
     FROM smart_poles sp
     LEFT JOIN smart_pole_modules spm ON sp.pole_id = spm.pole_id
@@ -89,19 +89,14 @@ SELECT
 FROM pole_power
 ORDER BY pole_id;
 
--- 7. Latest readings for all systems
+-- 7. Latest readings for all systems (from the *_latest tables, one row per device)
 SELECT 
     'Smart Pole' as system_type,
     pole_id as identifier,
     timestamp,
     power_consumption_w::text || 'W' as value,
     status
-FROM smart_pole_energy
-WHERE (pole_id, timestamp) IN (
-    SELECT pole_id, MAX(timestamp)
-    FROM smart_pole_energy
-    GROUP BY pole_id
-)
+FROM smart_pole_energy_latest
 UNION ALL
 SELECT 
     'Weather Station' as system_type,
@@ -109,8 +104,7 @@ SELECT
     timestamp,
     temperature_c::text || '°C, ' || humidity_percent::text || '%, ' || light_intensity_lux::text || ' lux' as value,
     'active' as status
-FROM weather_station
-WHERE timestamp = (SELECT MAX(timestamp) FROM weather_station)
+FROM weather_station_latest
 ORDER BY system_type, identifier;
 
 -- 8. Energy cost estimation (assuming 4 THB per kWh)
@@ -122,7 +116,7 @@ SELECT
     MIN(timestamp) as period_start,
     MAX(timestamp) as period_end
 FROM smart_pole_energy
-WHERE timestamp >= NOW() - INTERVAL '24 hours'
+WHERE timestamp >= LOCALTIMESTAMP - INTERVAL '24 hours'
 GROUP BY pole_id
 ORDER BY total_energy_kwh DESC;
 
@@ -146,6 +140,6 @@ SELECT
     AVG(wind_speed_ms) as avg_wind_speed_ms,
     COUNT(*) as sample_count
 FROM weather_station
-WHERE timestamp >= NOW() - INTERVAL '7 days'
+WHERE timestamp >= LOCALTIMESTAMP - INTERVAL '7 days'
 GROUP BY hour_of_day
 ORDER BY hour_of_day;
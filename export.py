@@ -0,0 +1,123 @@
+from datetime import date, datetime
+from rollups import ROLLUP_METRICS
+import pyarrow as pa
+import csv
+import io
+import json
+import os
+import zlib
+
+# Exportable reading tables and their device ID column
+EXPORT_TABLES = {table: device_column for table, (device_column, _) in ROLLUP_METRICS.items()}
+
+# Format -> (media type, file extension, supported compressions)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv', ('none', 'gzip')),
+    'ndjson': ('application/x-ndjson', 'ndjson', ('none', 'gzip')),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows', ('none', 'lz4', 'zstd'))
+}
+
+# Rows fetched from the server-side cursor and encoded per chunk
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '10000'))
+
+# PostgreSQL type OIDs -> Arrow types (anything else is exported as a string)
+ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(), 21: pa.int64(), 23: pa.int64(),
+    700: pa.float64(), 701: pa.float64(), 1700: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp('us'),
+    1184: pa.timestamp('us', tz='UTC')
+}
+
+def export_query(table, start=None, end=None, device_ids=None):
+    """SELECT over one reading table in [start, end), optionally limited to some devices
+
+    Rows come in partition (day) order without a global sort, so the first
+    rows stream out as soon as the scan starts.
+    """
+    conditions, params = [], []
+    if start:
+        conditions.append("timestamp >= %s")
+        params.append(start)
+    if end:
+        conditions.append("timestamp < %s")
+        params.append(end)
+    if device_ids:
+        conditions.append(f"{EXPORT_TABLES[table]} = ANY(%s)")
+        params.append(list(device_ids))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT * FROM {table} {where}", params
+
+def _json_value(value):
+    """JSON encoding of values json does not handle natively"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def csv_chunks(chunks):
+    """Encode (description, rows) chunks as CSV with a header row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header = True
+    for description, rows in chunks:
+        if header:
+            writer.writerow([column.name for column in description])
+            header = False
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+def ndjson_chunks(chunks):
+    """Encode (description, rows) chunks as one JSON object per line"""
+    for description, rows in chunks:
+        names = [column.name for column in description]
+        yield ''.join(
+            json.dumps(dict(zip(names, row)), default=_json_value, separators=(',', ':')) + '\n'
+            for row in rows
+        ).encode()
+
+def arrow_chunks(chunks, compression=None):
+    """Encode (description, rows) chunks as an Arrow IPC stream, one record batch per chunk"""
+    sink = io.BytesIO()
+    writer = None
+    for description, rows in chunks:
+        if writer is None:
+            schema = pa.schema([(column.name, ARROW_TYPES.get(column.type_code, pa.string()))
+                                for column in description])
+            writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+        columns = list(zip(*rows)) if rows else [()] * len(schema)
+        arrays = [
+            pa.array(values if field.type != pa.string() else
+                     [None if value is None else str(value) for value in values], type=field.type)
+            for field, values in zip(schema, columns)
+        ]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield _drain(sink)
+    if writer is not None:
+        writer.close()
+        yield _drain(sink)
+
+def _drain(sink):
+    """Take the bytes written to a BytesIO so far and empty it"""
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a byte stream, flushing after each chunk so the client receives it right away"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def encoder(export_format, compression='none'):
+    """Function turning (description, rows) chunks into encoded, compressed byte chunks"""
+    def encode(chunks):
+        if export_format == 'arrow':
+            return arrow_chunks(chunks, None if compression == 'none' else compression)
+        encoded = csv_chunks(chunks) if export_format == 'csv' else ndjson_chunks(chunks)
+        return gzip_chunks(encoded) if compression == 'gzip' else encoded
+    return encode
@@ -1,43 +1,89 @@
-import random
-from datetime import datetime
-import math
+import numpy as np
+from sim_clock import SystemClock
+from random_streams import RandomStreams
 
 class FlowMeterSimulator:
     """Simulate realistic flow meter readings for various fluid types"""
     
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, clock=None, streams=None):
         self.db = db_connection
+        self.clock = clock or SystemClock()
+        self.streams = streams or RandomStreams()
         
-        # Flow patterns for different meter types and times
+        # Flow patterns and fluid properties for different meter types
         self.flow_patterns = {
             'water': {
                 'base_flow': 10.0,      # L/min
                 'peak_flow': 50.0,      # L/min
                 'variation': 0.3,
-                'night_factor': 0.1
+                'night_factor': 0.1,
+                'rate_period_s': 60,    # flow is per minute
+                'temperature_range': (15, 30),
+                'pressure_range': (2.0, 4.0),
+                'density_range': None   # Not applicable for volumetric water meters
             },
             'gas': {
                 'base_flow': 2.0,       # m3/h
                 'peak_flow': 15.0,      # m3/h
                 'variation': 0.35,
-                'night_factor': 0.05
+                'night_factor': 0.05,
+                'rate_period_s': 3600,  # flow is per hour
+                'temperature_range': (20, 25),
+                'pressure_range': (0.5, 2.0),
+                'density_range': None
             },
             'steam': {
                 'base_flow': 50.0,      # kg/h
                 'peak_flow': 400.0,     # kg/h
                 'variation': 0.25,
-                'night_factor': 0.2
+                'night_factor': 0.2,
+                'rate_period_s': 3600,  # mass flow per hour (total is mass in kg)
+                'temperature_range': (150, 180),  # Saturated steam
+                'pressure_range': (5.0, 10.0),
+                'density_range': (3.0, 5.0)       # kg/m3 at steam conditions
             },
             'air': {
                 'base_flow': 2.0,       # m3/min
                 'peak_flow': 20.0,      # m3/min
                 'variation': 0.4,
-                'night_factor': 0.1
+                'night_factor': 0.1,
+                'rate_period_s': 60,    # flow is per minute
+                'temperature_range': (25, 40),
+                'pressure_range': (6.0, 8.0),     # Typical compressed air pressure
+                'density_range': None
             }
         }
+        self.meter_types = list(self.flow_patterns)
+        self.params = self._compile_patterns()
         
-        # Running totals (in-memory, would be better to store in DB)
-        self.total_volumes = {}
+        # Compiled column arrays of active meters and their totalizers (see load_fleet)
+        self.fleet = None
+        self.totals = np.zeros(0, dtype=np.float64)
+        self.index = {}
+        
+        # Seconds between readings, used to accumulate the totalizers
+        self.interval_seconds = 60
+    
+    def _compile_patterns(self):
+        """Build per-type parameter arrays indexed by position in meter_types"""
+        patterns = [self.flow_patterns[t] for t in self.meter_types]
+        
+        def column(getter):
+            return np.array([getter(p) for p in patterns], dtype=np.float64)
+        
+        return {
+            'base_flow': column(lambda p: p['base_flow']),
+            'peak_flow': column(lambda p: p['peak_flow']),
+            'variation': column(lambda p: p['variation']),
+            'rate_period_s': column(lambda p: p['rate_period_s']),
+            'temperature_low': column(lambda p: p['temperature_range'][0]),
+            'temperature_high': column(lambda p: p['temperature_range'][1]),
+            'pressure_low': column(lambda p: p['pressure_range'][0]),
+            'pressure_high': column(lambda p: p['pressure_range'][1]),
+            'has_density': np.array([p['density_range'] is not None for p in patterns]),
+            'density_low': column(lambda p: p['density_range'][0] if p['density_range'] else 0.0),
+            'density_high': column(lambda p: p['density_range'][1] if p['density_range'] else 0.0)
+        }
     
     def get_meter_info(self, meter_id):
         """Get flow meter information"""
@@ -65,7 +111,7 @@ class FlowMeterSimulator:
     
     def get_time_factor(self, meter_type):
         """Get time-based factor for flow rate"""
-        hour = datetime.now().hour
+        hour = self.clock.now().hour
         
         if meter_type == 'water':
             # Water usage peaks in morning (6-9) and evening (17-21)
@@ -105,168 +151,120 @@ class FlowMeterSimulator:
         
         return 0.5  # Default
     
-    def get_last_total_volume(self, meter_id):
-        """Get last recorded total volume from database"""
+    def get_last_total_volumes(self, meter_ids):
+        """Get last recorded total volume of each meter from database in one query"""
+        if not meter_ids or self.db is None:
+            return {}
         query = """
-            SELECT total_volume 
-            FROM flow_meter_readings 
-            WHERE meter_id = %s 
-            ORDER BY timestamp DESC 
-            LIMIT 1
+            SELECT meter_id, total_volume
+            FROM flow_meter_readings_latest
+            WHERE meter_id = ANY(%s)
         """
-        result = self.db.fetch_one(query, (meter_id,))
-        if result:
-            return float(result[0])
-        return 0.0
+        results = self.db.fetch_all(query, (list(meter_ids),))
+        return {row[0]: float(row[1]) for row in results}
     
-    def generate_water_reading(self, meter_id, meter_info):
-        """Generate water flow meter reading"""
-        pattern = self.flow_patterns['water']
-        time_factor = self.get_time_factor('water')
-        
-        # Calculate flow rate
-        base_flow = pattern['base_flow'] + (pattern['peak_flow'] - pattern['base_flow']) * time_factor
-        variation = random.uniform(1 - pattern['variation'], 1 + pattern['variation'])
-        flow_rate = base_flow * variation
-        
-        # Ensure within meter's max capacity
-        if meter_info['max_flow_rate']:
-            flow_rate = min(flow_rate, meter_info['max_flow_rate'])
-        
-        # Calculate total volume (accumulate over time)
-        # Assuming readings every minute, convert L/min to total L
-        if meter_id not in self.total_volumes:
-            self.total_volumes[meter_id] = self.get_last_total_volume(meter_id)
-        
-        # Add flow for 1 minute interval
-        volume_increment = flow_rate * 1.0  # 1 minute
-        self.total_volumes[meter_id] += volume_increment
-        
-        # Water properties
-        temperature_c = random.uniform(15, 30)
-        pressure_bar = random.uniform(2.0, 4.0)
-        
+    def compile_fleet(self, rows):
+        """Compile (meter_id, meter_type, flow_unit, max_flow_rate) rows into column arrays"""
+        rows = [row for row in rows if row[1] in self.flow_patterns]
         return {
-            'flow_rate': round(flow_rate, 3),
-            'total_volume': round(self.total_volumes[meter_id], 3),
-            'temperature_c': round(temperature_c, 2),
-            'pressure_bar': round(pressure_bar, 2),
-            'density': None  # Not applicable for volumetric water meters
+            'meter_id': np.array([row[0] for row in rows], dtype=object),
+            'meter_type': np.array([row[1] for row in rows], dtype=object),
+            'stream_key': self.streams.device_keys([row[0] for row in rows]),
+            'flow_unit': np.array([row[2] for row in rows], dtype=object),
+            'type_index': np.array([self.meter_types.index(row[1]) for row in rows], dtype=np.intp),
+            # Meters without a rated capacity are not clamped
+            'max_flow_rate': np.array(
+                [float(row[3]) if row[3] else np.inf for row in rows], dtype=np.float64
+            )
         }
     
-    def generate_gas_reading(self, meter_id, meter_info):
-        """Generate gas flow meter reading"""
-        pattern = self.flow_patterns['gas']
-        time_factor = self.get_time_factor('gas')
-        
-        # Calculate flow rate
-        base_flow = pattern['base_flow'] + (pattern['peak_flow'] - pattern['base_flow']) * time_factor
-        variation = random.uniform(1 - pattern['variation'], 1 + pattern['variation'])
-        flow_rate = base_flow * variation
-        
-        if meter_info['max_flow_rate']:
-            flow_rate = min(flow_rate, meter_info['max_flow_rate'])
-        
-        # Calculate total volume (m3/h to m3, for 1 minute = 1/60 hour)
-        if meter_id not in self.total_volumes:
-            self.total_volumes[meter_id] = self.get_last_total_volume(meter_id)
+    def load_fleet(self, rows=None):
+        """Load all active meters once and compile them for vectorized generation
         
-        volume_increment = flow_rate / 60.0  # Convert m3/h to m3/min
-        self.total_volumes[meter_id] += volume_increment
-        
-        # Gas properties
-        temperature_c = random.uniform(20, 25)
-        pressure_bar = random.uniform(0.5, 2.0)
-        
-        return {
-            'flow_rate': round(flow_rate, 3),
-            'total_volume': round(self.total_volumes[meter_id], 3),
-            'temperature_c': round(temperature_c, 2),
-            'pressure_bar': round(pressure_bar, 2),
-            'density': None
-        }
-    
-    def generate_steam_reading(self, meter_id, meter_info):
-        """Generate steam flow meter reading (mass flow)"""
-        pattern = self.flow_patterns['steam']
-        time_factor = self.get_time_factor('steam')
-        
-        # Calculate flow rate (kg/h)
-        base_flow = pattern['base_flow'] + (pattern['peak_flow'] - pattern['base_flow']) * time_factor
-        variation = random.uniform(1 - pattern['variation'], 1 + pattern['variation'])
-        flow_rate = base_flow * variation
-        
-        if meter_info['max_flow_rate']:
-            flow_rate = min(flow_rate, meter_info['max_flow_rate'])
-        
-        # Calculate total mass (kg/h to kg, for 1 minute = 1/60 hour)
-        if meter_id not in self.total_volumes:
-            self.total_volumes[meter_id] = self.get_last_total_volume(meter_id)
-        
-        mass_increment = flow_rate / 60.0
-        self.total_volumes[meter_id] += mass_increment
-        
-        # Steam properties
-        temperature_c = random.uniform(150, 180)  # Saturated steam
-        pressure_bar = random.uniform(5.0, 10.0)
-        density = random.uniform(3.0, 5.0)  # kg/m3 at steam conditions
-        
-        return {
-            'flow_rate': round(flow_rate, 3),
-            'total_volume': round(self.total_volumes[meter_id], 3),  # Actually total mass
-            'temperature_c': round(temperature_c, 2),
-            'pressure_bar': round(pressure_bar, 2),
-            'density': round(density, 3)
-        }
+        Totalizers of meters already loaded are carried over; new meters resume
+        from their last recorded total volume.
+        """
+        if rows is None:
+            query = """
+                SELECT meter_id, meter_type, flow_unit, max_flow_rate
+                FROM flow_meters
+                WHERE status = 'active'
+                ORDER BY meter_id
+            """
+            rows = self.db.fetch_all(query)
+        
+        fleet = self.compile_fleet(rows)
+        meter_ids = fleet['meter_id'].tolist()
+        
+        previous = {meter_id: self.totals[i] for meter_id, i in self.index.items()}
+        new_ids = [meter_id for meter_id in meter_ids if meter_id not in previous]
+        previous.update(self.get_last_total_volumes(new_ids))
+        
+        self.fleet = fleet
+        self.totals = np.array([previous.get(m, 0.0) for m in meter_ids], dtype=np.float64)
+        self.index = {meter_id: i for i, meter_id in enumerate(meter_ids)}
+        return len(meter_ids)
     
-    def generate_air_reading(self, meter_id, meter_info):
-        """Generate compressed air flow meter reading"""
-        pattern = self.flow_patterns['air']
-        time_factor = self.get_time_factor('air')
-        
-        # Calculate flow rate (m3/min)
-        base_flow = pattern['base_flow'] + (pattern['peak_flow'] - pattern['base_flow']) * time_factor
-        variation = random.uniform(1 - pattern['variation'], 1 + pattern['variation'])
-        flow_rate = base_flow * variation
-        
-        if meter_info['max_flow_rate']:
-            flow_rate = min(flow_rate, meter_info['max_flow_rate'])
+    def generate_batch(self, index=None, interval_seconds=None):
+        """Generate one tick of readings for the fleet (or the given positions) as column arrays
         
-        # Calculate total volume
-        if meter_id not in self.total_volumes:
-            self.total_volumes[meter_id] = self.get_last_total_volume(meter_id)
-        
-        volume_increment = flow_rate * 1.0  # 1 minute
-        self.total_volumes[meter_id] += volume_increment
-        
-        # Compressed air properties
-        temperature_c = random.uniform(25, 40)
-        pressure_bar = random.uniform(6.0, 8.0)  # Typical compressed air pressure
+        interval_seconds overrides the totalizer interval for meters reporting at their own rate.
+        """
+        interval_seconds = interval_seconds or self.interval_seconds
+        fleet = self.fleet
+        if index is not None:
+            fleet = {name: values[index] for name, values in fleet.items()}
+        else:
+            index = slice(None)
+        
+        type_index = fleet['type_index']
+        params = self.params
+        rng = self.streams.at(fleet['stream_key'], self.clock.now())
+        
+        time_factors = np.array([self.get_time_factor(t) for t in self.meter_types])
+        time_factor = time_factors[type_index]
+        
+        # Calculate flow rate, clamped to each meter's max capacity
+        base = params['base_flow'][type_index]
+        peak = params['peak_flow'][type_index]
+        variation = params['variation'][type_index]
+        base_flow = base + (peak - base) * time_factor
+        flow_rate = np.minimum(base_flow * rng.uniform(1 - variation, 1 + variation, 'variation'), fleet['max_flow_rate'])
+        
+        # Accumulate totals over the reading interval (L, m3 or kg)
+        self.totals[index] += flow_rate * interval_seconds / params['rate_period_s'][type_index]
+        
+        # Fluid properties
+        temperature_c = rng.uniform(params['temperature_low'][type_index],
+                                    params['temperature_high'][type_index], 'temperature')
+        pressure_bar = rng.uniform(params['pressure_low'][type_index],
+                                   params['pressure_high'][type_index], 'pressure')
+        density = rng.uniform(params['density_low'][type_index], params['density_high'][type_index], 'density')
+        density[~params['has_density'][type_index]] = np.nan
         
         return {
-            'flow_rate': round(flow_rate, 3),
-            'total_volume': round(self.total_volumes[meter_id], 3),
-            'temperature_c': round(temperature_c, 2),
-            'pressure_bar': round(pressure_bar, 2),
-            'density': None
+            'meter_id': fleet['meter_id'],
+            'meter_type': fleet['meter_type'],
+            'flow_rate': np.round(flow_rate, 3),
+            'total_volume': np.round(self.totals[index], 3),
+            'temperature_c': np.round(temperature_c, 2),
+            'pressure_bar': np.round(pressure_bar, 2),
+            'density': np.round(density, 3)
         }
     
     def generate_reading(self, meter_id):
         """Generate flow meter reading based on meter type"""
-        meter_info = self.get_meter_info(meter_id)
+        if self.fleet is None or meter_id not in self.index:
+            self.load_fleet()
         
-        if not meter_info or meter_info['status'] != 'active':
+        if meter_id not in self.index:
             return None
         
-        meter_type = meter_info['meter_type']
-        
-        if meter_type == 'water':
-            return self.generate_water_reading(meter_id, meter_info)
-        elif meter_type == 'gas':
-            return self.generate_gas_reading(meter_id, meter_info)
-        elif meter_type == 'steam':
-            return self.generate_steam_reading(meter_id, meter_info)
-        elif meter_type == 'air':
-            return self.generate_air_reading(meter_id, meter_info)
-        
-        return None
+        batch = self.generate_batch(np.array([self.index[meter_id]]))
+        reading = {}
+        for name, values in batch.items():
+            if name in ('meter_id', 'meter_type'):
+                continue
+            value = float(values[0])
+            reading[name] = None if np.isnan(value) else value
+        return reading
@@ -0,0 +1,342 @@
+from datetime import datetime
+from batch_writer import BatchWriter, TABLE_COLUMNS
+from rollups import ROLLUP_METRICS, GROUP_COLUMN
+import numpy as np
+import csv
+import io
+import json
+import os
+import re
+import zlib
+
+# Largest request body, after decompression
+INGEST_MAX_BYTES = int(float(os.getenv('INGEST_MAX_MB', '64')) * 2**20)
+
+# Rejected rows reported back per batch (the counts always cover every row)
+INGEST_MAX_ERRORS = int(os.getenv('INGEST_MAX_ERRORS', '100'))
+
+# Registry table and group column (for fleet rollups) of the devices a reading table references;
+# weather stations have no registry, so any station ID is accepted
+DEVICE_TABLES = {
+    'smart_pole_energy': ('smart_poles', None),
+    'power_meter_readings': ('power_meters', 'meter_type'),
+    'flow_meter_readings': ('flow_meters', 'meter_type')
+}
+
+# A trailing UTC offset ('Z', '+07:00', '-0500'); may also match a plain date, which is harmless
+# since matching strings are only parsed one by one
+UTC_OFFSET = re.compile(r'(?:Z|[+-]\d{2}(?::?\d{2})?)$', re.MULTILINE)
+
+SCHEMA_QUERY = """
+    SELECT column_name, data_type, is_nullable, numeric_precision, numeric_scale, character_maximum_length
+    FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = %s
+"""
+
+INTEGER_LIMITS = {'smallint': 2**15, 'integer': 2**31, 'bigint': 2**63}
+
+# Column schemas per reading table, loaded once per process
+_schemas = {}
+
+class IngestError(Exception):
+    """Raised when a request body cannot be read as a batch of readings"""
+
+class BatchTooLargeError(IngestError):
+    """Raised when a request body exceeds INGEST_MAX_BYTES"""
+
+class IngestWriteError(Exception):
+    """Raised when the database did not store a validated batch"""
+
+def decode_body(body, encoding=None):
+    """Request body bytes, gunzipped when sent with Content-Encoding: gzip"""
+    if not encoding or encoding == 'identity':
+        return body
+    if encoding != 'gzip':
+        raise IngestError(f"Unsupported Content-Encoding: {encoding}. Use gzip or none")
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, INGEST_MAX_BYTES + 1)
+    except zlib.error as e:
+        raise IngestError(f"Invalid gzip body: {e}")
+    if len(data) > INGEST_MAX_BYTES or decompressor.unconsumed_tail:
+        raise BatchTooLargeError(f"Body larger than {INGEST_MAX_BYTES} bytes when decompressed")
+    return data
+
+def _record_columns(table, records, errors):
+    """Columns of a table out of parsed JSON records; rows that are not objects are rejected"""
+    rows = records
+    if not all(type(record) is dict for record in records):
+        rows = []
+        for row, record in enumerate(records):
+            if type(record) is not dict:
+                errors[row] = f"Expected a JSON object, got {type(record).__name__}"
+                record = {}
+            rows.append(record)
+    # Unknown fields (e.g. a meter_type sent along) are ignored
+    return {name: [record.get(name) for record in rows] for name in TABLE_COLUMNS[table]}, len(rows)
+
+def parse_json(table, body):
+    """(columns, count, errors) of a JSON array of reading objects"""
+    try:
+        records = json.loads(body)
+    except ValueError as e:
+        raise IngestError(f"Invalid JSON: {e}")
+    if not isinstance(records, list):
+        raise IngestError("Expected a JSON array of readings")
+    errors = {}
+    columns, count = _record_columns(table, records, errors)
+    return columns, count, errors
+
+def parse_ndjson(table, body):
+    """(columns, count, errors) of one JSON reading object per line; unreadable lines are rejected"""
+    lines = [line for line in body.split(b'\n') if line.strip()]
+    errors = {}
+    try:
+        # One parse of the whole body, unless a line does not hold exactly one JSON value
+        records = json.loads(b'[' + b','.join(lines) + b']')
+        if len(records) != len(lines):
+            raise ValueError("not one value per line")
+    except ValueError:
+        records = []
+        for row, line in enumerate(lines):
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                errors[row] = f"Invalid JSON: {e}"
+                records.append({})
+    columns, count = _record_columns(table, records, errors)
+    return columns, count, errors
+
+def parse_csv(table, body):
+    """(columns, count, errors) of CSV with a header row naming the columns
+
+    Empty fields are NULL; rows with a different number of fields than the
+    header are rejected.
+    """
+    try:
+        text = body.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        raise IngestError(f"CSV body is not UTF-8: {e}")
+    try:
+        reader = csv.reader(io.StringIO(text))
+        header = next(reader, None) or []
+        rows = [fields for fields in reader if fields]
+    except csv.Error as e:
+        raise IngestError(f"Invalid CSV: {e}")
+
+    errors = {}
+    width = len(header)
+    for row, fields in enumerate(rows):
+        if len(fields) != width:
+            errors[row] = f"Expected {width} fields, got {len(fields)}"
+            rows[row] = [''] * width
+    positions = {name.strip(): position for position, name in enumerate(header)}
+    columns = {
+        name: [fields[positions[name]] or None for fields in rows] if name in positions else [None] * len(rows)
+        for name in TABLE_COLUMNS[table]
+    }
+    return columns, len(rows), errors
+
+# Media type of a request body -> parser
+INGEST_FORMATS = {
+    'application/json': parse_json,
+    'application/x-ndjson': parse_ndjson,
+    'text/csv': parse_csv
+}
+
+def parse_body(table, body, media_type, encoding=None):
+    """(columns by name, row count, {row: error}) of a request body in one of INGEST_FORMATS"""
+    return INGEST_FORMATS[media_type](table, decode_body(body, encoding))
+
+def load_schema(db, table):
+    """{column: (kind, required, largest magnitude, longest text)} of a reading table from the catalog"""
+    schema = _schemas.get(table)
+    if schema is not None:
+        return schema
+    rows = db.fetch_all(SCHEMA_QUERY, (table,))
+    if not rows:
+        raise IngestWriteError(f"Cannot read the columns of {table}")
+
+    device_column = ROLLUP_METRICS[table][0]
+    schema = {}
+    for name, data_type, nullable, precision, scale, max_length in rows:
+        if name not in TABLE_COLUMNS[table]:
+            continue
+        if data_type.startswith('timestamp'):
+            kind, limit = 'timestamp', None
+        elif data_type in INTEGER_LIMITS:
+            kind, limit = 'integer', INTEGER_LIMITS[data_type]
+        elif data_type == 'numeric':
+            kind, limit = 'float', 10.0 ** (precision - scale) if precision is not None else None
+        elif data_type in ('real', 'double precision'):
+            kind, limit = 'float', None
+        else:
+            kind, limit = 'text', None
+        # The device ID is always required: it keys rollups and the latest values
+        required = nullable == 'NO' or name == device_column
+        schema[name] = (kind, required, limit, max_length)
+    _schemas[table] = schema
+    return schema
+
+def _reject(errors, mask, message):
+    """Record message for the rows of a mask that have no error yet"""
+    for row in np.flatnonzero(mask).tolist():
+        errors.setdefault(row, message)
+
+def local_naive(moment):
+    """A datetime as naive local time, the way the generator stores readings (datetime.now())
+
+    Times with an offset are converted to this host's time zone; naive times are kept as they are.
+    """
+    if moment is not None and moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+def _parse_timestamp(value):
+    """Naive local datetime of an ISO 8601 string, or None if it is not one"""
+    if type(value) is not str:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return local_naive(moment)
+
+def _timestamps(name, values, required, errors):
+    """ISO 8601 strings as datetime64[us]; times with an offset are converted to local time"""
+    if all(type(value) is str for value in values) and not UTC_OFFSET.search('\n'.join(values)):
+        try:
+            array = np.array(values, dtype='datetime64[us]')
+        except ValueError:
+            array = None
+        if array is not None:
+            if required:
+                _reject(errors, np.isnat(array), f"{name}: required")
+            return array
+
+    array = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[us]')
+    for row, value in enumerate(values):
+        if value is None or value == '':
+            if required:
+                errors.setdefault(row, f"{name}: required")
+            continue
+        moment = _parse_timestamp(value)
+        if moment is None:
+            errors.setdefault(row, f"{name}: expected an ISO 8601 timestamp, got {value!r}")
+        else:
+            array[row] = moment
+    return array
+
+def _numbers(name, values, kind, required, limit, errors):
+    """Numbers (or numeric strings) as a float array with NaN for NULL, checked against the column"""
+    try:
+        array = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        array = None
+    if array is None or array.ndim != 1:
+        array = np.empty(len(values))
+        for row, value in enumerate(values):
+            try:
+                array[row] = np.nan if value is None or value == '' else float(value)
+            except (TypeError, ValueError):
+                array[row] = np.nan
+                errors.setdefault(row, f"{name}: expected a number, got {value!r}")
+
+    missing = np.isnan(array)
+    if required:
+        _reject(errors, missing, f"{name}: required")
+    with np.errstate(invalid='ignore'):
+        _reject(errors, np.isinf(array), f"{name}: not finite")
+        if limit is not None:
+            _reject(errors, np.abs(array) >= limit, f"{name}: out of range (magnitude below {limit:g})")
+        if kind == 'integer':
+            _reject(errors, ~missing & (array != np.round(array)), f"{name}: expected an integer")
+    return array
+
+def _strings(name, values, required, max_length, errors):
+    """Text values as an object array, None for NULL (and for values that are not text)"""
+    array = np.empty(len(values), dtype=object)
+    for row, value in enumerate(values):
+        if value is None or value == '':
+            if required:
+                errors.setdefault(row, f"{name}: required")
+        elif type(value) is not str:
+            errors.setdefault(row, f"{name}: expected a string, got {value!r}")
+        elif max_length and len(value) > max_length:
+            errors.setdefault(row, f"{name}: longer than {max_length} characters")
+        else:
+            array[row] = value
+    return array
+
+def _integer_column(array):
+    """A validated integer column as BatchWriter writes it: int64, or a list with None for NULL"""
+    missing = np.isnan(array)
+    if not missing.any():
+        return array.astype(np.int64)
+    return [None if absent else int(value) for absent, value in zip(missing.tolist(), array.tolist())]
+
+def validate(schema, table, columns, count, errors):
+    """Typed column arrays of every row; rows failing a check are added to errors"""
+    values = {}
+    for name in TABLE_COLUMNS[table]:
+        kind, required, limit, max_length = schema[name]
+        column = columns[name]
+        if kind == 'timestamp':
+            values[name] = _timestamps(name, column, required, errors)
+        elif kind == 'text':
+            values[name] = _strings(name, column, required, max_length, errors)
+        else:
+            values[name] = _numbers(name, column, kind, required, limit, errors)
+    return values
+
+def _known_devices(db, table, device_ids):
+    """{device ID: group} of the registered devices among device_ids"""
+    registry, group_column = DEVICE_TABLES[table]
+    device_column = ROLLUP_METRICS[table][0]
+    query = f"SELECT {device_column}, {group_column or 'NULL'} FROM {registry} WHERE {device_column} = ANY(%s)"
+    return dict(db.fetch_all(query, (device_ids,)))
+
+def store_readings(db, table, columns, count, errors):
+    """Validate parsed readings and write the valid ones in one transaction
+
+    Valid rows go through a BatchWriter, so they are loaded with COPY and
+    folded into the rollups and latest values like generated readings. Rows
+    failing validation (or naming an unregistered device) are left out and
+    reported; raises IngestWriteError if the database refused the batch.
+    """
+    schema = load_schema(db, table)
+    values = validate(schema, table, columns, count, errors)
+
+    keep = np.ones(count, dtype=bool)
+    keep[list(errors)] = False
+    device_column = ROLLUP_METRICS[table][0]
+    groups = None
+    if table in DEVICE_TABLES and keep.any():
+        device_ids = values[device_column]
+        known = _known_devices(db, table, list(set(device_ids[keep].tolist())))
+        unknown = keep & ~np.fromiter((device_id in known for device_id in device_ids.tolist()),
+                                      dtype=bool, count=count)
+        _reject(errors, unknown, f"{device_column}: unknown device")
+        keep &= ~unknown
+        if DEVICE_TABLES[table][1]:
+            groups = np.array([known.get(device_id) for device_id in device_ids[keep].tolist()], dtype=object)
+
+    accepted = int(keep.sum())
+    if accepted:
+        block = {}
+        for name in TABLE_COLUMNS[table]:
+            column = values[name][keep]
+            block[name] = _integer_column(column) if schema[name][0] == 'integer' else column
+        if groups is not None:
+            block[GROUP_COLUMN] = groups
+        writer = BatchWriter(db, batch_size=accepted + 1)
+        writer.add_columns(table, block, accepted)
+        if not writer.flush():
+            raise IngestWriteError(f"The database did not store the batch of {accepted} readings")
+
+    return {
+        'received': count,
+        'accepted': accepted,
+        'rejected': count - accepted,
+        'errors': [{'row': row, 'error': errors[row]} for row in sorted(errors)[:INGEST_MAX_ERRORS]]
+    }
@@ -1,4 +1,53 @@
--- Create tables for smart city data
+-- Create tables for smart city data (schema only; sample devices and data are in seed.sql)
+
+-- Reading tables are range partitioned by timestamp into daily partitions named <table>_pYYYYMMDD,
+-- plus a <table>_default partition for rows outside them. partition_manager.py (python main.py partitions)
+-- pre-creates future partitions and drops expired ones.
+CREATE OR REPLACE FUNCTION create_daily_partition(parent TEXT, day DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    partition_name TEXT := parent || '_p' || to_char(day, 'YYYYMMDD');
+    default_name TEXT := parent || '_default';
+    range_start TIMESTAMP := day;
+    range_end TIMESTAMP := day + 1;
+    has_rows BOOLEAN;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE timestamp >= %L AND timestamp < %L)',
+                   default_name, range_start, range_end) INTO has_rows;
+    IF has_rows THEN
+        -- Rows for this day already landed in the default partition: move them into the new one
+        EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                       partition_name, parent);
+        EXECUTE format('WITH moved AS (DELETE FROM %I WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+                       'INSERT INTO %I SELECT * FROM moved',
+                       default_name, range_start, range_end, partition_name);
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       parent, partition_name, range_start, range_end);
+    ELSE
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, parent, range_start, range_end);
+    END IF;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION create_daily_partitions(parent TEXT, first_day DATE, last_day DATE) RETURNS INTEGER AS $$
+DECLARE
+    day DATE := first_day;
+    created INTEGER := 0;
+BEGIN
+    WHILE day <= last_day LOOP
+        IF create_daily_partition(parent, day) THEN
+            created := created + 1;
+        END IF;
+        day := day + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
 
 -- Table for smart pole information
 CREATE TABLE IF NOT EXISTS smart_poles (
@@ -14,7 +63,7 @@ CREATE TABLE IF NOT EXISTS smart_poles (
 
 -- Table for smart pole energy consumption
 CREATE TABLE IF NOT EXISTS smart_pole_energy (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     pole_id VARCHAR(50) REFERENCES smart_poles(pole_id),
     timestamp TIMESTAMP NOT NULL,
     power_consumption_w DECIMAL(10, 2) NOT NULL,
@@ -22,12 +71,15 @@ CREATE TABLE IF NOT EXISTS smart_pole_energy (
     current_a DECIMAL(10, 4) NOT NULL,
     energy_kwh DECIMAL(10, 4) NOT NULL,
     status VARCHAR(20) NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS smart_pole_energy_default PARTITION OF smart_pole_energy DEFAULT;
+SELECT create_daily_partitions('smart_pole_energy', CURRENT_DATE - 1, CURRENT_DATE + 7);
 
 -- Table for weather station data
 CREATE TABLE IF NOT EXISTS weather_station (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     station_id VARCHAR(50) NOT NULL,
     timestamp TIMESTAMP NOT NULL,
     temperature_c DECIMAL(5, 2),
@@ -37,8 +89,11 @@ CREATE TABLE IF NOT EXISTS weather_station (
     wind_direction_deg INTEGER,
     rainfall_mm DECIMAL(6, 2),
     light_intensity_lux INTEGER,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS weather_station_default PARTITION OF weather_station DEFAULT;
+SELECT create_daily_partitions('weather_station', CURRENT_DATE - 1, CURRENT_DATE + 7);
 
 -- Table for smart pole modules (different components)
 CREATE TABLE IF NOT EXISTS smart_pole_modules (
@@ -56,45 +111,6 @@ CREATE INDEX IF NOT EXISTS idx_energy_pole_timestamp ON smart_pole_energy(pole_i
 CREATE INDEX IF NOT EXISTS idx_weather_timestamp ON weather_station(timestamp);
 CREATE INDEX IF NOT EXISTS idx_modules_pole ON smart_pole_modules(pole_id);
 
--- Insert sample smart poles
-INSERT INTO smart_poles (pole_id, location, latitude, longitude, status) VALUES
-    ('SP001', 'Main Street North', 13.736717, 100.523186, 'on'),
-    ('SP002', 'Central Avenue', 13.746717, 100.533186, 'on'),
-    ('SP003', 'Park Lane', 13.726717, 100.513186, 'on'),
-    ('SP004', 'University Road', 13.756717, 100.543186, 'on'),
-    ('SP005', 'Business District', 13.766717, 100.553186, 'off')
-ON CONFLICT (pole_id) DO NOTHING;
-
--- Insert sample modules for each smart pole
-INSERT INTO smart_pole_modules (pole_id, module_type, module_name, power_rating_w) VALUES
-    ('SP001', 'lighting', 'LED Street Light', 120.0),
-    ('SP001', 'camera', 'Security Camera', 15.0),
-    ('SP001', 'sensor', 'Environmental Sensors', 5.0),
-    ('SP001', 'wifi', 'WiFi Access Point', 25.0),
-    ('SP001', 'display', 'Digital Display', 80.0),
-    ('SP002', 'lighting', 'LED Street Light', 120.0),
-    ('SP002', 'camera', 'Security Camera', 15.0),
-    ('SP002', 'sensor', 'Environmental Sensors', 5.0),
-    ('SP002', 'wifi', 'WiFi Access Point', 25.0),
-    ('SP003', 'lighting', 'LED Street Light', 120.0),
-    ('SP003', 'camera', 'Security Camera', 15.0),
-    ('SP003', 'sensor', 'Environmental Sensors', 5.0),
-    ('SP004', 'lighting', 'LED Street Light', 120.0),
-    ('SP004', 'camera', 'Security Camera', 15.0),
-    ('SP004', 'sensor', 'Environmental Sensors', 5.0),
-    ('SP004', 'wifi', 'WiFi Access Point', 25.0),
-    ('SP004', 'display', 'Digital Display', 80.0),
-    ('SP004', 'charging', 'EV Charging Station', 350.0),
-    ('SP005', 'lighting', 'LED Street Light', 120.0),
-    ('SP005', 'camera', 'Security Camera', 15.0),
-    ('SP005', 'sensor', 'Environmental Sensors', 5.0)
-ON CONFLICT DO NOTHING;
-
--- Insert initial weather station
-INSERT INTO weather_station (station_id, timestamp, temperature_c, humidity_percent, pressure_hpa, wind_speed_ms, wind_direction_deg, rainfall_mm, light_intensity_lux)
-VALUES ('WS001', CURRENT_TIMESTAMP, 28.5, 65.0, 1013.25, 2.5, 180, 0.0, 50000)
-ON CONFLICT DO NOTHING;
-
 -- Table for device categories
 CREATE TABLE IF NOT EXISTS device_categories (
     id SERIAL PRIMARY KEY,
@@ -121,7 +137,7 @@ CREATE TABLE IF NOT EXISTS power_meters (
 
 -- Table for power meter readings
 CREATE TABLE IF NOT EXISTS power_meter_readings (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     meter_id VARCHAR(50) REFERENCES power_meters(meter_id),
     timestamp TIMESTAMP NOT NULL,
     voltage_v DECIMAL(10, 2) NOT NULL,
@@ -140,8 +156,11 @@ CREATE TABLE IF NOT EXISTS power_meter_readings (
     power_l1_w DECIMAL(10, 2),
     power_l2_w DECIMAL(10, 2),
     power_l3_w DECIMAL(10, 2),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS power_meter_readings_default PARTITION OF power_meter_readings DEFAULT;
+SELECT create_daily_partitions('power_meter_readings', CURRENT_DATE - 1, CURRENT_DATE + 7);
 
 -- Table for flow meters
 CREATE TABLE IF NOT EXISTS flow_meters (
@@ -160,7 +179,7 @@ CREATE TABLE IF NOT EXISTS flow_meters (
 
 -- Table for flow meter readings
 CREATE TABLE IF NOT EXISTS flow_meter_readings (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     meter_id VARCHAR(50) REFERENCES flow_meters(meter_id),
     timestamp TIMESTAMP NOT NULL,
     flow_rate DECIMAL(10, 3) NOT NULL,
@@ -168,49 +187,167 @@ CREATE TABLE IF NOT EXISTS flow_meter_readings (
     temperature_c DECIMAL(5, 2),
     pressure_bar DECIMAL(7, 2),
     density DECIMAL(7, 3), -- For mass flow meters
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS flow_meter_readings_default PARTITION OF flow_meter_readings DEFAULT;
+SELECT create_daily_partitions('flow_meter_readings', CURRENT_DATE - 1, CURRENT_DATE + 7);
 
 -- Create indexes for new tables
-CREATE INDEX IF NOT EXISTS idx_power_meter_readings_timestamp ON power_meter_readings(meter_id, timestamp);
-CREATE INDEX IF NOT EXISTS idx_flow_meter_readings_timestamp ON flow_meter_readings(meter_id, timestamp);
-
--- Insert device categories
-INSERT INTO device_categories (category_id, category_name, description) VALUES
-    ('smart_pole', 'Smart Pole', 'Smart street lighting poles with IoT modules'),
-    ('weather_station', 'Weather Station', 'Environmental monitoring stations'),
-    ('power_meter_1ph', 'Power Meter 1-Phase', 'Single-phase power meters for room/zone monitoring'),
-    ('power_meter_3ph', 'Power Meter 3-Phase', 'Three-phase power meters for building/facility monitoring'),
-    ('flow_meter_water', 'Water Flow Meter', 'Water consumption monitoring'),
-    ('flow_meter_gas', 'Gas Flow Meter', 'Gas flow monitoring'),
-    ('flow_meter_steam', 'Steam Flow Meter', 'Steam flow monitoring'),
-    ('flow_meter_air', 'Air Flow Meter', 'Compressed air flow monitoring')
-ON CONFLICT (category_id) DO NOTHING;
-
--- Insert sample power meters (1-phase for rooms)
-INSERT INTO power_meters (meter_id, meter_type, location, room_name, building, latitude, longitude, status) VALUES
-    ('PM1P001', '1-phase', 'Building A - Room 101', 'Room 101', 'Building A', 13.736717, 100.523186, 'active'),
-    ('PM1P002', '1-phase', 'Building A - Room 102', 'Room 102', 'Building A', 13.736717, 100.523186, 'active'),
-    ('PM1P003', '1-phase', 'Building A - Room 201', 'Room 201', 'Building A', 13.736717, 100.523186, 'active'),
-    ('PM1P004', '1-phase', 'Building B - Office 1', 'Office 1', 'Building B', 13.746717, 100.533186, 'active'),
-    ('PM1P005', '1-phase', 'Building B - Office 2', 'Office 2', 'Building B', 13.746717, 100.533186, 'active')
-ON CONFLICT (meter_id) DO NOTHING;
+-- (meter_id, timestamp, id) serves time-range filters and the API's (timestamp, id) keyset cursors
+CREATE INDEX IF NOT EXISTS idx_power_meter_readings_keyset ON power_meter_readings(meter_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_flow_meter_readings_keyset ON flow_meter_readings(meter_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_power_meters_type ON power_meters(meter_type, meter_id);
+CREATE INDEX IF NOT EXISTS idx_flow_meters_type ON flow_meters(meter_type, meter_id);
+
+-- Hourly and daily rollups maintained by the generator when it writes readings
+-- (avg = sum_value / sample_count). reading_rollups is per device; fleet_rollups is per device
+-- group (meter type) plus an 'all' group covering the whole table. fleet_rollups also keeps
+-- '5min' buckets, from which the API's last-hour statistics are read.
+CREATE TABLE IF NOT EXISTS reading_rollups (
+    source_table VARCHAR(50) NOT NULL,
+    device_id VARCHAR(50) NOT NULL,
+    metric VARCHAR(50) NOT NULL,
+    bucket_size VARCHAR(10) NOT NULL, -- 'hour' or 'day'
+    bucket_start TIMESTAMP NOT NULL,
+    sample_count BIGINT NOT NULL,
+    min_value DOUBLE PRECISION,
+    max_value DOUBLE PRECISION,
+    sum_value DOUBLE PRECISION,
+    last_value DOUBLE PRECISION,
+    last_timestamp TIMESTAMP,
+    PRIMARY KEY (source_table, device_id, metric, bucket_size, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS fleet_rollups (
+    source_table VARCHAR(50) NOT NULL,
+    group_key VARCHAR(50) NOT NULL,
+    metric VARCHAR(50) NOT NULL,
+    bucket_size VARCHAR(10) NOT NULL, -- '5min', 'hour' or 'day'
+    bucket_start TIMESTAMP NOT NULL,
+    sample_count BIGINT NOT NULL,
+    min_value DOUBLE PRECISION,
+    max_value DOUBLE PRECISION,
+    sum_value DOUBLE PRECISION,
+    last_value DOUBLE PRECISION,
+    last_timestamp TIMESTAMP,
+    PRIMARY KEY (source_table, group_key, metric, bucket_size, bucket_start)
+);
 
--- Insert sample power meters (3-phase for buildings)
-INSERT INTO power_meters (meter_id, meter_type, location, room_name, building, latitude, longitude, status) VALUES
-    ('PM3P001', '3-phase', 'Building A - Main Distribution', 'Main Panel', 'Building A', 13.736717, 100.523186, 'active'),
-    ('PM3P002', '3-phase', 'Building B - Main Distribution', 'Main Panel', 'Building B', 13.746717, 100.533186, 'active'),
-    ('PM3P003', '3-phase', 'Building C - Main Distribution', 'Main Panel', 'Building C', 13.756717, 100.543186, 'active')
+-- Latest reading of every device, upserted by the generator in the same transaction as the
+-- readings (latest.py), so "current state" queries read one row per device instead of the history
+CREATE TABLE IF NOT EXISTS weather_station_latest (
+    station_id VARCHAR(50) PRIMARY KEY,
+    timestamp TIMESTAMP NOT NULL,
+    temperature_c DECIMAL(5, 2),
+    humidity_percent DECIMAL(5, 2),
+    pressure_hpa DECIMAL(7, 2),
+    wind_speed_ms DECIMAL(5, 2),
+    wind_direction_deg INTEGER,
+    rainfall_mm DECIMAL(6, 2),
+    light_intensity_lux INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS smart_pole_energy_latest (
+    pole_id VARCHAR(50) PRIMARY KEY,
+    timestamp TIMESTAMP NOT NULL,
+    power_consumption_w DECIMAL(10, 2) NOT NULL,
+    voltage_v DECIMAL(10, 2) NOT NULL,
+    current_a DECIMAL(10, 4) NOT NULL,
+    energy_kwh DECIMAL(10, 4) NOT NULL,
+    status VARCHAR(20) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS power_meter_readings_latest (
+    meter_id VARCHAR(50) PRIMARY KEY,
+    timestamp TIMESTAMP NOT NULL,
+    voltage_v DECIMAL(10, 2) NOT NULL,
+    current_a DECIMAL(10, 4) NOT NULL,
+    power_w DECIMAL(10, 2) NOT NULL,
+    power_factor DECIMAL(5, 3),
+    energy_kwh DECIMAL(10, 4) NOT NULL,
+    frequency_hz DECIMAL(5, 2),
+    voltage_l1_v DECIMAL(10, 2),
+    voltage_l2_v DECIMAL(10, 2),
+    voltage_l3_v DECIMAL(10, 2),
+    current_l1_a DECIMAL(10, 4),
+    current_l2_a DECIMAL(10, 4),
+    current_l3_a DECIMAL(10, 4),
+    power_l1_w DECIMAL(10, 2),
+    power_l2_w DECIMAL(10, 2),
+    power_l3_w DECIMAL(10, 2)
+);
+
+CREATE TABLE IF NOT EXISTS flow_meter_readings_latest (
+    meter_id VARCHAR(50) PRIMARY KEY,
+    timestamp TIMESTAMP NOT NULL,
+    flow_rate DECIMAL(10, 3) NOT NULL,
+    total_volume DECIMAL(15, 3) NOT NULL,
+    temperature_c DECIMAL(5, 2),
+    pressure_bar DECIMAL(7, 2),
+    density DECIMAL(7, 3)
+);
+
+-- Seed the latest tables from readings written before they existed (no-op once populated)
+INSERT INTO weather_station_latest
+SELECT DISTINCT ON (station_id) station_id, timestamp, temperature_c, humidity_percent, pressure_hpa,
+       wind_speed_ms, wind_direction_deg, rainfall_mm, light_intensity_lux
+FROM weather_station ORDER BY station_id, timestamp DESC
+ON CONFLICT (station_id) DO NOTHING;
+
+INSERT INTO smart_pole_energy_latest
+SELECT DISTINCT ON (pole_id) pole_id, timestamp, power_consumption_w, voltage_v, current_a, energy_kwh, status
+FROM smart_pole_energy WHERE pole_id IS NOT NULL ORDER BY pole_id, timestamp DESC
+ON CONFLICT (pole_id) DO NOTHING;
+
+INSERT INTO power_meter_readings_latest
+SELECT DISTINCT ON (meter_id) meter_id, timestamp, voltage_v, current_a, power_w, power_factor, energy_kwh,
+       frequency_hz, voltage_l1_v, voltage_l2_v, voltage_l3_v, current_l1_a, current_l2_a, current_l3_a,
+       power_l1_w, power_l2_w, power_l3_w
+FROM power_meter_readings WHERE meter_id IS NOT NULL ORDER BY meter_id, timestamp DESC
 ON CONFLICT (meter_id) DO NOTHING;
 
--- Insert sample flow meters
-INSERT INTO flow_meters (meter_id, meter_type, flow_unit, location, building, pipe_size_mm, max_flow_rate, status) VALUES
-    ('FM_W001', 'water', 'L/min', 'Building A - Water Supply', 'Building A', 50, 100.0, 'active'),
-    ('FM_W002', 'water', 'L/min', 'Building B - Water Supply', 'Building B', 50, 100.0, 'active'),
-    ('FM_W003', 'water', 'm3/h', 'Main Water Line', 'Campus', 100, 50.0, 'active'),
-    ('FM_G001', 'gas', 'm3/h', 'Building A - Gas Line', 'Building A', 25, 20.0, 'active'),
-    ('FM_G002', 'gas', 'm3/h', 'Cafeteria - Gas Supply', 'Cafeteria', 32, 30.0, 'active'),
-    ('FM_S001', 'steam', 'kg/h', 'Central Boiler - Steam', 'Boiler Room', 80, 500.0, 'active'),
-    ('FM_A001', 'air', 'm3/min', 'Compressor Station', 'Workshop', 40, 15.0, 'active'),
-    ('FM_A002', 'air', 'm3/min', 'Production Line', 'Factory', 50, 25.0, 'active')
+INSERT INTO flow_meter_readings_latest
+SELECT DISTINCT ON (meter_id) meter_id, timestamp, flow_rate, total_volume, temperature_c, pressure_bar, density
+FROM flow_meter_readings WHERE meter_id IS NOT NULL ORDER BY meter_id, timestamp DESC
 ON CONFLICT (meter_id) DO NOTHING;
+
+-- Notify the generator's device registry about device changes
+-- Payload: {"table": ..., "op": ..., "id": ...}; a payload with "op": "reload" forces a full reload
+CREATE OR REPLACE FUNCTION notify_device_change() RETURNS trigger AS $$
+DECLARE
+    key_column TEXT := TG_ARGV[0];
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('device_registry', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', to_jsonb(OLD) ->> key_column
+        )::text);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('device_registry', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', to_jsonb(NEW) ->> key_column
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS smart_poles_notify ON smart_poles;
+CREATE TRIGGER smart_poles_notify
+    AFTER INSERT OR UPDATE OR DELETE ON smart_poles
+    FOR EACH ROW EXECUTE FUNCTION notify_device_change('pole_id');
+
+DROP TRIGGER IF EXISTS smart_pole_modules_notify ON smart_pole_modules;
+CREATE TRIGGER smart_pole_modules_notify
+    AFTER INSERT OR UPDATE OR DELETE ON smart_pole_modules
+    FOR EACH ROW EXECUTE FUNCTION notify_device_change('pole_id');
+
+DROP TRIGGER IF EXISTS power_meters_notify ON power_meters;
+CREATE TRIGGER power_meters_notify
+    AFTER INSERT OR UPDATE OR DELETE ON power_meters
+    FOR EACH ROW EXECUTE FUNCTION notify_device_change('meter_id');
+
+DROP TRIGGER IF EXISTS flow_meters_notify ON flow_meters;
+CREATE TRIGGER flow_meters_notify
+    AFTER INSERT OR UPDATE OR DELETE ON flow_meters
+    FOR EACH ROW EXECUTE FUNCTION notify_device_change('meter_id');
@@ -0,0 +1,99 @@
+from rollups import ROLLUP_METRICS, timestamp_column
+import numpy as np
+
+# Latest reading of every device, one table per reading table keyed by its device ID column
+LATEST_TABLES = {table: f"{table}_latest" for table in ROLLUP_METRICS}
+
+# Replace a device's stored reading only with a newer one, so late or replayed batches
+# cannot move it back in time; rows are merged in key order as in the rollup upsert
+UPSERT_QUERY = """
+    INSERT INTO {table} AS l SELECT * FROM {table}_staging ORDER BY {key}
+    ON CONFLICT ({key}) DO UPDATE SET {assignments}
+    WHERE EXCLUDED.timestamp >= l.timestamp
+"""
+
+def _take(values, indices, count):
+    """Selected entries of a column given as a numpy array, sequence or scalar"""
+    if isinstance(values, np.ndarray):
+        return values[indices]
+    if isinstance(values, (list, tuple)):
+        return np.array([values[index] for index in indices.tolist()], dtype=object)
+    return np.full(len(indices), values, dtype=object)
+
+class LatestValues:
+    """Keep the latest reading of every device in <table>_latest
+
+    Readings are collected while a batch is flushed, reduced to the newest
+    reading per device and upserted in the same transaction, so "current
+    state" queries read one row per device instead of scanning the history.
+    """
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+        self.parts = {}
+
+    def collect(self, table, column_names, values, count):
+        """Queue count readings of a table given as column values in column_names order"""
+        if table not in LATEST_TABLES or count == 0:
+            return
+        self.parts.setdefault(table, []).append((column_names, values, count))
+
+    def collect_rows(self, table, column_names, rows):
+        """Queue readings given as row tuples in column_names order"""
+        if rows:
+            self.collect(table, column_names, list(zip(*rows)), len(rows))
+
+    def _latest(self, table, parts):
+        """Column names and values of the newest reading per device"""
+        device_column = ROLLUP_METRICS[table][0]
+        column_names = parts[0][0]
+        device_index = column_names.index(device_column)
+        timestamp_index = column_names.index('timestamp')
+
+        device_ids = np.concatenate([
+            _take(values[device_index], np.arange(count), count).astype(str) for _, values, count in parts
+        ])
+        timestamps = np.concatenate([
+            timestamp_column(values[timestamp_index], count) for _, values, count in parts
+        ])
+
+        # Sort by device, then time (later rows win ties) and keep each device's last row
+        device_names, device_codes = np.unique(device_ids, return_inverse=True)
+        order = np.lexsort((np.arange(len(timestamps)), timestamps, device_codes))
+        ends = np.r_[np.flatnonzero(device_codes[order][1:] != device_codes[order][:-1]), len(order) - 1]
+        selected = np.sort(order[ends])
+
+        # Gather the selected rows from the parts they came from
+        offsets = np.cumsum([0] + [count for _, _, count in parts])
+        columns = [[] for _ in column_names]
+        for number, (_, values, count) in enumerate(parts):
+            lo, hi = np.searchsorted(selected, offsets[number:number + 2])
+            if lo == hi:
+                continue
+            indices = selected[lo:hi] - offsets[number]
+            for column, column_values in zip(columns, values):
+                column.append(_take(column_values, indices, count))
+        return column_names, [np.concatenate(column) for column in columns], len(selected)
+
+    def write(self):
+        """Upsert the newest collected reading of every device (caller commits)"""
+        if not self.parts:
+            return 0
+
+        parts, self.parts = self.parts, {}
+        written = 0
+        for table, table_parts in parts.items():
+            target = LATEST_TABLES[table]
+            column_names, values, count = self._latest(table, table_parts)
+            key = ROLLUP_METRICS[table][0]
+            assignments = ', '.join(f"{name} = EXCLUDED.{name}" for name in column_names if name != key)
+            self.db.execute(f"CREATE TEMP TABLE IF NOT EXISTS {target}_staging "
+                            f"(LIKE {target}) ON COMMIT DELETE ROWS")
+            self.db.copy_columns(f"{target}_staging", column_names, values, count)
+            self.db.execute(UPSERT_QUERY.format(table=target, key=key, assignments=assignments))
+            written += count
+        return written
+
+    def discard(self):
+        """Drop collected readings after a failed flush"""
+        self.parts = {}
@@ -1,52 +1,217 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from database import DatabaseConnection
+from batch_writer import BatchWriter
+from parquet_writer import ParquetDatasetWriter
+from sinks import NdjsonSink, BufferedSink, FanoutSink, parse_sinks
+from sim_clock import SystemClock, SimulatedClock
+from device_registry import DeviceRegistry
 from weather_simulator import WeatherSimulator
 from smart_pole_simulator import SmartPoleSimulator
 from power_meter_simulator import PowerMeterSimulator
 from flow_meter_simulator import FlowMeterSimulator
+from scheduler import DriftFreeScheduler, ScheduledJob, parse_intervals
+from provisioning import FleetProvisioner, split_fleet
+from partition_manager import PartitionManager
+from random_streams import RandomStreams
+from metrics import PipelineMetrics, MetricsServer
+from spool import Spool, SpoolDrainer
+import numpy as np
+import asyncio
+import zlib
 import time
 import sys
+import os
+
+# Synthetic fleet size used without a database (no postgres sink) unless --devices is given
+DEFAULT_OFFLINE_DEVICES = 10000
+
+# Commands that generate readings and write them to sinks
+GENERATION_COMMANDS = ('generate', 'continuous', 'backfill')
+
+def shard_of(device_id, shards):
+    """Stable shard index of a device ID (same result in every process)"""
+    return zlib.crc32(device_id.encode('utf-8')) % shards
 
 class SmartCityDataGenerator:
     """Main application to generate and store smart city data"""
     
-    def __init__(self):
+    def __init__(self, batch_size=None, write_method=None, shard=None, sinks=None, seed=None, spool=False):
         self.db = DatabaseConnection()
-        self.weather_sim = WeatherSimulator()
+        self.batch_size = batch_size or int(os.getenv('BATCH_SIZE', '5000'))
+        self.write_method = write_method or os.getenv('WRITE_METHOD', 'copy')
+        
+        # (index, count) when this generator owns one hash partition of the fleet
+        self.shard = shard
+        
+        # Output sinks as [(kind, target), ...]; without a postgres sink no database is used
+        self.sinks = sinks or [('postgres', None)]
+        self.offline = all(kind != 'postgres' for kind, _ in self.sinks)
+        self.sink_db = None
+        
+        # Stage timings, rows per table, overruns and queue depth (served by run_continuous)
+        self.metrics = PipelineMetrics()
+        
+        # Local spool of batches the database cannot take, replayed by a background drainer;
+        # only generation commands ask for it, so other commands start no thread or connection
+        self.spool_dir = (os.getenv('SPOOL_DIR', 'spool') or None) if spool else None
+        self.spool_drainer = None
+        if len(self.sinks) == 1:
+            self.writer = self.create_sink(*self.sinks[0], self.db)
+        else:
+            # Every sink runs on its own thread, so the database sink gets its own connection
+            self.sink_db = None if self.offline else DatabaseConnection()
+            self.writer = FanoutSink([
+                BufferedSink(self.create_sink(kind, target, self.sink_db), kind)
+                for kind, target in self.sinks
+            ])
+        self.metrics.track_queues(self.queue_depths, self.pending_rows)
+        
+        # Readings are drawn from streams keyed by (seed, device, timestamp), so a seeded
+        # run gives the same data however it is sharded
+        self.streams = RandomStreams(seed)
+        
+        self.clock = SystemClock()
+        self.weather_sim = WeatherSimulator(self.clock, self.streams)
         self.pole_sim = None
         self.power_meter_sim = None
         self.flow_meter_sim = None
+        self.registry = None
+        self.partitions = None
         
+        # State shared between device classes generated on separate schedules
+        self.last_weather = None
+        self.power_fleet_split = None
+        
+    def create_sink(self, kind, target, db):
+        """Create one output sink (see sinks.SINK_KINDS)"""
+        if kind == 'postgres':
+            rollups = os.getenv('ROLLUPS_ENABLED', 'true').lower() != 'false'
+            return BatchWriter(
+                db,
+                batch_size=self.batch_size,
+                method=self.write_method,
+                rollups=rollups,
+                metrics=self.metrics,
+                spool=self.create_spool(rollups)
+            )
+        if kind == 'parquet':
+            return ParquetDatasetWriter(target, batch_size=self.batch_size,
+                                        file_prefix=f"{self.shard[0]}-" if self.shard else '',
+                                        metrics=self.metrics)
+        if target and self.shard:
+            # One NDJSON file per shard
+            root, extension = os.path.splitext(target)
+            target = f"{root}-{self.shard[0]}{extension}"
+        return NdjsonSink(target, batch_size=self.batch_size, metrics=self.metrics)
+    
+    def create_spool(self, rollups):
+        """Spool of the database sink and its drainer (started by initialize), unless SPOOL_DIR is empty"""
+        if not self.spool_dir:
+            return None
+        directory = self.spool_dir
+        if self.shard:
+            # One spool per shard, so every worker replays its own devices in order
+            directory = os.path.join(directory, f"shard-{self.shard[0]}")
+        spool = Spool(directory)
+        self.spool_drainer = SpoolDrainer(spool, DatabaseConnection(), rollups=rollups, metrics=self.metrics)
+        self.metrics.track_spool(spool)
+        return spool
+    
+    def queue_depths(self):
+        """Calls queued per buffered sink, for the queue depth gauge"""
+        if isinstance(self.writer, FanoutSink):
+            return [((sink.name,), sink.queue.qsize()) for sink in self.writer.sinks]
+        return []
+    
+    def pending_rows(self):
+        """Rows each sink holds until its next write, for the pending rows gauge"""
+        if isinstance(self.writer, FanoutSink):
+            return [((sink.name,), sink.sink.pending_count) for sink in self.writer.sinks]
+        return [((self.sinks[0][0],), self.writer.pending_count)]
+    
+    def owns(self, device_id):
+        """Whether this generator's shard is responsible for a device"""
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        return shard_of(device_id, count) == index
+    
     def connect_database(self):
         """Connect to database"""
         return self.db.connect()
     
-    def initialize(self):
-        """Initialize the system"""
+    def initialize(self, devices=None):
+        """Initialize the system
+        
+        Without a postgres sink no database is used: a synthetic fleet of about
+        devices devices is built in memory (see provision) instead.
+        """
+        if self.offline:
+            return self.initialize_offline(devices or DEFAULT_OFFLINE_DEVICES)
+        
         if not self.connect_database():
             print("Failed to connect to database. Make sure PostgreSQL is running.")
             return False
+        if self.sink_db and not self.sink_db.connect():
+            print("Failed to connect the database sink.")
+            return False
         
-        self.pole_sim = SmartPoleSimulator(self.db)
-        self.power_meter_sim = PowerMeterSimulator(self.db)
-        self.flow_meter_sim = FlowMeterSimulator(self.db)
-        print("Smart City Data Generator initialized successfully")
+        self.pole_sim = SmartPoleSimulator(self.db, self.clock, self.streams)
+        self.power_meter_sim = PowerMeterSimulator(self.db, self.clock, self.streams)
+        self.flow_meter_sim = FlowMeterSimulator(self.db, self.clock, self.streams)
+        self.registry = DeviceRegistry(
+            self.db,
+            reload_seconds=int(os.getenv('REGISTRY_RELOAD_SECONDS', '300'))
+        )
+        self.partitions = PartitionManager(self.db)
+        legacy = self.partitions.unpartitioned_tables()
+        if legacy:
+            print(f"Reading tables {', '.join(legacy)} were created by an older init.sql and are not "
+                  "partitioned. Run 'python main.py migrate-partitions' to move them to daily partitions")
+            return False
+        if self.spool_drainer:
+            # Replays batches spooled while the database was unavailable, including by earlier runs
+            self.spool_drainer.start()
+        print(f"Smart City Data Generator initialized successfully (seed {self.streams.seed})")
         return True
     
-    def save_weather_data(self, station_id='WS001'):
-        """Generate and save weather station data"""
-        weather_data = self.weather_sim.generate_weather_data()
+    def initialize_offline(self, devices):
+        """Initialize the simulators with a synthetic fleet built in memory"""
+        self.pole_sim = SmartPoleSimulator(None, self.clock, self.streams)
+        self.power_meter_sim = PowerMeterSimulator(None, self.clock, self.streams)
+        self.flow_meter_sim = FlowMeterSimulator(None, self.clock, self.streams)
         
-        query = """
-            INSERT INTO weather_station 
-            (station_id, timestamp, temperature_c, humidity_percent, pressure_hpa, 
-             wind_speed_ms, wind_direction_deg, rainfall_mm, light_intensity_lux)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
+        # Every shard builds the same fleet from the same seed and keeps its own part
+        fleet = FleetProvisioner(seed=self.streams.seed).build(*split_fleet(devices))
+        poles, modules = fleet['smart_poles'], fleet['smart_pole_modules']
+        self.pole_sim.load_fleet(
+            self.shard_rows(list(zip(poles['pole_id'], poles['status']))),
+            self.shard_rows(list(zip(modules['pole_id'], modules['module_type'], modules['power_rating_w'])))
+        )
+        meters = fleet.get('power_meters')
+        self.power_meter_sim.load_fleet(self.shard_rows([
+            row[:3] for row in zip(meters['meter_id'], meters['meter_type'], meters['room_name'], meters['status'])
+            if row[3] == 'active'
+        ] if meters else []))
+        meters = fleet.get('flow_meters')
+        self.flow_meter_sim.load_fleet(self.shard_rows([
+            row[:4] for row in zip(meters['meter_id'], meters['meter_type'], meters['flow_unit'],
+                                   meters['max_flow_rate'], meters['status'])
+            if row[4] == 'active'
+        ] if meters else []))
         
-        params = (
+        print(f"Smart City Data Generator initialized with a synthetic fleet of {devices} devices "
+              f"(sinks: {', '.join(kind for kind, _ in self.sinks)}, seed {self.streams.seed})")
+        return True
+    
+    def save_weather_data(self, station_id='WS001', verbose=True, weather_data=None):
+        """Generate (unless given) and save weather station data"""
+        if weather_data is None:
+            weather_data = self.weather_sim.generate_weather_data(station_id)
+        
+        row = (
             station_id,
-            datetime.now(),
+            self.clock.now(),
             weather_data['temperature_c'],
             weather_data['humidity_percent'],
             weather_data['pressure_hpa'],
@@ -56,25 +221,19 @@ class SmartCityDataGenerator:
             weather_data['light_intensity_lux']
         )
         
-        if self.db.execute_query(query, params):
-            print(f"Weather data saved: Temp={weather_data['temperature_c']}°C, "
-                  f"Humidity={weather_data['humidity_percent']}%, "
-                  f"Light={weather_data['light_intensity_lux']} lux")
+        if self.writer.add('weather_station', row):
+            if verbose:
+                print(f"Weather data saved: Temp={weather_data['temperature_c']}°C, "
+                      f"Humidity={weather_data['humidity_percent']}%, "
+                      f"Light={weather_data['light_intensity_lux']} lux")
             return weather_data
         return None
     
     def save_pole_energy_data(self, pole_id, energy_data):
-        """Save smart pole energy data"""
-        query = """
-            INSERT INTO smart_pole_energy 
-            (pole_id, timestamp, power_consumption_w, voltage_v, current_a, 
-             energy_kwh, status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        params = (
+        """Queue smart pole energy data for the next batch write"""
+        row = (
             pole_id,
-            datetime.now(),
+            self.clock.now(),
             energy_data['power_consumption_w'],
             energy_data['voltage_v'],
             energy_data['current_a'],
@@ -82,22 +241,13 @@ class SmartCityDataGenerator:
             energy_data['status']
         )
         
-        return self.db.execute_query(query, params)
+        return self.writer.add('smart_pole_energy', row)
     
     def save_power_meter_data(self, meter_id, reading_data):
-        """Save power meter reading data"""
-        query = """
-            INSERT INTO power_meter_readings 
-            (meter_id, timestamp, voltage_v, current_a, power_w, power_factor, 
-             energy_kwh, frequency_hz, voltage_l1_v, voltage_l2_v, voltage_l3_v,
-             current_l1_a, current_l2_a, current_l3_a,
-             power_l1_w, power_l2_w, power_l3_w)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        params = (
+        """Queue power meter reading data for the next batch write"""
+        row = (
             meter_id,
-            datetime.now(),
+            self.clock.now(),
             reading_data['voltage_v'],
             reading_data['current_a'],
             reading_data['power_w'],
@@ -115,19 +265,25 @@ class SmartCityDataGenerator:
             reading_data['power_l3_w']
         )
         
-        return self.db.execute_query(query, params)
+        return self.writer.add('power_meter_readings', row)
+    
+    def save_pole_energy_batch(self, energy_data):
+        """Queue a vectorized tick of smart pole energy data (column arrays)"""
+        columns = dict(energy_data)
+        columns['timestamp'] = self.clock.now()
+        return self.writer.add_columns('smart_pole_energy', columns, len(energy_data['pole_id']))
+    
+    def save_power_meter_batch(self, readings):
+        """Queue a vectorized tick of power meter readings (column arrays)"""
+        columns = dict(readings)
+        columns['timestamp'] = self.clock.now()
+        return self.writer.add_columns('power_meter_readings', columns, len(readings['meter_id']))
     
     def save_flow_meter_data(self, meter_id, reading_data):
-        """Save flow meter reading data"""
-        query = """
-            INSERT INTO flow_meter_readings 
-            (meter_id, timestamp, flow_rate, total_volume, temperature_c, pressure_bar, density)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        params = (
+        """Queue flow meter reading data for the next batch write"""
+        row = (
             meter_id,
-            datetime.now(),
+            self.clock.now(),
             reading_data['flow_rate'],
             reading_data['total_volume'],
             reading_data['temperature_c'],
@@ -135,66 +291,265 @@ class SmartCityDataGenerator:
             reading_data['density']
         )
         
-        return self.db.execute_query(query, params)
+        return self.writer.add('flow_meter_readings', row)
     
-    def generate_cycle(self):
-        """Generate one cycle of data for all systems"""
-        print(f"\n{'='*70}")
-        print(f"Generating data at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"{'='*70}")
+    def save_flow_meter_batch(self, readings):
+        """Queue a vectorized tick of flow meter readings (column arrays)"""
+        columns = dict(readings)
+        columns['timestamp'] = self.clock.now()
+        return self.writer.add_columns('flow_meter_readings', columns, len(readings['meter_id']))
+    
+    def generate_cycle(self, verbose=True, flush=True, refresh_devices=True, weather_data=None):
+        """Generate one cycle of data for all systems and flush it in one batch
+        
+        Sharded workers receive weather_data from the coordinator so every shard
+        sees the same conditions; only the shard owning the station stores it.
+        """
+        cycle_start = time.perf_counter()
+        rows_before = self.writer.rows_written
+        
+        if verbose:
+            print(f"\n{'='*70}")
+            print(f"Generating data at {self.clock.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            print(f"{'='*70}")
+        
+        if refresh_devices or self.pole_sim.fleet is None:
+            self.refresh_devices()
         
         # Generate weather data
-        weather_data = self.save_weather_data()
+        if weather_data is None or self.owns('WS001'):
+            weather_data = self.save_weather_data(verbose=verbose, weather_data=weather_data)
         
         if weather_data:
-            # Generate energy data for all smart poles
-            print("\n[Smart Poles]")
-            poles = self.pole_sim.get_all_poles()
-            
-            for pole_id in poles:
-                energy_data = self.pole_sim.generate_energy_data(pole_id, weather_data)
-                if self.save_pole_energy_data(pole_id, energy_data):
-                    print(f"  {pole_id}: {energy_data['status'].upper()} - "
-                          f"Power={energy_data['power_consumption_w']:.2f}W, "
-                          f"Energy={energy_data['energy_kwh']:.4f}kWh")
+            # Generate energy data for all smart poles in one vectorized pass
+            if verbose:
+                print("\n[Smart Poles]")
+            energy_data = self.pole_sim.generate_batch(weather_data)
+            if self.save_pole_energy_batch(energy_data) and verbose:
+                status = np.asarray(energy_data['status'])
+                print(f"  {len(status)} poles ({int(np.sum(status == 'on'))} on): "
+                      f"Power={np.sum(energy_data['power_consumption_w']):.2f}W, "
+                      f"Energy={np.sum(energy_data['energy_kwh']):.4f}kWh")
             
-            # Generate power meter readings
-            print("\n[Power Meters]")
-            power_meters = self.power_meter_sim.get_all_meters()
+            # Generate power meter readings for the whole fleet in one vectorized pass
+            if verbose:
+                print("\n[Power Meters]")
+            readings = self.power_meter_sim.generate_batch()
+            if self.save_power_meter_batch(readings) and verbose:
+                three_phase = self.power_meter_sim.fleet['three_phase']
+                print(f"  {len(three_phase)} meters ({int(np.sum(three_phase))} 3-phase): "
+                      f"Power={np.sum(readings['power_w']):.2f}W, "
+                      f"Energy={np.sum(readings['energy_kwh']):.4f}kWh")
             
-            for meter_id in power_meters:
-                reading_data = self.power_meter_sim.generate_reading(meter_id)
-                if reading_data and self.save_power_meter_data(meter_id, reading_data):
-                    meter_info = self.power_meter_sim.get_meter_info(meter_id)
-                    print(f"  {meter_id} ({meter_info['meter_type']}): "
-                          f"Power={reading_data['power_w']:.2f}W, "
-                          f"Energy={reading_data['energy_kwh']:.4f}kWh")
-            
-            # Generate flow meter readings
-            print("\n[Flow Meters]")
-            flow_meters = self.flow_meter_sim.get_all_meters()
-            
-            for meter_id in flow_meters:
-                reading_data = self.flow_meter_sim.generate_reading(meter_id)
-                if reading_data and self.save_flow_meter_data(meter_id, reading_data):
-                    meter_info = self.flow_meter_sim.get_meter_info(meter_id)
-                    print(f"  {meter_id} ({meter_info['meter_type']}): "
-                          f"Flow={reading_data['flow_rate']:.3f} {meter_info['flow_unit']}, "
-                          f"Total={reading_data['total_volume']:.3f}")
-
+            # Generate flow meter readings for the whole fleet in one vectorized pass
+            if verbose:
+                print("\n[Flow Meters]")
+            readings = self.flow_meter_sim.generate_batch()
+            if self.save_flow_meter_batch(readings) and verbose:
+                fleet = self.flow_meter_sim.fleet
+                for meter_type in self.flow_meter_sim.meter_types:
+                    index = np.flatnonzero(fleet['meter_type'] == meter_type)
+                    if len(index):
+                        print(f"  {meter_type}: {len(index)} meters, "
+                              f"Flow={np.sum(readings['flow_rate'][index]):.3f} {fleet['flow_unit'][index[0]]}")
+        
+        if not flush:
+            return 0
+        
+        self.writer.flush()
+        
+        rows = self.writer.rows_written - rows_before
+        elapsed = time.perf_counter() - cycle_start
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        if verbose:
+            print(f"\n[Write] {rows} rows in {elapsed:.3f}s ({rate:,.0f} rows/sec, "
+                  f"batch size {self.writer.batch_size}, method {self.writer.method})")
+        return rows
+    
+    def refresh_devices(self):
+        """Recompile simulator fleets for device classes changed in the registry"""
+        if self.registry is None:
+            # Offline fleets are loaded once by initialize_offline
+            return set()
+        start = time.perf_counter()
+        if not self.registry.loaded_at:
+            # LISTEN before taking the snapshot, so a change committed in between is in the
+            # snapshot, notified, or both (refetching a device again is harmless) but never lost
+            if not self.registry.listen():
+                print("Device change notifications unavailable, "
+                      f"reloading registry every {self.registry.reload_seconds}s")
+            self.registry.load()
+        
+        changed = self.registry.poll()
+        if 'poles' in changed:
+            self.pole_sim.load_fleet(self.shard_rows(self.registry.pole_rows()),
+                                     self.shard_rows(self.registry.module_rows()))
+        if 'power_meters' in changed:
+            self.power_meter_sim.load_fleet(self.shard_rows(self.registry.power_meter_rows()))
+        if 'flow_meters' in changed:
+            self.flow_meter_sim.load_fleet(self.shard_rows(self.registry.flow_meter_rows()))
+        if changed:
+            self.metrics.stage_seconds.observe(time.perf_counter() - start, stage='registry_load')
+        return changed
+    
+    def shard_rows(self, rows):
+        """Keep the registry rows (device ID first) owned by this generator's shard"""
+        if self.shard is None:
+            return rows
+        return [row for row in rows if self.owns(row[0])]
+    
+    def generate_weather(self, interval_seconds=None):
+        """Queue one weather reading and keep it for the smart pole schedule"""
+        weather_data = self.save_weather_data(verbose=False)
+        if weather_data:
+            self.last_weather = weather_data
     
-    def run_continuous(self, interval_seconds=60):
-        """Run continuous data generation"""
-        print(f"\nStarting continuous data generation (interval: {interval_seconds}s)")
+    def generate_poles(self, interval_seconds=None):
+        """Queue one tick of smart pole energy data using the latest weather reading"""
+        if self.last_weather is None:
+            self.last_weather = self.weather_sim.generate_weather_data()
+        self.save_pole_energy_batch(self.pole_sim.generate_batch(self.last_weather))
+    
+    def generate_power_meters(self, meter_type=None, interval_seconds=None):
+        """Queue one tick of power meter readings, optionally for one meter type only"""
+        fleet = self.power_meter_sim.fleet
+        if meter_type is not None:
+            fleet = self.split_power_fleet()[meter_type]
+        self.save_power_meter_batch(self.power_meter_sim.generate_batch(fleet))
+    
+    def split_power_fleet(self):
+        """1-phase and 3-phase views of the power meter fleet, rebuilt when the fleet changes"""
+        fleet = self.power_meter_sim.fleet
+        if self.power_fleet_split is None or self.power_fleet_split[0] is not fleet:
+            three_phase = fleet['three_phase']
+            self.power_fleet_split = (fleet, {
+                '1-phase': {name: values[~three_phase] for name, values in fleet.items()},
+                '3-phase': {name: values[three_phase] for name, values in fleet.items()}
+            })
+        return self.power_fleet_split[1]
+    
+    def generate_flow_meters(self, meter_type=None, interval_seconds=None):
+        """Queue one tick of flow meter readings, optionally for one meter type only"""
+        index = None
+        if meter_type is not None:
+            index = np.flatnonzero(self.flow_meter_sim.fleet['meter_type'] == meter_type)
+        self.save_flow_meter_batch(self.flow_meter_sim.generate_batch(index, interval_seconds))
+    
+    def schedule_classes(self):
+        """Device classes that can be scheduled on their own interval"""
+        return (['weather', 'poles', 'power_1phase', 'power_3phase'] +
+                [f'flow_{meter_type}' for meter_type in self.flow_meter_sim.meter_types])
+    
+    def scheduled_jobs(self, default_interval, intervals):
+        """One scheduler job per device class, using its interval override if given"""
+        runs = {
+            'weather': self.generate_weather,
+            'poles': self.generate_poles,
+            'power_1phase': lambda interval: self.generate_power_meters('1-phase', interval),
+            'power_3phase': lambda interval: self.generate_power_meters('3-phase', interval)
+        }
+        for meter_type in self.flow_meter_sim.meter_types:
+            runs[f'flow_{meter_type}'] = (
+                lambda interval, meter_type=meter_type: self.generate_flow_meters(meter_type, interval)
+            )
+        
+        return [ScheduledJob(name, intervals.get(name, default_interval), runs[name])
+                for name in self.schedule_classes()]
+    
+    def set_clock(self, clock):
+        """Drive the generator and every simulator from the given clock"""
+        self.clock = clock
+        for simulator in (self.weather_sim, self.pole_sim, self.power_meter_sim, self.flow_meter_sim):
+            simulator.clock = clock
+    
+    def run_continuous(self, interval_seconds=60, intervals=None, metrics_port=None):
+        """Run continuous data generation with each device class on its own schedule
+        
+        intervals maps device classes (see schedule_classes) to their interval in
+        seconds; the others use interval_seconds. Pipeline metrics are served for
+        Prometheus at http://<host>:metrics_port/metrics (METRICS_PORT, 0 disables).
+        """
+        clock = SimulatedClock(datetime.now())
+        self.set_clock(clock)
+        jobs = self.scheduled_jobs(interval_seconds, intervals or {})
+        
+        # Keep future partitions ahead of the clock and expire old ones every hour
+        if self.partitions:
+            self.partitions.maintain()
+            jobs.append(ScheduledJob('partitions', 3600, lambda interval: self.partitions.maintain()))
+        scheduler = DriftFreeScheduler(self, clock, jobs,
+                                       report_seconds=max(60, max(job.interval_seconds for job in jobs)))
+        
+        if metrics_port is None:
+            metrics_port = int(os.getenv('METRICS_PORT', '9100'))
+        metrics_server = MetricsServer(self.metrics.registry, metrics_port) if metrics_port else None
+        if metrics_server and metrics_server.start():
+            print(f"Metrics available at http://localhost:{metrics_port}/metrics")
+        
+        print(f"\nStarting continuous data generation (default interval: {interval_seconds}s)")
+        for job in jobs:
+            print(f"  {job.name:<16} every {job.interval_seconds}s")
         print("Press Ctrl+C to stop\n")
         
         try:
-            while True:
-                self.generate_cycle()
-                time.sleep(interval_seconds)
+            asyncio.run(scheduler.run())
         except KeyboardInterrupt:
             print("\n\nStopping data generation...")
-            self.cleanup()
+        scheduler.print_summary()
+        if metrics_server:
+            metrics_server.stop()
+        self.cleanup()
+    
+    def run_backfill(self, start, end, step_seconds=60):
+        """Generate historical data from start to end on a simulated clock"""
+        clock = SimulatedClock(start)
+        self.set_clock(clock)
+        self.flow_meter_sim.interval_seconds = step_seconds
+        step = timedelta(seconds=step_seconds)
+        
+        total_ticks = max(1, int((end - start).total_seconds() // step_seconds))
+        progress_every = max(1, total_ticks // 20)
+        print(f"\nBackfilling {start} -> {end} every {step_seconds}s ({total_ticks} ticks)")
+        
+        # Daily partitions for the whole range, so rows do not pile up in the default partitions
+        created = self.partitions.ensure(start.date(), end.date()) if self.partitions else 0
+        if created:
+            print(f"Created {created} reading partitions")
+        
+        # The device fleet is loaded once for the whole backfill
+        self.refresh_devices()
+        
+        run_start = time.perf_counter()
+        ticks = 0
+        try:
+            while clock.now() < end:
+                # Rows accumulate across ticks and are written once batch_size is reached
+                self.generate_cycle(verbose=False, flush=False, refresh_devices=False)
+                clock.advance(step)
+                ticks += 1
+                
+                if ticks % progress_every == 0:
+                    elapsed = time.perf_counter() - run_start
+                    rate = self.writer.rows_written / elapsed if elapsed > 0 else 0.0
+                    print(f"  {clock.now():%Y-%m-%d %H:%M} {ticks}/{total_ticks} ticks, "
+                          f"{self.writer.rows_written} rows ({rate:,.0f} rows/sec)")
+        except KeyboardInterrupt:
+            print("\n\nStopping backfill...")
+        
+        self.writer.flush()
+        elapsed = time.perf_counter() - run_start
+        rate = self.writer.rows_written / elapsed if elapsed > 0 else 0.0
+        print(f"\nBackfill complete: {ticks} ticks, {self.writer.rows_written} rows "
+              f"in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
+        if self.writer.rows_failed:
+            print(f"Failed rows: {self.writer.rows_failed}")
+        self.cleanup()
+    
+    def provision_fleet(self, devices, seed=None):
+        """Bulk create a synthetic fleet of about devices poles, power meters and flow meters"""
+        poles, power_meters, flow_meters = split_fleet(devices)
+        print(f"\nProvisioning {poles} poles, {power_meters} power meters and {flow_meters} flow meters")
+        return FleetProvisioner(self.db, seed=seed).provision(poles, power_meters, flow_meters)
     
     def run_single(self):
         """Run single data generation cycle"""
@@ -242,7 +597,7 @@ class SmartCityDataGenerator:
         weather_query = """
             SELECT temperature_c, humidity_percent, pressure_hpa, 
                    wind_speed_ms, rainfall_mm, light_intensity_lux, timestamp
-            FROM weather_station
+            FROM weather_station_latest
             ORDER BY timestamp DESC
             LIMIT 1
         """
@@ -263,11 +618,10 @@ class SmartCityDataGenerator:
         
         # Latest energy data for each pole
         energy_query = """
-            SELECT DISTINCT ON (pole_id) 
-                pole_id, power_consumption_w, voltage_v, 
-                current_a, energy_kwh, status, timestamp
-            FROM smart_pole_energy
-            ORDER BY pole_id, timestamp DESC
+            SELECT pole_id, power_consumption_w, voltage_v,
+                   current_a, energy_kwh, status, timestamp
+            FROM smart_pole_energy_latest
+            ORDER BY pole_id
         """
         
         energy_data = self.db.fetch_all(energy_query)
@@ -285,11 +639,10 @@ class SmartCityDataGenerator:
         
         # Latest power meter readings
         power_meter_query = """
-            SELECT DISTINCT ON (pmr.meter_id)
-                pmr.meter_id, pm.meter_type, pmr.power_w, pmr.energy_kwh, pmr.timestamp
-            FROM power_meter_readings pmr
-            JOIN power_meters pm ON pmr.meter_id = pm.meter_id
-            ORDER BY pmr.meter_id, pmr.timestamp DESC
+            SELECT pml.meter_id, pm.meter_type, pml.power_w, pml.energy_kwh, pml.timestamp
+            FROM power_meter_readings_latest pml
+            JOIN power_meters pm ON pml.meter_id = pm.meter_id
+            ORDER BY pml.meter_id
         """
         
         power_meter_data = self.db.fetch_all(power_meter_query)
@@ -307,12 +660,11 @@ class SmartCityDataGenerator:
         
         # Latest flow meter readings
         flow_meter_query = """
-            SELECT DISTINCT ON (fmr.meter_id)
-                fmr.meter_id, fm.meter_type, fm.flow_unit, fmr.flow_rate, 
-                fmr.total_volume, fmr.timestamp
-            FROM flow_meter_readings fmr
-            JOIN flow_meters fm ON fmr.meter_id = fm.meter_id
-            ORDER BY fmr.meter_id, fmr.timestamp DESC
+            SELECT fml.meter_id, fm.meter_type, fm.flow_unit, fml.flow_rate,
+                   fml.total_volume, fml.timestamp
+            FROM flow_meter_readings_latest fml
+            JOIN flow_meters fm ON fml.meter_id = fm.meter_id
+            ORDER BY fml.meter_id
         """
         
         flow_meter_data = self.db.fetch_all(flow_meter_query)
@@ -399,8 +751,29 @@ class SmartCityDataGenerator:
     def cleanup(self):
         """Cleanup resources"""
         print("Cleaning up...")
+        if self.offline or self.db.conn:
+            self.writer.close()
+        self.print_sink_summary()
+        if self.spool_drainer:
+            if self.spool_drainer.thread.is_alive():
+                self.spool_drainer.stop()
+            spool = self.spool_drainer.spool
+            spool.close()
+            if spool.pending_bytes():
+                print(f"{spool.pending_bytes()} spooled bytes left in {spool.directory}, "
+                      f"replayed on the next start")
+        if self.registry:
+            self.registry.close()
+        if self.sink_db:
+            self.sink_db.disconnect()
         self.db.disconnect()
         print("Goodbye!")
+    
+    def print_sink_summary(self):
+        """Print per-sink rows, queue depth and backpressure when fanning out to several sinks"""
+        if isinstance(self.writer, FanoutSink):
+            print("\n[Sinks]")
+            self.writer.print_summary()
 
 def print_usage():
     """Print usage information"""
@@ -420,13 +793,38 @@ Commands:
     list-categories   List all device categories
     control           Control a smart pole (on/off/toggle)
     view              View latest data from all systems
+    backfill          Generate historical data on a simulated clock
+    provision         Bulk create a synthetic city fleet (default: 100000 devices)
+    partitions        Pre-create reading partitions, expire old ones and show their status
+    migrate-partitions  Move reading tables of a database created by an older init.sql to daily partitions
     api               Start REST API server (Swagger UI at http://localhost:8000/docs)
     help              Show this help message
 
+Options:
+    --batch-size N        Rows buffered before a bulk write (default: BATCH_SIZE or 5000)
+    --write-method M      Bulk write method: copy or insert (default: WRITE_METHOD or copy)
+    --from, --to          Backfill time range (ISO date or datetime, --to defaults to now)
+    --step S              Backfill step in seconds (default: 60)
+    --workers N           Shard generate/continuous/backfill across N processes (default: 1)
+    --seed N              Random seed of the generated readings, provision and the synthetic fleet
+                          used without PostgreSQL (the same seed gives the same data with any --workers)
+    --sink LIST           Output sinks for generate/continuous/backfill (default: postgres), e.g.
+                          postgres,parquet:data,ndjson (stdout) or ndjson:readings.ndjson.
+                          Without postgres no database is needed
+    --output-dir DIR      Directory of the parquet sink; alone it means --sink parquet:DIR
+    --devices N           Synthetic fleet size without PostgreSQL (default: 10000)
+    --intervals LIST      Per-class intervals for continuous, e.g. power_1phase=10,weather=60
+                          (classes: weather, poles, power_1phase, power_3phase,
+                          flow_water, flow_gas, flow_steam, flow_air; not with --workers)
+    --metrics-port N      Port of the Prometheus /metrics endpoint of continuous
+                          (default: METRICS_PORT or 9100, 0 disables; not with --workers)
+
 Examples:
     python main.py generate
     python main.py continuous
     python main.py continuous 30        # 30-second interval
+    python main.py continuous 10 --batch-size 20000 --write-method insert
+    python main.py continuous 60 --intervals power_1phase=10,power_3phase=10
     python main.py list
     python main.py list-power
     python main.py list-flow
@@ -435,11 +833,102 @@ Examples:
     python main.py control SP002 off
     python main.py control SP003 toggle
     python main.py view
+    python main.py backfill --from 2024-01-01 --to 2024-02-01 --step 60
+    python main.py backfill --from 2024-01-01 --workers 4
+    python main.py provision 1000000 --seed 42
+    python main.py backfill --from 2024-01-01 --to 2024-01-08 --output-dir data --devices 100000 --workers 4
+    python main.py continuous 10 --sink postgres,ndjson:readings.ndjson
+    python main.py partitions
     python main.py api                  # Start REST API with Swagger
     """)
 
+def pop_option(name, default=None):
+    """Remove a --name value option from sys.argv and return its value"""
+    flag = f'--{name}'
+    if flag not in sys.argv:
+        return default
+    index = sys.argv.index(flag)
+    if index + 1 >= len(sys.argv):
+        print(f"Missing value for {flag}")
+        sys.exit(1)
+    value = sys.argv[index + 1]
+    del sys.argv[index:index + 2]
+    return value
+
+def parse_backfill_range(backfill_from, backfill_to, backfill_step):
+    """Parse backfill options into (start, end, step seconds), or None if invalid"""
+    if not backfill_from:
+        print("Usage: python main.py backfill --from <datetime> [--to <datetime>] [--step <seconds>]")
+        print("Example: python main.py backfill --from 2024-01-01 --to 2024-02-01 --step 60")
+        return None
+    try:
+        start = datetime.fromisoformat(backfill_from)
+        end = datetime.fromisoformat(backfill_to) if backfill_to else datetime.now()
+        step = int(backfill_step)
+    except ValueError as e:
+        print(f"Invalid backfill option: {e}")
+        return None
+    if step <= 0 or end <= start:
+        print("Backfill requires --to after --from and a positive --step")
+        return None
+    return start, end, step
+
+def parse_interval(default=60):
+    """Interval argument of the continuous command"""
+    if len(sys.argv) > 2:
+        try:
+            return int(sys.argv[2])
+        except ValueError:
+            print(f"Invalid interval: {sys.argv[2]}. Using default ({default}s)")
+    return default
+
+def run_sharded(command, workers, batch_size, write_method, backfill_from, backfill_to, backfill_step,
+                output=None, seed=None):
+    """Run a generation command across worker processes that each own a shard of the fleet
+    
+    output is (sinks, devices) when the workers write to other sinks than
+    PostgreSQL alone.
+    """
+    from sharded_generator import ShardedGenerator
+    
+    coordinator = ShardedGenerator(
+        workers,
+        batch_size=int(batch_size) if batch_size else None,
+        write_method=write_method,
+        output=output,
+        seed=seed
+    )
+    
+    if command == 'generate':
+        coordinator.run_single()
+    elif command == 'continuous':
+        coordinator.run_continuous(parse_interval())
+    elif command == 'backfill':
+        backfill_range = parse_backfill_range(backfill_from, backfill_to, backfill_step)
+        if backfill_range:
+            # Partitions are created once up front rather than by every worker
+            db = DatabaseConnection()
+            if (not output or any(kind == 'postgres' for kind, _ in output[0])) and db.connect():
+                start, end, _ = backfill_range
+                PartitionManager(db).ensure(start.date(), end.date())
+                db.disconnect()
+            coordinator.run_backfill(*backfill_range)
+
 def main():
     """Main entry point"""
+    batch_size = pop_option('batch-size')
+    write_method = pop_option('write-method')
+    backfill_from = pop_option('from')
+    backfill_to = pop_option('to')
+    backfill_step = pop_option('step', '60')
+    workers = pop_option('workers', '1')
+    intervals = pop_option('intervals')
+    seed = pop_option('seed')
+    output_dir = pop_option('output-dir')
+    sink_option = pop_option('sink')
+    devices = pop_option('devices')
+    metrics_port = pop_option('metrics-port')
+    
     if len(sys.argv) < 2:
         command = 'continuous'
     else:
@@ -449,6 +938,20 @@ def main():
         print_usage()
         return
     
+    # Runs before the generator, which refuses to start on unpartitioned reading tables
+    if command == 'migrate-partitions':
+        db = DatabaseConnection()
+        if not db.connect():
+            print("Failed to connect to database. Make sure PostgreSQL is running.")
+            sys.exit(1)
+        migrated = PartitionManager(db).migrate()
+        db.disconnect()
+        if migrated is None:
+            sys.exit(1)
+        print(f"Migrated {len(migrated)} reading tables to daily partitions" if migrated
+              else "Reading tables are already partitioned")
+        return
+    
     # API command doesn't need generator
     if command == 'api':
         print("Starting REST API server...")
@@ -460,9 +963,57 @@ def main():
         uvicorn.run(app, host="0.0.0.0", port=8000)
         return
     
-    generator = SmartCityDataGenerator()
+    try:
+        workers = int(workers)
+        devices = int(devices) if devices else None
+        seed = int(seed) if seed else None
+        metrics_port = int(metrics_port) if metrics_port else None
+        sinks = parse_sinks(sink_option, output_dir) if sink_option or output_dir else None
+    except ValueError as e:
+        print(f"Invalid option: {e}")
+        sys.exit(1)
+    
+    # Only generation commands write to sinks
+    if sinks and command not in GENERATION_COMMANDS:
+        print("--sink and --output-dir only apply to generate, continuous and backfill")
+        sinks = None
+    
+    if sinks and ('ndjson', None) in sinks:
+        if workers > 1:
+            print("NDJSON on stdout cannot be shared by several workers; use --sink ndjson:PATH")
+            sys.exit(1)
+        # stdout carries the NDJSON stream, so progress messages go to stderr
+        sys.stdout = sys.stderr
+    
+    # Generation commands can be sharded across worker processes
+    if workers > 1 and command in GENERATION_COMMANDS:
+        # The coordinator runs every worker on one shared tick; workers serve no metrics
+        if intervals or metrics_port:
+            print("--intervals and --metrics-port cannot be used with --workers: sharded workers "
+                  "run every device class on one interval. Use one process for per-class intervals")
+            sys.exit(1)
+        # Shards draw from the same random streams (and build the same synthetic fleet
+        # without a database), so they need a shared seed
+        if seed is None:
+            seed = RandomStreams().seed
+        output = (sinks, devices) if sinks else None
+        run_sharded(command, workers, batch_size, write_method, backfill_from, backfill_to, backfill_step,
+                    output, seed)
+        return
+    
+    try:
+        generator = SmartCityDataGenerator(
+            batch_size=int(batch_size) if batch_size else None,
+            write_method=write_method,
+            sinks=sinks,
+            seed=seed,
+            spool=command in GENERATION_COMMANDS
+        )
+    except ValueError as e:
+        print(f"Invalid option: {e}")
+        sys.exit(1)
     
-    if not generator.initialize():
+    if not generator.initialize(devices):
         print("\nFailed to initialize. Please check:")
         print("1. PostgreSQL is running (docker compose up -d)")
         print("2. Database connection settings in .env file")
@@ -472,13 +1023,13 @@ def main():
         generator.run_single()
     
     elif command == 'continuous':
-        interval = 60
-        if len(sys.argv) > 2:
-            try:
-                interval = int(sys.argv[2])
-            except ValueError:
-                print(f"Invalid interval: {sys.argv[2]}. Using default (60s)")
-        generator.run_continuous(interval)
+        try:
+            class_intervals = parse_intervals(intervals, generator.schedule_classes())
+        except ValueError as e:
+            print(f"Invalid --intervals: {e}")
+            generator.cleanup()
+            return
+        generator.run_continuous(parse_interval(), class_intervals, metrics_port)
     
     elif command == 'list':
         generator.list_poles()
@@ -506,10 +1057,32 @@ def main():
             generator.control_pole(pole_id, action)
         generator.cleanup()
     
+    elif command == 'provision':
+        try:
+            devices = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+        except ValueError as e:
+            print(f"Invalid provision option: {e}")
+            generator.cleanup()
+            return
+        generator.provision_fleet(devices, seed)
+        generator.cleanup()
+    
+    elif command == 'partitions':
+        generator.partitions.maintain()
+        generator.partitions.print_status()
+        generator.cleanup()
+    
     elif command == 'view':
         generator.view_latest_data()
         generator.cleanup()
     
+    elif command == 'backfill':
+        backfill_range = parse_backfill_range(backfill_from, backfill_to, backfill_step)
+        if backfill_range:
+            generator.run_backfill(*backfill_range)
+        else:
+            generator.cleanup()
+    
     else:
         print(f"Unknown command: {command}")
         print_usage()
@@ -0,0 +1,282 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+# Upper bounds (seconds) of the stage duration histograms
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _number(value):
+    """Format a sample value"""
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _series(name, label_names, label_values, extra=()):
+    """Sample name with its labels, e.g. rows_total{table="weather_station"}"""
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return name
+    return name + '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+class Metric:
+    """A named metric with a fixed set of label names; values are kept per label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        """(series, value) pairs of every label combination"""
+        with self.lock:
+            return [(_series(self.name, self.label_names, key), value) for key, value in self.values.items()]
+
+    def render(self):
+        """Lines of this metric in the Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{series} {_number(value)}" for series, value in self.samples())
+        return lines
+
+class Counter(Metric):
+    """Monotonically increasing total"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+class Gauge(Metric):
+    """Current value that can go up and down
+
+    collect, if given, is called on every scrape and returns (label values, value)
+    pairs, for values that are cheaper to read than to keep up to date.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), collect=None):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        return [(_series(self.name, self.label_names, key), value) for key, value in self.collect()]
+
+class Histogram(Metric):
+    """Distribution of observed values over cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self):
+        """{label values: (count, sum, approximate p95)} of every label combination"""
+        with self.lock:
+            states = {key: (list(state['counts']), state['sum'], state['count'])
+                      for key, state in self.values.items()}
+        result = {}
+        for key, (counts, total, count) in states.items():
+            # Upper bound of the bucket holding the 95th percentile
+            target, seen, p95 = 0.95 * count, 0, math.inf
+            for bound, bucket in zip(self.buckets, counts):
+                seen += bucket
+                if seen >= target:
+                    p95 = bound
+                    break
+            result[key] = (count, total, p95)
+        return result
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            states = [(key, list(state['counts']), state['sum'], state['count'])
+                      for key, state in self.values.items()]
+        for key, counts, total, count in states:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                series = _series(f"{self.name}_bucket", self.label_names, key, [('le', _number(bound))])
+                lines.append(f"{series} {cumulative}")
+            lines.append(f"{_series(self.name + '_sum', self.label_names, key)} {_number(total)}")
+            lines.append(f"{_series(self.name + '_count', self.label_names, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Metrics of one process, rendered together for a scrape"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+class PipelineMetrics:
+    """Metrics of the generation pipeline: stage timings, rows per table, overruns and queues
+
+    Stages are 'registry_load' (fleet reloads after registry changes),
+    'db_write' (COPY/INSERT of readings), 'rollups', 'latest' and 'commit';
+    generation is timed per device class (scheduler job).
+    """
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.stage_seconds = self.registry.register(Histogram(
+            'smartcity_stage_duration_seconds', 'Duration of a pipeline stage', ('stage',)))
+        self.generation_seconds = self.registry.register(Histogram(
+            'smartcity_generation_duration_seconds',
+            'Time to generate and queue one tick of a device class (writes excluded)', ('device_class',)))
+        self.rows_written = self.registry.register(Counter(
+            'smartcity_rows_written_total', 'Rows written by a sink', ('sink', 'table')))
+        self.rows_failed = self.registry.register(Counter(
+            'smartcity_rows_failed_total', 'Rows a sink failed to write', ('sink', 'table')))
+        self.missed_deadlines = self.registry.register(Counter(
+            'smartcity_missed_deadlines_total', 'Deadlines a job skipped because it overran', ('device_class',)))
+        self.cycle_overrun = self.registry.register(Gauge(
+            'smartcity_cycle_overrun_seconds',
+            'How long a job has been behind schedule (0 when on time)', ('device_class',)))
+        self.queue_depth = None
+        self.pending_rows = None
+
+    def track_queues(self, queue_depth, pending_rows):
+        """Gauges of sink queue depth and rows awaiting a write, read on every scrape"""
+        self.queue_depth = self.registry.register(Gauge(
+            'smartcity_sink_queue_depth', 'Calls queued for a buffered sink thread', ('sink',), queue_depth))
+        self.pending_rows = self.registry.register(Gauge(
+            'smartcity_pending_rows', 'Rows buffered by a sink until its next write', ('sink',), pending_rows))
+
+    def track_spool(self, spool):
+        """Gauge of spooled bytes not replayed yet, read on every scrape"""
+        self.registry.register(Gauge(
+            'smartcity_spool_pending_bytes', 'Spooled bytes waiting to be replayed into the database',
+            collect=lambda: [((), spool.pending_bytes())]))
+
+    def stage(self, name):
+        """Context manager timing one stage"""
+        return self.stage_seconds.time(stage=name)
+
+    def count_rows(self, sink, table_counts, failed=False):
+        """Add rows written (or failed) per table"""
+        counter = self.rows_failed if failed else self.rows_written
+        for table, count in table_counts.items():
+            counter.inc(count, sink=sink, table=table)
+
+    def print_summary(self):
+        """Print stage timings and rows per table"""
+        print(f"  {'Stage':<24} {'Count':>8} {'Avg':>9} {'p95 <=':>9} {'Total':>9}")
+        for histogram, prefix in ((self.stage_seconds, ''), (self.generation_seconds, 'generate ')):
+            for (name,), (count, total, p95) in sorted(histogram.summary().items()):
+                average = total / count if count else 0.0
+                print(f"  {prefix + name:<24} {count:>8} {average:>8.3f}s {p95:>8.3f}s {total:>8.1f}s")
+        written, failed = dict(self.rows_written.values), dict(self.rows_failed.values)
+        if written or failed:
+            print(f"  {'Sink / table':<34} {'Written':>12} {'Failed':>8}")
+            for sink, table in sorted(set(written) | set(failed)):
+                print(f"  {sink + ' / ' + table:<34} {written.get((sink, table), 0):>12} "
+                      f"{failed.get((sink, table), 0):>8}")
+
+class MetricsServer:
+    """Serve a metrics registry at /metrics from a background HTTP thread"""
+
+    def __init__(self, registry, port, host='0.0.0.0'):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        """Start serving; returns False if the port cannot be bound"""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes would flood the generator's output
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            print(f"Metrics endpoint unavailable on port {self.port}: {e}")
+            return False
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop serving"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,27 @@
+from datetime import datetime
+import base64
+import binascii
+import json
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+def encode_cursor(*values):
+    """Opaque cursor holding the sort key of the last row of a page"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    text = json.dumps(payload, separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, *types):
+    """Decode a cursor into a tuple of values converted with types (datetime, int, str)"""
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(text)
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise ValueError('wrong number of values')
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, payload)
+        )
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise InvalidCursorError('Invalid cursor') from e
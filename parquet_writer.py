@@ -0,0 +1,254 @@
+from batch_writer import TABLE_COLUMNS, table_counts
+from rollups import GROUP_COLUMN
+import pyarrow as pa
+import pyarrow.parquet as pq
+import numpy as np
+import os
+import time
+
+# Reading tables partitioned by meter type below the date partition
+GROUPED_TABLES = ('power_meter_readings', 'flow_meter_readings')
+
+# Hive's directory name for a NULL partition value (rows queued without a meter type)
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+ID_COLUMNS = ('station_id', 'pole_id', 'meter_id')
+STRING_COLUMNS = ID_COLUMNS + ('status',)
+INTEGER_COLUMNS = ('wind_direction_deg', 'light_intensity_lux')
+
+def table_schema(table):
+    """Arrow schema of a reading table's Parquet files"""
+    fields = []
+    for name in TABLE_COLUMNS[table]:
+        if name == 'timestamp':
+            kind = pa.timestamp('us')
+        elif name in STRING_COLUMNS:
+            kind = pa.string()
+        elif name in INTEGER_COLUMNS:
+            kind = pa.int64()
+        else:
+            kind = pa.float64()
+        fields.append(pa.field(name, kind))
+    return pa.schema(fields)
+
+def arrow_column(values, count, kind):
+    """A column array, list or repeated scalar as an Arrow array (NaN becomes null)"""
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind in 'fiub':
+            return pa.array(values, type=kind, from_pandas=True)
+        if values.dtype.kind == 'M':
+            return pa.array(values.astype('datetime64[us]'), type=kind)
+        return pa.array(values.tolist(), type=kind)
+    if isinstance(values, (list, tuple)):
+        return pa.array(values, type=kind, from_pandas=True)
+    return pa.array([values] * count, type=kind, from_pandas=True)
+
+def _partitions(days, groups):
+    """Split a chunk into (day, group, row indices) partitions"""
+    day_values, day_index = np.unique(days, return_inverse=True)
+    if groups is None:
+        group_values, group_index = [None], np.zeros(len(days), dtype=np.intp)
+    else:
+        group_values, group_index = np.unique(np.asarray(groups).astype(str), return_inverse=True)
+
+    key = day_index * len(group_values) + group_index
+    order = np.argsort(key, kind='stable')
+    for indices in np.split(order, np.flatnonzero(np.diff(key[order])) + 1):
+        first = key[indices[0]]
+        yield str(day_values[first // len(group_values)]), group_values[first % len(group_values)], indices
+
+class ParquetDatasetWriter:
+    """Buffer generated rows per table and write them to a partitioned Parquet dataset
+
+    Files are laid out as <root>/<table>/date=YYYY-MM-DD/[meter_type=<type>/]part-*.parquet.
+    Rows of each partition are buffered until row_group_rows are pending and then
+    written as one row group, with dictionary-encoded device IDs and column
+    statistics. A partition's file is closed once the clock has moved to a later
+    day (or the file holds file_rows rows), so memory stays bounded during long
+    backfills. Has the same add/add_columns/flush interface as BatchWriter.
+    """
+
+    def __init__(self, root, batch_size=5000, row_group_rows=None, file_rows=None,
+                 compression=None, file_prefix='', metrics=None):
+        self.root = root
+        self.batch_size = max(1, int(batch_size))
+        self.method = 'parquet'
+        self.row_group_rows = row_group_rows or int(os.getenv('PARQUET_ROW_GROUP_ROWS', '500000'))
+        self.file_rows = file_rows or int(os.getenv('PARQUET_FILE_ROWS', '10000000'))
+        self.compression = compression or os.getenv('PARQUET_COMPRESSION', 'zstd')
+
+        # Distinguishes the files of parallel writers (e.g. one per shard)
+        self.file_prefix = file_prefix
+        self.files_written = 0
+
+        self.schemas = {table: table_schema(table) for table in TABLE_COLUMNS}
+
+        # PipelineMetrics receiving rows per table (optional)
+        self.metrics = metrics
+
+        # Pending rows and column blocks per table, as in BatchWriter
+        self.pending = {}
+        self.pending_blocks = {}
+        self.pending_count = 0
+
+        # Per (table, day, group) partition: buffered Arrow tables and the open file
+        self.buffers = {}
+        self.buffered_rows = {}
+        self.writers = {}
+        self.file_row_counts = {}
+
+        # Throughput statistics
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.write_seconds = 0.0
+
+    def add(self, table, row):
+        """Queue one row; flushes automatically once batch_size rows are pending"""
+        self.pending.setdefault(table, []).append(row)
+        self.pending_count += 1
+
+        if self.pending_count >= self.batch_size:
+            return self.flush()
+        return True
+
+    def add_columns(self, table, columns, count):
+        """Queue a block of count rows given as column arrays keyed by column name"""
+        if count == 0:
+            return True
+
+        self.pending_blocks.setdefault(table, []).append(
+            ([columns[name] for name in TABLE_COLUMNS[table]], count, columns.get(GROUP_COLUMN))
+        )
+        self.pending_count += count
+
+        if self.pending_count >= self.batch_size:
+            return self.flush()
+        return True
+
+    def flush(self):
+        """Move pending rows into their partitions and write every full row group"""
+        if self.pending_count == 0:
+            return True
+
+        pending, blocks, count = self.pending, self.pending_blocks, self.pending_count
+        self.pending = {}
+        self.pending_blocks = {}
+        self.pending_count = 0
+
+        start = time.perf_counter()
+        try:
+            latest = {}
+            for table, rows in pending.items():
+                values = list(zip(*rows))
+                latest[table] = self._partition(table, values, len(rows), None)
+            for table, table_blocks in blocks.items():
+                for values, block_count, groups in table_blocks:
+                    day = self._partition(table, values, block_count, groups)
+                    latest[table] = max(day, latest.get(table, day))
+
+            for key in [key for key, rows in self.buffered_rows.items() if rows >= self.row_group_rows]:
+                self._write(key)
+
+            # Generation moves forward in time, so partitions of earlier days are complete
+            open_keys = set(self.buffers) | set(self.writers)
+            for key in [key for key in open_keys if key[0] in latest and key[1] < latest[key[0]]]:
+                self._close(key)
+
+            self.rows_written += count
+            if self.metrics:
+                self.metrics.count_rows('parquet', table_counts(pending, blocks))
+            return True
+        except Exception as e:
+            print(f"Error writing batch of {count} rows to Parquet: {e}")
+            self.rows_failed += count
+            if self.metrics:
+                self.metrics.count_rows('parquet', table_counts(pending, blocks), failed=True)
+            return False
+        finally:
+            self.write_seconds += time.perf_counter() - start
+
+    def _partition(self, table, values, count, groups):
+        """Append one chunk to the buffers of its partitions; returns its latest day"""
+        schema = self.schemas[table]
+        chunk = pa.Table.from_arrays(
+            [arrow_column(column, count, field.type) for column, field in zip(values, schema)],
+            schema=schema
+        )
+        timestamps = values[TABLE_COLUMNS[table].index('timestamp')]
+        if isinstance(timestamps, (np.ndarray, list, tuple)):
+            days = np.array(timestamps, dtype='datetime64[us]').astype('datetime64[D]')
+        else:
+            days = np.full(count, np.datetime64(timestamps, 'D'))
+        if table in GROUPED_TABLES and groups is None:
+            groups = np.full(count, NULL_PARTITION, dtype=object)
+        elif table not in GROUPED_TABLES:
+            groups = None
+        elif not isinstance(groups, (np.ndarray, list, tuple)):
+            groups = np.full(count, groups, dtype=object)
+
+        for day, group, indices in _partitions(days, groups):
+            key = (table, day, group)
+            part = chunk if len(indices) == count else chunk.take(pa.array(indices))
+            self.buffers.setdefault(key, []).append(part)
+            self.buffered_rows[key] = self.buffered_rows.get(key, 0) + len(indices)
+        return str(days.max())
+
+    def _path(self, key):
+        """Path of the next file of a partition"""
+        table, day, group = key
+        directory = os.path.join(self.root, table, f"date={day}")
+        if group is not None:
+            directory = os.path.join(directory, f"{GROUP_COLUMN}={group}")
+        os.makedirs(directory, exist_ok=True)
+        self.files_written += 1
+        return os.path.join(directory, f"part-{self.file_prefix}{self.files_written:05d}.parquet")
+
+    def _write(self, key):
+        """Write a partition's buffered rows as row groups of up to row_group_rows"""
+        parts = self.buffers.pop(key, None)
+        self.buffered_rows.pop(key, None)
+        if not parts:
+            return
+
+        writer = self.writers.get(key)
+        if writer is None:
+            columns = TABLE_COLUMNS[key[0]]
+            writer = pq.ParquetWriter(
+                self._path(key), self.schemas[key[0]],
+                compression=self.compression,
+                use_dictionary=[name for name in columns if name in STRING_COLUMNS],
+                write_statistics=True
+            )
+            self.writers[key] = writer
+            self.file_row_counts[key] = 0
+
+        data = pa.concat_tables(parts)
+        writer.write_table(data, row_group_size=self.row_group_rows)
+        self.file_row_counts[key] += data.num_rows
+        if self.file_row_counts[key] >= self.file_rows:
+            writer.close()
+            del self.writers[key]
+
+    def _close(self, key):
+        """Write a partition's remaining rows and close its file"""
+        self._write(key)
+        writer = self.writers.pop(key, None)
+        if writer is not None:
+            writer.close()
+
+    def close(self):
+        """Flush pending rows and close every partition file"""
+        self.flush()
+        for key in set(self.buffers) | set(self.writers):
+            self._close(key)
+
+    def stats(self):
+        """Write counters of this sink"""
+        return {'rows_written': self.rows_written, 'rows_failed': self.rows_failed,
+                'write_seconds': self.write_seconds, 'files_written': self.files_written}
+
+    def rows_per_second(self):
+        """Average write throughput since the writer was created"""
+        if self.write_seconds <= 0:
+            return 0.0
+        return self.rows_written / self.write_seconds
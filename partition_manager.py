@@ -0,0 +1,206 @@
+from datetime import date, timedelta
+from batch_writer import TABLE_COLUMNS
+from latest import LATEST_TABLES
+from rollups import ROLLUP_METRICS
+import os
+import re
+
+# Reading tables partitioned by day in init.sql, with their default retention in days (0 keeps everything)
+READING_TABLES = {
+    'weather_station': 365,
+    'smart_pole_energy': 90,
+    'power_meter_readings': 90,
+    'flow_meter_readings': 90
+}
+
+EXPIRE_ACTIONS = {'drop': 'dropped', 'detach': 'detached'}
+
+# Schema script re-run by migrate to create the partitioned tables (sample data is in seed.sql)
+INIT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init.sql')
+
+# Suffix of a legacy table (and its indexes) while migrate copies it
+LEGACY_SUFFIX = '_unpartitioned'
+
+class PartitionManager:
+    """Pre-create daily reading partitions and drop or detach the expired ones"""
+
+    def __init__(self, db_connection, premake_days=None, retention_days=None, expire_action=None):
+        self.db = db_connection
+        self.premake_days = premake_days if premake_days is not None else int(
+            os.getenv('PARTITION_PREMAKE_DAYS', '7'))
+
+        # Per-table retention, overridable with RETENTION_DAYS_<TABLE> (e.g. RETENTION_DAYS_WEATHER_STATION)
+        self.retention_days = {
+            table: int(os.getenv(f'RETENTION_DAYS_{table.upper()}', str(days)))
+            for table, days in READING_TABLES.items()
+        }
+        if retention_days:
+            self.retention_days.update(retention_days)
+
+        self.expire_action = expire_action or os.getenv('PARTITION_EXPIRE_ACTION', 'drop')
+        if self.expire_action not in EXPIRE_ACTIONS:
+            raise ValueError(f"Invalid expire action: {self.expire_action}. Use 'drop' or 'detach'")
+
+    def is_partitioned(self, table):
+        """Whether a reading table was created partitioned (databases initialized before are not)"""
+        return bool(self.db.fetch_one(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", (table,)
+        ))
+
+    def unpartitioned_tables(self):
+        """Reading tables that exist but were created unpartitioned by an older init.sql"""
+        rows = self.db.fetch_all("""
+            SELECT relname FROM pg_class
+            WHERE relname = ANY(%s) AND relkind = 'r' AND relnamespace = to_regnamespace(current_schema())
+        """, (list(READING_TABLES),))
+        plain = {name for (name,) in rows}
+        return [table for table in READING_TABLES if table in plain]
+
+    def migrate(self, init_script=INIT_SCRIPT):
+        """Move unpartitioned reading tables to daily partitions in one transaction
+
+        Each legacy table and its indexes are renamed, init.sql (schema only,
+        idempotent) is re-run to create the partitioned tables, partitions are
+        created for the days holding data, the rows are copied, the id sequence
+        is moved past the copied ids, the legacy table is dropped and the latest
+        values are seeded from the copied rows. Returns the migrated tables, or
+        None if the migration failed and was rolled back.
+        """
+        legacy = self.unpartitioned_tables()
+        if not legacy:
+            return []
+        try:
+            for table in legacy:
+                self.db.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() "
+                                "AND tablename = %s", (table,))
+                for (index,) in self.db.cursor.fetchall():
+                    self.db.execute(f"ALTER INDEX {index} RENAME TO {index[:63 - len(LEGACY_SUFFIX)]}{LEGACY_SUFFIX}")
+                self.db.execute(f"ALTER TABLE {table} RENAME TO {table}{LEGACY_SUFFIX}")
+
+            with open(init_script, encoding='utf-8') as stream:
+                self.db.execute(stream.read())
+
+            for table in legacy:
+                source = f"{table}{LEGACY_SUFFIX}"
+                self.db.execute("SELECT column_name FROM information_schema.columns "
+                                "WHERE table_schema = current_schema() AND table_name = %s "
+                                "AND column_name IN (SELECT column_name FROM information_schema.columns "
+                                "WHERE table_schema = current_schema() AND table_name = %s) "
+                                "ORDER BY ordinal_position", (source, table))
+                columns = ', '.join(name for (name,) in self.db.cursor.fetchall())
+                self.db.execute(f"SELECT min(timestamp)::date, max(timestamp)::date FROM {source}")
+                first_day, last_day = self.db.cursor.fetchone()
+                if first_day is not None:
+                    self.db.execute("SELECT create_daily_partitions(%s, %s, %s)", (table, first_day, last_day))
+                self.db.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {source}")
+                copied = self.db.cursor.rowcount
+                self.db.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                                f"GREATEST((SELECT max(id) FROM {table}), 1))", (table,))
+                self.db.execute(f"DROP TABLE {source}")
+
+                # init.sql seeded the latest values from the still empty new table
+                device_column = ROLLUP_METRICS[table][0]
+                latest_columns = ', '.join(TABLE_COLUMNS[table])
+                self.db.execute(f"""
+                    INSERT INTO {LATEST_TABLES[table]} ({latest_columns})
+                    SELECT DISTINCT ON ({device_column}) {latest_columns} FROM {table}
+                    WHERE {device_column} IS NOT NULL ORDER BY {device_column}, timestamp DESC
+                    ON CONFLICT ({device_column}) DO NOTHING
+                """)
+                print(f"[Partitions] migrated {table}: {copied} rows"
+                      + (f" from {first_day} to {last_day}" if first_day is not None else ""))
+            self.db.commit()
+        except Exception as e:
+            print(f"Error migrating reading tables to partitions: {e}")
+            self.db.rollback()
+            return None
+        return legacy
+
+    def partitions(self, table):
+        """Daily partitions of a table as {day: partition name}, ordered by day"""
+        rows = self.db.fetch_all("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+        """, (table,))
+
+        pattern = re.compile(rf'^{table}_p(\d{{4}})(\d{{2}})(\d{{2}})$')
+        days = {}
+        for (name,) in rows:
+            match = pattern.match(name)
+            if match:
+                days[date(*map(int, match.groups()))] = name
+        return dict(sorted(days.items()))
+
+    def ensure(self, first_day, last_day, tables=None):
+        """Create any missing daily partitions from first_day to last_day (inclusive)"""
+        created = 0
+        for table in tables or READING_TABLES:
+            if not self.is_partitioned(table):
+                continue
+            result = self.db.fetch_one("SELECT create_daily_partitions(%s, %s, %s)",
+                                       (table, first_day, last_day))
+            if result is None:
+                print(f"Could not create partitions for {table}")
+                self.db.rollback()
+                continue
+            self.db.commit()
+            created += result[0]
+        return created
+
+    def expire(self, today=None):
+        """Drop (or detach) partitions that ended before each table's retention window"""
+        today = today or date.today()
+        expired = []
+        for table, days in self.retention_days.items():
+            if days <= 0 or not self.is_partitioned(table):
+                continue
+            cutoff = today - timedelta(days=days)
+            for day, name in self.partitions(table).items():
+                if day >= cutoff:
+                    break
+                try:
+                    if self.expire_action == 'drop':
+                        self.db.execute(f"DROP TABLE {name}")
+                    else:
+                        self.db.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                    self.db.commit()
+                    expired.append(name)
+                except Exception as e:
+                    print(f"Error expiring partition {name}: {e}")
+                    self.db.rollback()
+        return expired
+
+    def maintain(self, today=None, verbose=True):
+        """Pre-create the next premake_days of partitions and expire old ones"""
+        today = today or date.today()
+        created = self.ensure(today, today + timedelta(days=self.premake_days))
+        expired = self.expire(today)
+        if verbose and (created or expired):
+            print(f"[Partitions] created {created}, {EXPIRE_ACTIONS[self.expire_action]} {len(expired)}"
+                  + (f": {', '.join(expired)}" if expired else ""))
+        return created, expired
+
+    def default_rows(self, table):
+        """Rows that fell outside the daily partitions"""
+        result = self.db.fetch_one(f"SELECT COUNT(*) FROM {table}_default")
+        return result[0] if result else 0
+
+    def print_status(self):
+        """Print partition coverage and retention per reading table"""
+        print(f"\n{'='*90}")
+        print(f"{'Table':<24} {'Partitions':>10} {'First day':>12} {'Last day':>12} "
+              f"{'Default rows':>13} {'Retention':>10}")
+        print(f"{'='*90}")
+        for table in READING_TABLES:
+            retention = f"{self.retention_days[table]}d" if self.retention_days[table] > 0 else 'forever'
+            if not self.is_partitioned(table):
+                print(f"{table:<24} {'not partitioned':>36}")
+                continue
+            days = list(self.partitions(table))
+            first = str(days[0]) if days else '-'
+            last = str(days[-1]) if days else '-'
+            print(f"{table:<24} {len(days):>10} {first:>12} {last:>12} "
+                  f"{self.default_rows(table):>13} {retention:>10}")
+        print(f"{'='*90}\n")
@@ -1,18 +1,23 @@
-import random
-from datetime import datetime
-import math
+import numpy as np
+from sim_clock import SystemClock
+from random_streams import RandomStreams
 
 class PowerMeterSimulator:
     """Simulate realistic power meter readings for 1-phase and 3-phase meters"""
     
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, clock=None, streams=None):
         self.db = db_connection
+        self.clock = clock or SystemClock()
         # Typical power consumption patterns for different room types
         self.room_patterns = {
             'office': {'base': 500, 'peak': 1500, 'variation': 0.2},
             'room': {'base': 200, 'peak': 800, 'variation': 0.25},
             'main_panel': {'base': 5000, 'peak': 15000, 'variation': 0.15}
         }
+        self.streams = streams or RandomStreams()
+        
+        # Compiled column arrays of active meters (see load_fleet)
+        self.fleet = None
     
     def get_meter_info(self, meter_id):
         """Get meter information"""
@@ -34,7 +39,7 @@ class PowerMeterSimulator:
     
     def get_time_factor(self):
         """Get time-based factor for power consumption"""
-        hour = datetime.now().hour
+        hour = self.clock.now().hour
         
         # Business hours pattern (8 AM - 6 PM)
         if 8 <= hour < 18:
@@ -63,106 +68,103 @@ class PowerMeterSimulator:
         else:
             return 'room'
     
-    def generate_1phase_reading(self, meter_id, meter_info):
-        """Generate 1-phase power meter reading"""
-        room_type = self.determine_room_type(meter_info['room_name'])
-        pattern = self.room_patterns[room_type]
-        
-        time_factor = self.get_time_factor()
-        
-        # Calculate power consumption
-        base_power = pattern['base'] + (pattern['peak'] - pattern['base']) * time_factor
-        variation = random.uniform(1 - pattern['variation'], 1 + pattern['variation'])
-        power_w = base_power * variation
-        
-        # Electrical parameters for 1-phase (230V Thailand)
-        voltage_v = random.uniform(220, 240)
-        power_factor = random.uniform(0.85, 0.95)
-        current_a = power_w / (voltage_v * power_factor)
-        frequency_hz = random.uniform(49.9, 50.1)
-        
-        # Energy (kWh for 1 hour interval)
-        energy_kwh = power_w / 1000.0
+    def compile_fleet(self, rows):
+        """Compile (meter_id, meter_type, room_name) rows into column arrays"""
+        rows = [row for row in rows if row[1] in ('1-phase', '3-phase')]
+        room_types = list(self.room_patterns)
+        room_index = np.array(
+            [room_types.index(self.determine_room_type(row[2])) for row in rows],
+            dtype=np.intp
+        )
+        # Pattern lookup tables indexed by room type
+        base = np.array([self.room_patterns[t]['base'] for t in room_types], dtype=np.float64)
+        peak = np.array([self.room_patterns[t]['peak'] for t in room_types], dtype=np.float64)
+        variation = np.array([self.room_patterns[t]['variation'] for t in room_types], dtype=np.float64)
         
         return {
-            'voltage_v': round(voltage_v, 2),
-            'current_a': round(current_a, 4),
-            'power_w': round(power_w, 2),
-            'power_factor': round(power_factor, 3),
-            'energy_kwh': round(energy_kwh, 4),
-            'frequency_hz': round(frequency_hz, 2),
-            'voltage_l1_v': None,
-            'voltage_l2_v': None,
-            'voltage_l3_v': None,
-            'current_l1_a': None,
-            'current_l2_a': None,
-            'current_l3_a': None,
-            'power_l1_w': None,
-            'power_l2_w': None,
-            'power_l3_w': None
+            'meter_id': np.array([row[0] for row in rows], dtype=object),
+            'meter_type': np.array([row[1] for row in rows], dtype=object),
+            'stream_key': self.streams.device_keys([row[0] for row in rows]),
+            'three_phase': np.array([row[1] == '3-phase' for row in rows], dtype=bool),
+            'base': base[room_index],
+            'peak': peak[room_index],
+            'variation': variation[room_index]
         }
     
-    def generate_3phase_reading(self, meter_id, meter_info):
-        """Generate 3-phase power meter reading"""
-        room_type = self.determine_room_type(meter_info['room_name'])
-        pattern = self.room_patterns[room_type]
+    def load_fleet(self, rows=None):
+        """Load all active meters once and compile them for vectorized generation"""
+        if rows is None:
+            query = """
+                SELECT meter_id, meter_type, room_name
+                FROM power_meters
+                WHERE status = 'active'
+                ORDER BY meter_id
+            """
+            rows = self.db.fetch_all(query)
+        self.fleet = self.compile_fleet(rows)
+        return len(self.fleet['meter_id'])
+    
+    def generate_batch(self, fleet=None):
+        """Generate one tick of readings for every meter in the fleet as column arrays
+        
+        1-phase meters get NaN in the per-phase columns (written as NULL).
+        """
+        fleet = fleet if fleet is not None else self.fleet
+        three_phase = fleet['three_phase']
+        rng = self.streams.at(fleet['stream_key'], self.clock.now())
         
         time_factor = self.get_time_factor()
         
         # Calculate total power consumption
-        base_power = pattern['base'] + (pattern['peak'] - pattern['base']) * time_factor
-        variation = random.uniform(1 - pattern['variation'], 1 + pattern['variation'])
-        total_power_w = base_power * variation
+        base_power = fleet['base'] + (fleet['peak'] - fleet['base']) * time_factor
+        variation = rng.uniform(1 - fleet['variation'], 1 + fleet['variation'], 'variation')
+        power_w = base_power * variation
         
         # Distribute power across three phases (slightly unbalanced)
-        phase_distribution = [
-            random.uniform(0.30, 0.35),
-            random.uniform(0.30, 0.35),
-            random.uniform(0.30, 0.35)
-        ]
-        # Normalize to ensure sum equals 1
-        total = sum(phase_distribution)
-        phase_distribution = [p / total for p in phase_distribution]
-        
-        power_l1_w = total_power_w * phase_distribution[0]
-        power_l2_w = total_power_w * phase_distribution[1]
-        power_l3_w = total_power_w * phase_distribution[2]
-        
-        # Electrical parameters for 3-phase (400V line-to-line, 230V line-to-neutral)
-        voltage_l1_v = random.uniform(220, 240)
-        voltage_l2_v = random.uniform(220, 240)
-        voltage_l3_v = random.uniform(220, 240)
-        
-        power_factor = random.uniform(0.85, 0.95)
-        
-        current_l1_a = power_l1_w / (voltage_l1_v * power_factor)
-        current_l2_a = power_l2_w / (voltage_l2_v * power_factor)
-        current_l3_a = power_l3_w / (voltage_l3_v * power_factor)
-        
-        # Average values
-        voltage_v = (voltage_l1_v + voltage_l2_v + voltage_l3_v) / 3
-        current_a = (current_l1_a + current_l2_a + current_l3_a)
-        frequency_hz = random.uniform(49.9, 50.1)
+        phase_distribution = rng.uniform(0.30, 0.35, ('phase_l1', 'phase_l2', 'phase_l3'))
+        phase_distribution /= phase_distribution.sum(axis=1, keepdims=True)
+        phase_power = power_w[:, None] * phase_distribution
+        
+        # Electrical parameters (230V Thailand, L1 doubles as the 1-phase voltage)
+        phase_voltage = rng.uniform(220, 240, ('voltage_l1', 'voltage_l2', 'voltage_l3'))
+        power_factor = rng.uniform(0.85, 0.95, 'power_factor')
+        frequency_hz = rng.uniform(49.9, 50.1, 'frequency')
+        phase_current = phase_power / (phase_voltage * power_factor[:, None])
+        
+        voltage_v = np.where(three_phase, phase_voltage.mean(axis=1), phase_voltage[:, 0])
+        current_a = np.where(
+            three_phase,
+            phase_current.sum(axis=1),
+            power_w / (phase_voltage[:, 0] * power_factor)
+        )
+        
+        # Per-phase columns only apply to 3-phase meters
+        single = ~three_phase[:, None]
+        phase_voltage[np.broadcast_to(single, phase_voltage.shape)] = np.nan
+        phase_current[np.broadcast_to(single, phase_current.shape)] = np.nan
+        phase_power[np.broadcast_to(single, phase_power.shape)] = np.nan
         
         # Energy (kWh for 1 hour interval)
-        energy_kwh = total_power_w / 1000.0
+        energy_kwh = power_w / 1000.0
         
         return {
-            'voltage_v': round(voltage_v, 2),
-            'current_a': round(current_a, 4),
-            'power_w': round(total_power_w, 2),
-            'power_factor': round(power_factor, 3),
-            'energy_kwh': round(energy_kwh, 4),
-            'frequency_hz': round(frequency_hz, 2),
-            'voltage_l1_v': round(voltage_l1_v, 2),
-            'voltage_l2_v': round(voltage_l2_v, 2),
-            'voltage_l3_v': round(voltage_l3_v, 2),
-            'current_l1_a': round(current_l1_a, 4),
-            'current_l2_a': round(current_l2_a, 4),
-            'current_l3_a': round(current_l3_a, 4),
-            'power_l1_w': round(power_l1_w, 2),
-            'power_l2_w': round(power_l2_w, 2),
-            'power_l3_w': round(power_l3_w, 2)
+            'meter_id': fleet['meter_id'],
+            'meter_type': fleet['meter_type'],
+            'voltage_v': np.round(voltage_v, 2),
+            'current_a': np.round(current_a, 4),
+            'power_w': np.round(power_w, 2),
+            'power_factor': np.round(power_factor, 3),
+            'energy_kwh': np.round(energy_kwh, 4),
+            'frequency_hz': np.round(frequency_hz, 2),
+            'voltage_l1_v': np.round(phase_voltage[:, 0], 2),
+            'voltage_l2_v': np.round(phase_voltage[:, 1], 2),
+            'voltage_l3_v': np.round(phase_voltage[:, 2], 2),
+            'current_l1_a': np.round(phase_current[:, 0], 4),
+            'current_l2_a': np.round(phase_current[:, 1], 4),
+            'current_l3_a': np.round(phase_current[:, 2], 4),
+            'power_l1_w': np.round(phase_power[:, 0], 2),
+            'power_l2_w': np.round(phase_power[:, 1], 2),
+            'power_l3_w': np.round(phase_power[:, 2], 2)
         }
     
     def generate_reading(self, meter_id):
@@ -172,9 +174,15 @@ class PowerMeterSimulator:
         if not meter_info or meter_info['status'] != 'active':
             return None
         
-        if meter_info['meter_type'] == '1-phase':
-            return self.generate_1phase_reading(meter_id, meter_info)
-        elif meter_info['meter_type'] == '3-phase':
-            return self.generate_3phase_reading(meter_id, meter_info)
+        fleet = self.compile_fleet([(meter_id, meter_info['meter_type'], meter_info['room_name'])])
+        if len(fleet['meter_id']) == 0:
+            return None
         
-        return None
+        batch = self.generate_batch(fleet)
+        reading = {}
+        for name, values in batch.items():
+            if name in ('meter_id', 'meter_type'):
+                continue
+            value = float(values[0])
+            reading[name] = None if np.isnan(value) else value
+        return reading
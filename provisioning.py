@@ -0,0 +1,298 @@
+import numpy as np
+import json
+import time
+
+# Share of the requested device count per device class
+FLEET_SHARES = {'poles': 0.40, 'power_meters': 0.45, 'flow_meters': 0.15}
+
+# Provisioned devices get their own ID prefixes so they never collide with the sample data in seed.sql
+POLE_PREFIX = 'SPC'
+POWER_PREFIXES = {'1-phase': 'PM1PC', '3-phase': 'PM3PC'}
+FLOW_PREFIX = 'FMC'
+ID_DIGITS = 7
+
+# Bangkok districts around the city centre used by the sample data
+CITY_CENTER = (13.7563, 100.5018)
+DISTRICTS = [
+    'Pathum Wan', 'Bang Rak', 'Sathon', 'Chatuchak', 'Huai Khwang', 'Din Daeng', 'Ratchathewi',
+    'Phaya Thai', 'Watthana', 'Khlong Toei', 'Bang Sue', 'Dusit', 'Phra Nakhon', 'Samphanthawong',
+    'Bang Kapi', 'Lat Phrao', 'Bang Na', 'Phra Khanong', 'Thon Buri', 'Khlong San'
+]
+
+# Module catalogue (same names and ratings as seed.sql) and pole configurations
+MODULES = {
+    'lighting': ('LED Street Light', 120.0),
+    'camera': ('Security Camera', 15.0),
+    'sensor': ('Environmental Sensors', 5.0),
+    'wifi': ('WiFi Access Point', 25.0),
+    'display': ('Digital Display', 80.0),
+    'charging': ('EV Charging Station', 350.0)
+}
+POLE_PROFILES = [
+    (['lighting'], 0.35),
+    (['lighting', 'camera', 'sensor'], 0.30),
+    (['lighting', 'camera', 'sensor', 'wifi'], 0.20),
+    (['lighting', 'camera', 'sensor', 'wifi', 'display'], 0.10),
+    (['lighting', 'camera', 'sensor', 'charging'], 0.05)
+]
+
+# Rooms metered by 1-phase meters; every building also has a 3-phase main panel
+ROOM_KINDS = [('Office', 0.45), ('Room', 0.30), ('Meeting Room', 0.10), ('Lab', 0.10), ('Store', 0.05)]
+ROOMS_PER_BUILDING = (8, 60)
+ROOMS_PER_FLOOR = (6, 12)
+
+# Flow meter types: share, unit, location label, pipe sizes (mm), max flow rate per mm of pipe
+FLOW_TYPES = {
+    'water': (0.55, 'L/min', 'Water Supply', [25, 32, 40, 50, 80, 100], 2.0),
+    'gas': (0.20, 'm3/h', 'Gas Line', [20, 25, 32, 40, 50], 0.85),
+    'steam': (0.10, 'kg/h', 'Steam Line', [50, 65, 80, 100, 150], 6.25),
+    'air': (0.15, 'm3/min', 'Compressed Air', [25, 32, 40, 50, 65], 0.4)
+}
+
+# Device tables with the columns loaded by COPY
+FLEET_COLUMNS = {
+    'smart_poles': ('pole_id', 'location', 'latitude', 'longitude', 'status'),
+    'smart_pole_modules': ('pole_id', 'module_type', 'module_name', 'power_rating_w'),
+    'power_meters': ('meter_id', 'meter_type', 'location', 'room_name', 'building',
+                     'latitude', 'longitude', 'status'),
+    'flow_meters': ('meter_id', 'meter_type', 'flow_unit', 'location', 'building',
+                    'pipe_size_mm', 'max_flow_rate', 'status')
+}
+
+# Notification triggers from init.sql, disabled during the load and replaced by one reload notification
+DEVICE_TRIGGERS = {
+    'smart_poles': 'smart_poles_notify',
+    'smart_pole_modules': 'smart_pole_modules_notify',
+    'power_meters': 'power_meters_notify',
+    'flow_meters': 'flow_meters_notify'
+}
+
+COPY_CHUNK_ROWS = 200000
+
+def split_fleet(devices):
+    """Split a total device count into poles, power meters and flow meters"""
+    poles = int(devices * FLEET_SHARES['poles'])
+    power_meters = int(devices * FLEET_SHARES['power_meters'])
+    return poles, power_meters, devices - poles - power_meters
+
+class FleetProvisioner:
+    """Generate a synthetic city-scale device fleet and bulk load it with COPY"""
+
+    def __init__(self, db_connection=None, seed=None):
+        self.db = db_connection
+        self.rng = np.random.default_rng(seed)
+
+        # District centres scattered around the city centre
+        count = len(DISTRICTS)
+        self.district_lat = CITY_CENTER[0] + self.rng.uniform(-0.12, 0.12, count)
+        self.district_lon = CITY_CENTER[1] + self.rng.uniform(-0.12, 0.12, count)
+
+    def next_numbers(self):
+        """First free number per ID prefix, so repeated runs extend the fleet"""
+        numbers = {POLE_PREFIX: 1, FLOW_PREFIX: 1}
+        numbers.update({prefix: 1 for prefix in POWER_PREFIXES.values()})
+        if self.db is None:
+            return numbers
+
+        for table, column, prefix in [('smart_poles', 'pole_id', POLE_PREFIX),
+                                      ('power_meters', 'meter_id', POWER_PREFIXES['1-phase']),
+                                      ('power_meters', 'meter_id', POWER_PREFIXES['3-phase']),
+                                      ('flow_meters', 'meter_id', FLOW_PREFIX)]:
+            result = self.db.fetch_one(f"""
+                SELECT COALESCE(MAX(SUBSTRING({column} FROM {len(prefix) + 1})::bigint), 0)
+                FROM {table}
+                WHERE {column} ~ '^{prefix}[0-9]+$'
+            """)
+            if result:
+                numbers[prefix] = int(result[0]) + 1
+        return numbers
+
+    def _ids(self, prefix, start, count):
+        """Sequential device IDs such as SPC0000001"""
+        return [f"{prefix}{number:0{ID_DIGITS}d}" for number in range(start, start + count)]
+
+    def _scatter(self, district, spread):
+        """Coordinates normally distributed around each item's district centre"""
+        count = len(district)
+        latitude = self.district_lat[district] + self.rng.normal(0, spread, count)
+        longitude = self.district_lon[district] + self.rng.normal(0, spread, count)
+        return np.round(latitude, 6), np.round(longitude, 6)
+
+    def _choice(self, weighted, count):
+        """Indexes into a [(value, weight), ...] list drawn by weight"""
+        weights = np.array([weight for _, weight in weighted])
+        return self.rng.choice(len(weighted), count, p=weights / weights.sum())
+
+    def build_poles(self, count, start=1):
+        """Poles along district streets, each with a module mix drawn from POLE_PROFILES"""
+        pole_ids = np.array(self._ids(POLE_PREFIX, start, count), dtype=object)
+        district = self.rng.integers(0, len(DISTRICTS), count)
+        street = self.rng.integers(1, 200, count)
+        latitude, longitude = self._scatter(district, 0.015)
+        status = np.where(self.rng.random(count) < 0.97, 'on', 'off').astype(object)
+        location = [f"{DISTRICTS[d]} - Soi {s}" for d, s in zip(district.tolist(), street.tolist())]
+
+        poles = {
+            'pole_id': pole_ids,
+            'location': location,
+            'latitude': latitude,
+            'longitude': longitude,
+            'status': status
+        }
+
+        # Expand each pole's profile into one row per module
+        profile = self._choice(POLE_PROFILES, count)
+        sizes = np.array([len(modules) for modules, _ in POLE_PROFILES])
+        table = np.array([modules + [''] * (sizes.max() - len(modules)) for modules, _ in POLE_PROFILES],
+                         dtype=object)
+        module_counts = sizes[profile]
+        owner = np.repeat(np.arange(count), module_counts)
+        position = np.arange(len(owner)) - np.repeat(np.cumsum(module_counts) - module_counts, module_counts)
+        module_type = table[profile[owner], position]
+
+        modules = {
+            'pole_id': pole_ids[owner],
+            'module_type': module_type,
+            'module_name': np.array([MODULES[t][0] for t in module_type.tolist()], dtype=object),
+            'power_rating_w': np.array([MODULES[t][1] for t in module_type.tolist()])
+        }
+        return poles, modules
+
+    def build_buildings(self, count, start=1, label='Building'):
+        """Building names, districts and coordinates"""
+        district = self.rng.integers(0, len(DISTRICTS), count)
+        latitude, longitude = self._scatter(district, 0.02)
+        names = [f"{DISTRICTS[d]} {label} {start + i}" for i, d in enumerate(district.tolist())]
+        return names, latitude, longitude
+
+    def build_power_meters(self, count, numbers):
+        """Buildings with a 3-phase main panel and a 1-phase meter per room
+
+        Returns the meter columns and the building names used, for the flow meters.
+        """
+        # Draw building sizes (main panel + rooms) until they cover count meters
+        low, high = ROOMS_PER_BUILDING
+        sizes = self.rng.integers(low + 1, high + 2, max(1, count // low + 1))
+        ends = np.cumsum(sizes)
+        buildings = int(np.searchsorted(ends, count)) + 1
+        sizes = sizes[:buildings]
+        sizes[-1] -= ends[buildings - 1] - count
+
+        start_building = numbers[POWER_PREFIXES['3-phase']]
+        names, building_lat, building_lon = self.build_buildings(buildings, start_building)
+
+        building = np.repeat(np.arange(buildings), sizes)
+        position = np.arange(count) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        three_phase = position == 0
+
+        # Rooms are numbered per floor, e.g. Office 1203 is room 3 on floor 12
+        per_floor = self.rng.integers(ROOMS_PER_FLOOR[0], ROOMS_PER_FLOOR[1] + 1, buildings)[building]
+        room = position - 1
+        floor = room // per_floor + 1
+        number = room % per_floor + 1
+        kind = self._choice(ROOM_KINDS, count)
+
+        meter_ids = np.empty(count, dtype=object)
+        meter_ids[three_phase] = self._ids(POWER_PREFIXES['3-phase'], start_building, int(three_phase.sum()))
+        meter_ids[~three_phase] = self._ids(POWER_PREFIXES['1-phase'], numbers[POWER_PREFIXES['1-phase']],
+                                            int((~three_phase).sum()))
+
+        room_names = [
+            'Main Panel' if panel else f"{ROOM_KINDS[k][0]} {f}{n:02d}"
+            for panel, k, f, n in zip(three_phase.tolist(), kind.tolist(), floor.tolist(), number.tolist())
+        ]
+        building_names = [names[b] for b in building.tolist()]
+        location = [
+            f"{name} - Main Distribution" if panel else f"{name} - {room_name}"
+            for name, room_name, panel in zip(building_names, room_names, three_phase.tolist())
+        ]
+
+        meters = {
+            'meter_id': meter_ids,
+            'meter_type': np.where(three_phase, '3-phase', '1-phase').astype(object),
+            'location': location,
+            'room_name': room_names,
+            'building': building_names,
+            'latitude': building_lat[building],
+            'longitude': building_lon[building],
+            'status': np.where(self.rng.random(count) < 0.98, 'active', 'inactive').astype(object)
+        }
+        return meters, names
+
+    def build_flow_meters(self, count, numbers, buildings=None):
+        """Flow meters installed in the given buildings (or new ones) with pipe-sized capacities"""
+        if not buildings:
+            buildings, _, _ = self.build_buildings(max(1, count // 4), numbers[FLOW_PREFIX], 'Facility')
+        building = self.rng.integers(0, len(buildings), count)
+
+        meter_types = list(FLOW_TYPES)
+        type_index = self._choice([(t, FLOW_TYPES[t][0]) for t in meter_types], count)
+        pipe_size = np.empty(count, dtype=np.int64)
+        max_flow_rate = np.empty(count)
+        for i, meter_type in enumerate(meter_types):
+            mask = type_index == i
+            _, _, _, pipes, rate_per_mm = FLOW_TYPES[meter_type]
+            pipe_size[mask] = self.rng.choice(pipes, int(mask.sum()))
+            max_flow_rate[mask] = pipe_size[mask] * rate_per_mm
+
+        building_names = [buildings[b] for b in building.tolist()]
+        return {
+            'meter_id': np.array(self._ids(FLOW_PREFIX, numbers[FLOW_PREFIX], count), dtype=object),
+            'meter_type': np.array(meter_types, dtype=object)[type_index],
+            'flow_unit': np.array([FLOW_TYPES[t][1] for t in meter_types], dtype=object)[type_index],
+            'location': [f"{name} - {FLOW_TYPES[meter_types[t]][2]}"
+                         for name, t in zip(building_names, type_index.tolist())],
+            'building': building_names,
+            'pipe_size_mm': pipe_size,
+            'max_flow_rate': np.round(max_flow_rate, 2),
+            'status': np.where(self.rng.random(count) < 0.98, 'active', 'inactive').astype(object)
+        }
+
+    def build(self, poles, power_meters, flow_meters):
+        """Build the whole fleet as {table: column dict} without touching the database"""
+        numbers = self.next_numbers()
+        fleet = {}
+        fleet['smart_poles'], fleet['smart_pole_modules'] = self.build_poles(poles, numbers[POLE_PREFIX])
+
+        buildings = None
+        if power_meters:
+            fleet['power_meters'], buildings = self.build_power_meters(power_meters, numbers)
+        fleet['flow_meters'] = self.build_flow_meters(flow_meters, numbers, buildings) if flow_meters else None
+        return {table: columns for table, columns in fleet.items() if columns is not None}
+
+    def _copy_table(self, table, columns):
+        """COPY one table's column dict in chunks to bound the size of each COPY buffer"""
+        names = FLEET_COLUMNS[table]
+        count = len(columns[names[0]])
+        for start in range(0, count, COPY_CHUNK_ROWS):
+            end = min(count, start + COPY_CHUNK_ROWS)
+            self.db.copy_columns(table, names, [columns[name][start:end] for name in names], end - start)
+        return count
+
+    def provision(self, poles, power_meters, flow_meters):
+        """Build the fleet and load it in one transaction; returns rows loaded per table"""
+        start = time.perf_counter()
+        fleet = self.build(poles, power_meters, flow_meters)
+        print(f"Built fleet in {time.perf_counter() - start:.1f}s")
+
+        loaded = {}
+        try:
+            # One reload notification replaces a notification per inserted row
+            for table in fleet:
+                self.db.execute(f"ALTER TABLE {table} DISABLE TRIGGER {DEVICE_TRIGGERS[table]}")
+            for table in FLEET_COLUMNS:
+                if table in fleet:
+                    table_start = time.perf_counter()
+                    loaded[table] = self._copy_table(table, fleet[table])
+                    print(f"  {table}: {loaded[table]} rows in {time.perf_counter() - table_start:.1f}s")
+            for table in fleet:
+                self.db.execute(f"ALTER TABLE {table} ENABLE TRIGGER {DEVICE_TRIGGERS[table]}")
+            self.db.execute("SELECT pg_notify('device_registry', %s)", (json.dumps({'op': 'reload'}),))
+            self.db.commit()
+        except Exception as e:
+            print(f"Error provisioning fleet: {e}")
+            self.db.rollback()
+            return None
+
+        print(f"Provisioned {sum(loaded.values())} rows in {time.perf_counter() - start:.1f}s")
+        return loaded
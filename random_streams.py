@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+import hashlib
+import os
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+# 64-bit FNV-1a parameters
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+# SplitMix64 finalizer constants
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+def _mix(x):
+    """SplitMix64 finalizer over a uint64 array: a bijection with full avalanche"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * MIX_1
+    x = x ^ (x >> np.uint64(27))
+    x = x * MIX_2
+    return x ^ (x >> np.uint64(31))
+
+def _hash64(text):
+    """Stable 64-bit hash of a string"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def tick_of(moment):
+    """Counter of a reading time: milliseconds since the epoch (time zone independent)"""
+    return (moment - EPOCH) // timedelta(milliseconds=1)
+
+class RandomStreams:
+    """Counter-based random numbers keyed by (seed, device, tick, stream)
+
+    Every value is a hash of the device's key (derived from the seed and the
+    device ID), the tick (the reading's timestamp) and the name of the quantity
+    drawn, rather than the next output of a shared generator. Readings therefore
+    do not depend on which process generates a device, on the order devices or
+    ticks are generated in, or on what else was drawn: the same seed gives the
+    same values in one process, in N shards, or when resuming part way through.
+    """
+
+    def __init__(self, seed=None):
+        # Without a seed runs are random; the drawn seed is kept so a run can be repeated
+        self.seed = int(seed) if seed is not None else int.from_bytes(os.urandom(4), 'little')
+        self.seed_key = _mix(np.array([self.seed & 0xFFFFFFFFFFFFFFFF], dtype=np.uint64))[0]
+        self.stream_codes = {}
+
+    def device_keys(self, device_ids):
+        """64-bit stream keys of devices: FNV-1a of the UTF-8 ID, mixed with the seed"""
+        encoded = np.char.encode(np.asarray(device_ids, dtype=object).astype(str), 'utf-8')
+        lengths = np.char.str_len(encoded)
+        octets = encoded.view(np.uint8).reshape(len(encoded), -1) if len(encoded) else np.zeros((0, 0), np.uint8)
+        hashes = np.full(len(encoded), FNV_OFFSET, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            # Column by column over the fleet; bytes past an ID's end (padding) are skipped
+            for position in range(octets.shape[1]):
+                hashed = (hashes ^ octets[:, position]) * FNV_PRIME
+                hashes = np.where(lengths > position, hashed, hashes)
+            return _mix(hashes ^ self.seed_key)
+
+    def stream_code(self, stream):
+        """Hashed counter offset of a named stream, e.g. 'voltage'"""
+        code = self.stream_codes.get(stream)
+        if code is None:
+            code = self.stream_codes[stream] = np.uint64(_hash64(stream))
+        return code
+
+    def at(self, keys, moment):
+        """Random draws of the given devices for one reading time"""
+        return TickRandom(self, keys, tick_of(moment))
+
+class TickRandom:
+    """Draws of a set of devices at one tick; each named stream gives one value per device
+
+    A list of stream names gives a (devices, streams) matrix, one column per name.
+    """
+
+    def __init__(self, streams, keys, tick):
+        self.streams = streams
+        self.keys = np.asarray(keys, dtype=np.uint64)
+        self.tick = np.uint64(tick & 0xFFFFFFFFFFFFFFFF)
+
+    def random(self, stream):
+        """Uniform floats in [0, 1) with 53 random bits"""
+        names = [stream] if isinstance(stream, str) else list(stream)
+        codes = np.array([self.streams.stream_code(name) for name in names], dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            counters = _mix(codes ^ _mix(np.array([self.tick]))[0])
+            bits = _mix(self.keys[:, None] ^ counters[None, :])
+        values = (bits >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+        return values[:, 0] if isinstance(stream, str) else values
+
+    def uniform(self, low, high, stream):
+        """Uniform floats in [low, high); low and high broadcast like NumPy arrays
+        (per device for one stream, per column for a list of streams)
+        """
+        return low + (high - low) * self.random(stream)
+
+    def integers(self, low, high, stream):
+        """Uniform integers in [low, high)"""
+        return low + np.floor(self.random(stream) * (high - low)).astype(np.int64)
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import time
+
+def make_etag(body):
+    """Strong ETag of a response body"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches an ETag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    # Weak comparison, as If-None-Match requires
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+class CachedResponse:
+    """A cached response body with its status, headers, ETag and expiry"""
+
+    __slots__ = ('status_code', 'headers', 'body', 'etag', 'groups', 'expires')
+
+    def __init__(self, status_code, headers, body, groups, ttl):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = make_etag(body)
+        self.groups = groups
+        self.expires = time.monotonic() + ttl
+
+class ResponseCache:
+    """Bounded LRU cache of API responses with per-entry TTL and group invalidation
+
+    Entries belong to groups (e.g. 'power-meters'); invalidate(group) drops
+    every entry of the group and bumps its generation, so a response computed
+    while a write was in progress is not stored afterwards. Concurrent misses
+    on the same key wait for one computation instead of all querying the
+    database (lock(key)).
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max(1, int(max_entries))
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.locks = {}
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Fresh entry for key, or None (expired entries are dropped)"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def generation(self, groups):
+        """Snapshot of the groups' invalidation counters, taken before computing a response"""
+        return tuple(self.generations.get(group, 0) for group in groups)
+
+    def put(self, key, entry, generation):
+        """Store an entry unless one of its groups was invalidated since generation"""
+        if self.generation(entry.groups) != generation:
+            return False
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return True
+
+    def invalidate(self, *groups):
+        """Drop every entry of the given groups"""
+        for group in groups:
+            self.generations[group] = self.generations.get(group, 0) + 1
+        stale = [key for key, entry in self.entries.items() if not entry.groups.isdisjoint(groups)]
+        for key in stale:
+            del self.entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def lock(self, key):
+        """Lock serialising the computation of one key's response"""
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        return lock
+
+    def release(self, key):
+        """Forget a key's lock once its response is computed"""
+        lock = self.locks.get(key)
+        if lock is not None and not lock.locked():
+            del self.locks[key]
+
+    def stats(self):
+        """Cache counters"""
+        return {'entries': len(self.entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations}
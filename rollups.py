@@ -0,0 +1,221 @@
+import numpy as np
+
+# Device ID column and rolled-up metrics of every reading table
+ROLLUP_METRICS = {
+    'weather_station': ('station_id', ('temperature_c', 'humidity_percent', 'rainfall_mm', 'light_intensity_lux')),
+    'smart_pole_energy': ('pole_id', ('power_consumption_w', 'energy_kwh')),
+    'power_meter_readings': ('meter_id', ('power_w', 'energy_kwh')),
+    'flow_meter_readings': ('meter_id', ('flow_rate', 'total_volume'))
+}
+
+# Optional column of a column block that names the device group (e.g. '1-phase', 'water')
+GROUP_COLUMN = 'meter_type'
+
+# Fleet rollups always have an 'all' group covering every device of the table
+ALL_GROUP = 'all'
+
+BUCKET_SIZES = {'hour': 'datetime64[h]', 'day': 'datetime64[D]'}
+
+# Finer buckets kept only per device group (there are few groups), so fleet statistics over a
+# sliding window such as the last hour read whole buckets: bucket size -> length in minutes
+FLEET_BUCKET_MINUTES = {'5min': 5}
+
+STAT_COLUMNS = ('sample_count', 'min_value', 'max_value', 'sum_value', 'last_value', 'last_timestamp')
+ROLLUP_TABLES = {
+    'reading_rollups': ('source_table', 'device_id', 'metric', 'bucket_size', 'bucket_start') + STAT_COLUMNS,
+    'fleet_rollups': ('source_table', 'group_key', 'metric', 'bucket_size', 'bucket_start') + STAT_COLUMNS
+}
+
+# Merge a flush's partial aggregates into the stored buckets; rows are merged in key order so
+# concurrent writers (e.g. --workers) lock shared fleet buckets in the same order and cannot deadlock
+UPSERT_QUERY = """
+    INSERT INTO {table} AS r SELECT * FROM {table}_staging ORDER BY {key}
+    ON CONFLICT ({key}) DO UPDATE SET
+        sample_count = r.sample_count + EXCLUDED.sample_count,
+        min_value = LEAST(r.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(r.max_value, EXCLUDED.max_value),
+        sum_value = r.sum_value + EXCLUDED.sum_value,
+        last_value = CASE WHEN EXCLUDED.last_timestamp >= r.last_timestamp
+                          THEN EXCLUDED.last_value ELSE r.last_value END,
+        last_timestamp = GREATEST(r.last_timestamp, EXCLUDED.last_timestamp)
+"""
+
+def _float_column(values, count):
+    """A metric column as a float array (None becomes NaN)"""
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float64, copy=False)
+    if isinstance(values, (list, tuple)):
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return np.full(count, np.nan if values is None else values, dtype=np.float64)
+
+def timestamp_column(values, count):
+    """A timestamp column (or a block's shared timestamp) as a datetime64 array"""
+    if isinstance(values, (np.ndarray, list, tuple)):
+        return np.array(values, dtype='datetime64[us]')
+    return np.full(count, np.datetime64(values, 'us'))
+
+def minute_buckets(timestamps, minutes):
+    """Start of the minutes-long bucket of every timestamp (buckets are aligned to the hour)"""
+    since_epoch = timestamps.astype('datetime64[m]').astype(np.int64)
+    return (since_epoch - since_epoch % minutes).astype('datetime64[m]')
+
+def aggregate(keys, values, timestamps):
+    """Aggregate values per integer key
+
+    Returns (unique keys, count, min, max, sum, last value, last timestamp), where
+    "last" is the value with the latest timestamp. NaN values are ignored.
+    """
+    present = ~np.isnan(values)
+    keys, values, timestamps = keys[present], values[present], timestamps[present]
+
+    if len(keys) == 0:
+        return keys, keys, values, values, values, values, timestamps
+
+    order = np.lexsort((timestamps, keys))
+    keys, values, timestamps = keys[order], values[order], timestamps[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+    return (
+        keys[starts],
+        ends - starts,
+        np.minimum.reduceat(values, starts),
+        np.maximum.reduceat(values, starts),
+        np.add.reduceat(values, starts),
+        values[ends - 1],
+        timestamps[ends - 1]
+    )
+
+class RollupBuilder:
+    """Aggregate flushed readings into hourly and daily rollups per device and per device group
+    (plus 5-minute rollups per device group)
+
+    Readings are collected while a batch is flushed and merged into
+    reading_rollups and fleet_rollups in the same transaction, so rollups
+    always match the committed readings.
+    """
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+        self.parts = {}
+
+    def collect(self, table, columns, count, groups=None):
+        """Queue count readings of a table given as {column name: array, sequence or scalar}"""
+        if table not in ROLLUP_METRICS or count == 0:
+            return
+        device_column, metrics = ROLLUP_METRICS[table]
+        device_ids = columns[device_column]
+        if not isinstance(device_ids, np.ndarray):
+            device_ids = np.array(device_ids if isinstance(device_ids, (list, tuple)) else [device_ids] * count,
+                                  dtype=object)
+        if groups is not None and not isinstance(groups, np.ndarray):
+            groups = np.array(groups, dtype=object)
+
+        self.parts.setdefault(table, []).append((
+            device_ids,
+            timestamp_column(columns['timestamp'], count),
+            {metric: _float_column(columns[metric], count) for metric in metrics},
+            groups
+        ))
+
+    def collect_rows(self, table, column_names, rows):
+        """Queue readings given as row tuples in column_names order"""
+        if table not in ROLLUP_METRICS or not rows:
+            return
+        columns = dict(zip(column_names, zip(*rows)))
+        self.collect(table, columns, len(rows))
+
+    def _table_rows(self, table, parts):
+        """Device and group rollup rows (as column lists) for one reading table"""
+        _, metrics = ROLLUP_METRICS[table]
+        device_ids = np.concatenate([part[0] for part in parts])
+        timestamps = np.concatenate([part[1] for part in parts])
+        groups = np.concatenate([
+            part[3] if part[3] is not None else np.full(len(part[0]), None, dtype=object) for part in parts
+        ])
+
+        # Integer codes for devices and groups so aggregation runs on numeric keys
+        device_names, device_codes = np.unique(device_ids.astype(str), return_inverse=True)
+        has_group = groups != None
+        group_names, group_codes = np.unique(groups[has_group].astype(str), return_inverse=True)
+
+        device_rows = {name: [] for name in ROLLUP_TABLES['reading_rollups']}
+        fleet_rows = {name: [] for name in ROLLUP_TABLES['fleet_rollups']}
+
+        bucket_sizes = [(bucket_size, timestamps.astype(unit), True) for bucket_size, unit in BUCKET_SIZES.items()]
+        bucket_sizes += [(bucket_size, minute_buckets(timestamps, minutes), False)
+                         for bucket_size, minutes in FLEET_BUCKET_MINUTES.items()]
+
+        for bucket_size, buckets, per_device in bucket_sizes:
+            bucket_names, bucket_codes = np.unique(buckets, return_inverse=True)
+            bucket_count = len(bucket_names)
+            bucket_starts = np.datetime_as_string(bucket_names, unit='s')
+
+            for metric in metrics:
+                values = np.concatenate([part[2][metric] for part in parts])
+
+                # Per device
+                if per_device:
+                    keys = device_codes.astype(np.int64) * bucket_count + bucket_codes
+                    stats = aggregate(keys, values, timestamps)
+                    self._append(device_rows, 'device_id', table, metric, bucket_size,
+                                 device_names[stats[0] // bucket_count], bucket_starts[stats[0] % bucket_count],
+                                 stats)
+
+                # Whole fleet
+                stats = aggregate(bucket_codes.astype(np.int64), values, timestamps)
+                self._append(fleet_rows, 'group_key', table, metric, bucket_size,
+                             np.full(len(stats[0]), ALL_GROUP), bucket_starts[stats[0]], stats)
+
+                # Per device group
+                if len(group_names):
+                    keys = group_codes.astype(np.int64) * bucket_count + bucket_codes[has_group]
+                    stats = aggregate(keys, values[has_group], timestamps[has_group])
+                    self._append(fleet_rows, 'group_key', table, metric, bucket_size,
+                                 group_names[stats[0] // bucket_count], bucket_starts[stats[0] % bucket_count],
+                                 stats)
+
+        return device_rows, fleet_rows
+
+    def _append(self, rows, key_column, table, metric, bucket_size, keys, bucket_starts, stats):
+        """Append aggregated stats to a rollup row set as arrays, so COPY formats them in bulk"""
+        count = len(stats[0])
+        rows['source_table'].append(np.full(count, table))
+        rows[key_column].append(np.asarray(keys, dtype=str))
+        rows['metric'].append(np.full(count, metric))
+        rows['bucket_size'].append(np.full(count, bucket_size))
+        rows['bucket_start'].append(bucket_starts)
+        for name, values in zip(STAT_COLUMNS, stats[1:]):
+            if name == 'last_timestamp':
+                values = np.datetime_as_string(values, unit='us')
+            rows[name].append(values)
+
+    def write(self):
+        """Merge the collected readings into the rollup tables (caller commits)"""
+        if not self.parts:
+            return 0
+
+        parts, self.parts = self.parts, {}
+        merged = {table: {name: [] for name in columns} for table, columns in ROLLUP_TABLES.items()}
+        for table, table_parts in parts.items():
+            for target, rows in zip(ROLLUP_TABLES, self._table_rows(table, table_parts)):
+                for name, pieces in rows.items():
+                    merged[target][name].extend(pieces)
+
+        written = 0
+        for target, columns in ROLLUP_TABLES.items():
+            if not merged[target]['source_table']:
+                continue
+            values = [np.concatenate(merged[target][name]) for name in columns]
+            count = len(values[0])
+            if count == 0:
+                continue
+            self.db.execute(f"CREATE TEMP TABLE IF NOT EXISTS {target}_staging "
+                            f"(LIKE {target}) ON COMMIT DELETE ROWS")
+            self.db.copy_columns(f"{target}_staging", columns, values, count)
+            self.db.execute(UPSERT_QUERY.format(table=target, key=', '.join(columns[:5])))
+            written += count
+        return written
+
+    def discard(self):
+        """Drop collected readings after a failed flush"""
+        self.parts = {}
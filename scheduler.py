@@ -0,0 +1,165 @@
+from datetime import datetime
+import asyncio
+import math
+import time
+
+class ScheduledJob:
+    """A device class generated on its own fixed interval"""
+
+    def __init__(self, name, interval_seconds, run):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.run = run
+
+        # Statistics since the scheduler started
+        self.runs = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.max_late_seconds = 0.0
+
+        # Deadlines skipped because the previous run finished after them
+        self.missed = 0
+
+        # An overrun lasts from the first missed deadline until a run finishes on time again
+        self.overrun_started = None
+        self.overruns = 0
+        self.overrun_seconds = 0.0
+        self.longest_overrun = 0.0
+
+class DriftFreeScheduler:
+    """Run generation jobs on absolute deadlines in one asyncio event loop
+
+    Deadlines are multiples of each job's interval on the wall clock, so the
+    period never grows with the time a job takes. Jobs run one at a time since
+    they share the generator's simulators and database connection. A job that
+    finishes after its next deadline skips the deadlines it missed instead of
+    running back to back to catch up.
+    """
+
+    def __init__(self, generator, clock, jobs, report_seconds=60):
+        self.generator = generator
+        self.clock = clock
+        self.jobs = jobs
+        self.report_seconds = report_seconds
+
+    async def run(self):
+        """Run every job until cancelled"""
+        loop = asyncio.get_running_loop()
+
+        # Deadlines are kept in wall-clock seconds and waited for on the monotonic loop clock
+        offset = datetime.now().timestamp() - loop.time()
+
+        tasks = [asyncio.create_task(self._run_job(job, offset)) for job in self.jobs]
+        tasks.append(asyncio.create_task(self._report()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _run_job(self, job, offset):
+        """Run one job on every deadline of its interval"""
+        loop = asyncio.get_running_loop()
+        writer = self.generator.writer
+        metrics = self.generator.metrics
+        interval = job.interval_seconds
+        deadline = math.ceil((loop.time() + offset) / interval) * interval
+
+        while True:
+            delay = deadline - offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            started = loop.time()
+            late = started + offset - deadline
+            job.max_late_seconds = max(job.max_late_seconds, late)
+
+            # Readings are stamped with the deadline, not the (slightly later) start time
+            self.clock.current = datetime.fromtimestamp(deadline)
+            rows_before = writer.rows_written
+            try:
+                self.generator.refresh_devices()
+                
+                # Generation time excludes writes triggered by a full batch (synchronous sinks)
+                run_start = time.perf_counter()
+                write_before = getattr(writer, 'write_seconds', 0.0)
+                job.run(interval)
+                written = getattr(writer, 'write_seconds', 0.0) - write_before
+                metrics.generation_seconds.observe(time.perf_counter() - run_start - written,
+                                                   device_class=job.name)
+                writer.flush()
+            except Exception as e:
+                print(f"[Scheduler] {job.name} failed: {e}")
+
+            finished = loop.time()
+            job.runs += 1
+            job.rows += writer.rows_written - rows_before
+            job.busy_seconds += finished - started
+
+            deadline += interval
+            behind = finished + offset - deadline
+            if behind >= 0:
+                skipped = int(behind // interval) + 1
+                deadline += skipped * interval
+                job.missed += skipped
+                metrics.missed_deadlines.inc(skipped, device_class=job.name)
+                if job.overrun_started is None:
+                    job.overrun_started = started
+                    job.overruns += 1
+                print(f"[Scheduler] {job.name} missed {skipped} deadline(s): started {late:.3f}s late, "
+                      f"ran {finished - started:.3f}s on a {interval}s interval")
+            elif job.overrun_started is not None:
+                duration = finished - job.overrun_started
+                job.overrun_seconds += duration
+                job.longest_overrun = max(job.longest_overrun, duration)
+                job.overrun_started = None
+                print(f"[Scheduler] {job.name} back on schedule after {duration:.1f}s")
+            overrun = finished - job.overrun_started if job.overrun_started is not None else 0.0
+            metrics.cycle_overrun.set(overrun, device_class=job.name)
+
+            # Let jobs whose deadlines passed while this one ran start before we sleep again
+            await asyncio.sleep(0)
+
+    async def _report(self):
+        """Print a summary of every job and pipeline stage periodically"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.report_seconds)
+            self.print_summary(loop.time())
+
+    def print_summary(self, now=None):
+        """Print runs, rows, timing and missed deadlines per job, then stage timings
+
+        now (loop time) includes overruns still in progress in the longest overrun.
+        """
+        print(f"\n[Scheduler] {datetime.now():%Y-%m-%d %H:%M:%S}")
+        print(f"  {'Job':<16} {'Every':>6} {'Runs':>6} {'Rows':>10} {'Avg run':>9} "
+              f"{'Max late':>9} {'Missed':>7} {'Overruns':>9} {'Longest':>8}")
+        for job in self.jobs:
+            average = job.busy_seconds / job.runs if job.runs else 0.0
+            longest = job.longest_overrun
+            if now is not None and job.overrun_started is not None:
+                longest = max(longest, now - job.overrun_started)
+            print(f"  {job.name:<16} {job.interval_seconds:>5}s {job.runs:>6} {job.rows:>10} "
+                  f"{average:>8.3f}s {job.max_late_seconds:>8.3f}s {job.missed:>7} "
+                  f"{job.overruns:>9} {longest:>7.1f}s")
+        print("\n[Stages]")
+        self.generator.metrics.print_summary()
+        self.generator.print_sink_summary()
+
+def parse_intervals(text, names):
+    """Parse 'name=seconds,name=seconds' into a dict, rejecting unknown device classes"""
+    intervals = {}
+    if not text:
+        return intervals
+
+    for item in text.split(','):
+        name, _, seconds = item.partition('=')
+        name = name.strip()
+        if name not in names:
+            raise ValueError(f"Unknown device class '{name}'. Use one of: {', '.join(names)}")
+        seconds = float(seconds)
+        if seconds <= 0:
+            raise ValueError(f"Interval for {name} must be positive")
+        intervals[name] = int(seconds) if seconds == int(seconds) else seconds
+    return intervals
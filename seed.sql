@@ -0,0 +1,88 @@
+-- Sample devices and reference data for a new database, run after init.sql (schema only).
+-- Every insert is idempotent. migrate-partitions re-runs init.sql but never this file.
+
+-- Insert sample smart poles
+INSERT INTO smart_poles (pole_id, location, latitude, longitude, status) VALUES
+    ('SP001', 'Main Street North', 13.736717, 100.523186, 'on'),
+    ('SP002', 'Central Avenue', 13.746717, 100.533186, 'on'),
+    ('SP003', 'Park Lane', 13.726717, 100.513186, 'on'),
+    ('SP004', 'University Road', 13.756717, 100.543186, 'on'),
+    ('SP005', 'Business District', 13.766717, 100.553186, 'off')
+ON CONFLICT (pole_id) DO NOTHING;
+
+-- Insert sample modules for each smart pole
+INSERT INTO smart_pole_modules (pole_id, module_type, module_name, power_rating_w) VALUES
+    ('SP001', 'lighting', 'LED Street Light', 120.0),
+    ('SP001', 'camera', 'Security Camera', 15.0),
+    ('SP001', 'sensor', 'Environmental Sensors', 5.0),
+    ('SP001', 'wifi', 'WiFi Access Point', 25.0),
+    ('SP001', 'display', 'Digital Display', 80.0),
+    ('SP002', 'lighting', 'LED Street Light', 120.0),
+    ('SP002', 'camera', 'Security Camera', 15.0),
+    ('SP002', 'sensor', 'Environmental Sensors', 5.0),
+    ('SP002', 'wifi', 'WiFi Access Point', 25.0),
+    ('SP003', 'lighting', 'LED Street Light', 120.0),
+    ('SP003', 'camera', 'Security Camera', 15.0),
+    ('SP003', 'sensor', 'Environmental Sensors', 5.0),
+    ('SP004', 'lighting', 'LED Street Light', 120.0),
+    ('SP004', 'camera', 'Security Camera', 15.0),
+    ('SP004', 'sensor', 'Environmental Sensors', 5.0),
+    ('SP004', 'wifi', 'WiFi Access Point', 25.0),
+    ('SP004', 'display', 'Digital Display', 80.0),
+    ('SP004', 'charging', 'EV Charging Station', 350.0),
+    ('SP005', 'lighting', 'LED Street Light', 120.0),
+    ('SP005', 'camera', 'Security Camera', 15.0),
+    ('SP005', 'sensor', 'Environmental Sensors', 5.0)
+ON CONFLICT DO NOTHING;
+
+-- Insert initial weather station
+INSERT INTO weather_station (station_id, timestamp, temperature_c, humidity_percent, pressure_hpa, wind_speed_ms, wind_direction_deg, rainfall_mm, light_intensity_lux)
+VALUES ('WS001', CURRENT_TIMESTAMP, 28.5, 65.0, 1013.25, 2.5, 180, 0.0, 50000)
+ON CONFLICT DO NOTHING;
+
+-- Insert device categories
+INSERT INTO device_categories (category_id, category_name, description) VALUES
+    ('smart_pole', 'Smart Pole', 'Smart street lighting poles with IoT modules'),
+    ('weather_station', 'Weather Station', 'Environmental monitoring stations'),
+    ('power_meter_1ph', 'Power Meter 1-Phase', 'Single-phase power meters for room/zone monitoring'),
+    ('power_meter_3ph', 'Power Meter 3-Phase', 'Three-phase power meters for building/facility monitoring'),
+    ('flow_meter_water', 'Water Flow Meter', 'Water consumption monitoring'),
+    ('flow_meter_gas', 'Gas Flow Meter', 'Gas flow monitoring'),
+    ('flow_meter_steam', 'Steam Flow Meter', 'Steam flow monitoring'),
+    ('flow_meter_air', 'Air Flow Meter', 'Compressed air flow monitoring')
+ON CONFLICT (category_id) DO NOTHING;
+
+-- Insert sample power meters (1-phase for rooms)
+INSERT INTO power_meters (meter_id, meter_type, location, room_name, building, latitude, longitude, status) VALUES
+    ('PM1P001', '1-phase', 'Building A - Room 101', 'Room 101', 'Building A', 13.736717, 100.523186, 'active'),
+    ('PM1P002', '1-phase', 'Building A - Room 102', 'Room 102', 'Building A', 13.736717, 100.523186, 'active'),
+    ('PM1P003', '1-phase', 'Building A - Room 201', 'Room 201', 'Building A', 13.736717, 100.523186, 'active'),
+    ('PM1P004', '1-phase', 'Building B - Office 1', 'Office 1', 'Building B', 13.746717, 100.533186, 'active'),
+    ('PM1P005', '1-phase', 'Building B - Office 2', 'Office 2', 'Building B', 13.746717, 100.533186, 'active')
+ON CONFLICT (meter_id) DO NOTHING;
+
+-- Insert sample power meters (3-phase for buildings)
+INSERT INTO power_meters (meter_id, meter_type, location, room_name, building, latitude, longitude, status) VALUES
+    ('PM3P001', '3-phase', 'Building A - Main Distribution', 'Main Panel', 'Building A', 13.736717, 100.523186, 'active'),
+    ('PM3P002', '3-phase', 'Building B - Main Distribution', 'Main Panel', 'Building B', 13.746717, 100.533186, 'active'),
+    ('PM3P003', '3-phase', 'Building C - Main Distribution', 'Main Panel', 'Building C', 13.756717, 100.543186, 'active')
+ON CONFLICT (meter_id) DO NOTHING;
+
+-- Insert sample flow meters
+INSERT INTO flow_meters (meter_id, meter_type, flow_unit, location, building, pipe_size_mm, max_flow_rate, status) VALUES
+    ('FM_W001', 'water', 'L/min', 'Building A - Water Supply', 'Building A', 50, 100.0, 'active'),
+    ('FM_W002', 'water', 'L/min', 'Building B - Water Supply', 'Building B', 50, 100.0, 'active'),
+    ('FM_W003', 'water', 'm3/h', 'Main Water Line', 'Campus', 100, 50.0, 'active'),
+    ('FM_G001', 'gas', 'm3/h', 'Building A - Gas Line', 'Building A', 25, 20.0, 'active'),
+    ('FM_G002', 'gas', 'm3/h', 'Cafeteria - Gas Supply', 'Cafeteria', 32, 30.0, 'active'),
+    ('FM_S001', 'steam', 'kg/h', 'Central Boiler - Steam', 'Boiler Room', 80, 500.0, 'active'),
+    ('FM_A001', 'air', 'm3/min', 'Compressor Station', 'Workshop', 40, 15.0, 'active'),
+    ('FM_A002', 'air', 'm3/min', 'Production Line', 'Factory', 50, 25.0, 'active')
+ON CONFLICT (meter_id) DO NOTHING;
+
+-- Latest value of the sample weather reading (init.sql seeded the latest tables before it existed)
+INSERT INTO weather_station_latest
+SELECT DISTINCT ON (station_id) station_id, timestamp, temperature_c, humidity_percent, pressure_hpa,
+       wind_speed_ms, wind_direction_deg, rainfall_mm, light_intensity_lux
+FROM weather_station ORDER BY station_id, timestamp DESC
+ON CONFLICT (station_id) DO NOTHING;
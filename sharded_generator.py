@@ -0,0 +1,301 @@
+from datetime import datetime, timedelta
+from sim_clock import SimulatedClock
+from weather_simulator import WeatherSimulator
+from random_streams import RandomStreams
+from main import SmartCityDataGenerator
+import math
+import multiprocessing
+import queue
+import signal
+import time
+
+def run_shard(index, workers, batch_size, write_method, commands, results, output=None, seed=None):
+    """Worker process: generate data for one hash partition of the device fleet
+
+    Each worker owns its simulators, RNG streams, batch writer and database
+    connection. It waits for tick commands from the coordinator and reports
+    the rows it wrote.
+    """
+    # Ctrl+C is handled by the coordinator, which tells every worker to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    sinks, devices = output or (None, None)
+    generator = SmartCityDataGenerator(batch_size, write_method, shard=(index, workers), sinks=sinks, seed=seed,
+                                       spool=True)
+    if not generator.initialize(devices):
+        results.put((index, 'error', 'failed to connect to database'))
+        return
+
+    clock = SimulatedClock(datetime.now())
+    generator.set_clock(clock)
+    generator.refresh_devices()
+    results.put((index, 'ready', (
+        len(generator.pole_sim.fleet['pole_id']),
+        len(generator.power_meter_sim.fleet['meter_id']),
+        len(generator.flow_meter_sim.fleet['meter_id'])
+    )))
+
+    writer = generator.writer
+    maintained_day = None
+    while True:
+        command, args = commands.get()
+
+        if command == 'tick':
+            timestamp, weather_data, interval_seconds, flush, refresh_devices = args
+            clock.current = timestamp
+            generator.flow_meter_sim.interval_seconds = interval_seconds
+
+            # One shard keeps the reading partitions ahead of live generation
+            if index == 0 and refresh_devices and generator.partitions and timestamp.date() != maintained_day:
+                generator.partitions.maintain()
+                maintained_day = timestamp.date()
+
+            rows_before, failed_before = writer.rows_written, writer.rows_failed
+            start = time.perf_counter()
+            try:
+                generator.generate_cycle(verbose=False, flush=flush,
+                                         refresh_devices=refresh_devices,
+                                         weather_data=weather_data)
+            except Exception as e:
+                print(f"Shard {index}: error generating data: {e}")
+            results.put((index, 'tick', (
+                writer.rows_written - rows_before,
+                writer.rows_failed - failed_before,
+                time.perf_counter() - start
+            )))
+
+        elif command == 'stop':
+            rows_before, failed_before = writer.rows_written, writer.rows_failed
+            generator.cleanup()
+            results.put((index, 'stopped', (
+                writer.rows_written - rows_before,
+                writer.rows_failed - failed_before
+            )))
+            return
+
+class ShardedGenerator:
+    """Coordinate worker processes that each own a hash partition of the device fleet
+
+    The coordinator owns the clock and the weather station: every tick it sends
+    the same timestamp and weather reading to all workers and waits for each
+    of them before starting the next tick.
+    """
+
+    def __init__(self, workers, batch_size=None, write_method=None, output=None, seed=None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.write_method = write_method
+        
+        # (sinks, devices) when the workers write to other sinks than PostgreSQL alone
+        self.output = output
+
+        # Shared by the coordinator's weather station and every worker's random streams
+        self.seed = seed
+
+        self.clock = SimulatedClock(datetime.now())
+        self.weather_sim = WeatherSimulator(self.clock, RandomStreams(seed))
+
+        self.processes = []
+        self.commands = []
+        self.results = None
+
+        # Aggregated throughput statistics
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.ticks = 0
+        self.missed_deadlines = 0
+
+    def start(self):
+        """Start the worker processes and wait until each has loaded its shard"""
+        # Spawned workers open their own database connections instead of inheriting ours
+        context = multiprocessing.get_context('spawn')
+        self.results = context.Queue()
+
+        for index in range(self.workers):
+            commands = context.Queue()
+            process = context.Process(
+                target=run_shard,
+                args=(index, self.workers, self.batch_size, self.write_method, commands, self.results,
+                      self.output, self.seed),
+                name=f'generator-shard-{index}',
+                daemon=True
+            )
+            process.start()
+            self.commands.append(commands)
+            self.processes.append(process)
+
+        replies = self._collect('ready')
+        failed = [index for index, (status, _) in enumerate(replies) if status != 'ready']
+        if failed:
+            print(f"Failed to start shards: {failed}")
+            self.stop()
+            return False
+
+        print(f"\nStarted {self.workers} generator workers")
+        for index, (_, (poles, power_meters, flow_meters)) in enumerate(replies):
+            print(f"  Shard {index}: {poles} poles, {power_meters} power meters, "
+                  f"{flow_meters} flow meters")
+        return True
+
+    def _collect(self, expect):
+        """Wait for an expect reply from every live worker, returned as a list ordered by shard"""
+        replies = [None] * self.workers
+        waiting = set(range(self.workers))
+
+        while waiting:
+            try:
+                index, status, payload = self.results.get(timeout=1)
+            except queue.Empty:
+                for index in list(waiting):
+                    if not self.processes[index].is_alive():
+                        replies[index] = ('error', 'worker exited')
+                        waiting.discard(index)
+                continue
+
+            if status == 'tick' and expect != 'tick':
+                # Late reply from a tick interrupted by Ctrl+C
+                self.rows_written += payload[0]
+                self.rows_failed += payload[1]
+                continue
+            replies[index] = (status, payload)
+            waiting.discard(index)
+
+        return replies
+
+    def tick(self, timestamp, interval_seconds, flush=True, refresh_devices=True):
+        """Run one aligned tick on every worker and return (rows written, slowest shard seconds)"""
+        self.clock.current = timestamp
+        weather_data = self.weather_sim.generate_weather_data()
+
+        for commands in self.commands:
+            commands.put(('tick', (timestamp, weather_data, interval_seconds, flush, refresh_devices)))
+
+        rows = 0
+        slowest = 0.0
+        for index, (status, payload) in enumerate(self._collect('tick')):
+            if status != 'tick':
+                print(f"Shard {index}: {payload}")
+                continue
+            shard_rows, shard_failed, elapsed = payload
+            rows += shard_rows
+            self.rows_failed += shard_failed
+            slowest = max(slowest, elapsed)
+
+        self.rows_written += rows
+        self.ticks += 1
+        return rows, slowest
+
+    def stop(self):
+        """Flush and stop every worker"""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                self.commands[index].put(('stop', None))
+
+        for status, payload in self._collect('stopped'):
+            if status == 'stopped':
+                self.rows_written += payload[0]
+                self.rows_failed += payload[1]
+
+        for process in self.processes:
+            process.join(timeout=10)
+        self.processes = []
+        self.commands = []
+
+    def run_single(self):
+        """Run one generation cycle across all workers"""
+        if not self.start():
+            return
+        start = time.perf_counter()
+        rows, slowest = self.tick(datetime.now(), 60)
+        elapsed = time.perf_counter() - start
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        print(f"\n[Write] {rows} rows from {self.workers} workers in {elapsed:.3f}s "
+              f"({rate:,.0f} rows/sec, slowest shard {slowest:.3f}s)")
+        self.stop()
+
+    def run_continuous(self, interval_seconds=60):
+        """Run continuous data generation with every tick on an absolute deadline
+
+        Deadlines are multiples of the interval on the wall clock, as in
+        DriftFreeScheduler, so the period does not grow with the tick's duration;
+        a tick that ends after the next deadline skips the deadlines it missed.
+        """
+        if not self.start():
+            return
+        print(f"\nStarting sharded data generation (interval: {interval_seconds}s, "
+              f"workers: {self.workers})")
+        print("Press Ctrl+C to stop\n")
+
+        # Deadlines are kept in wall-clock seconds and waited for on the monotonic clock
+        offset = time.time() - time.monotonic()
+        deadline = math.ceil(time.time() / interval_seconds) * interval_seconds
+        try:
+            while True:
+                delay = deadline - offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                # Readings are stamped with the deadline, not the (slightly later) start time
+                timestamp = datetime.fromtimestamp(deadline)
+                tick_start = time.perf_counter()
+                rows, slowest = self.tick(timestamp, interval_seconds)
+                elapsed = time.perf_counter() - tick_start
+                rate = rows / elapsed if elapsed > 0 else 0.0
+                print(f"[{timestamp:%Y-%m-%d %H:%M:%S}] {rows} rows in {elapsed:.3f}s "
+                      f"({rate:,.0f} rows/sec, slowest shard {slowest:.3f}s)")
+
+                deadline += interval_seconds
+                behind = time.monotonic() + offset - deadline
+                if behind >= 0:
+                    skipped = int(behind // interval_seconds) + 1
+                    deadline += skipped * interval_seconds
+                    self.missed_deadlines += skipped
+                    print(f"[Scheduler] missed {skipped} deadline(s): tick ran {elapsed:.3f}s "
+                          f"on a {interval_seconds}s interval")
+        except KeyboardInterrupt:
+            print("\n\nStopping data generation...")
+
+        self.stop()
+        self.print_summary()
+
+    def run_backfill(self, start, end, step_seconds=60):
+        """Generate historical data from start to end with every worker on the same ticks"""
+        if not self.start():
+            return
+        step = timedelta(seconds=step_seconds)
+        total_ticks = max(1, int((end - start).total_seconds() // step_seconds))
+        progress_every = max(1, total_ticks // 20)
+        print(f"\nBackfilling {start} -> {end} every {step_seconds}s "
+              f"({total_ticks} ticks, {self.workers} workers)")
+
+        run_start = time.perf_counter()
+        timestamp = start
+        try:
+            while timestamp < end:
+                # Workers buffer rows across ticks and write once their batch is full
+                self.tick(timestamp, step_seconds, flush=False, refresh_devices=False)
+                timestamp += step
+
+                if self.ticks % progress_every == 0:
+                    elapsed = time.perf_counter() - run_start
+                    rate = self.rows_written / elapsed if elapsed > 0 else 0.0
+                    print(f"  {timestamp:%Y-%m-%d %H:%M} {self.ticks}/{total_ticks} ticks, "
+                          f"{self.rows_written} rows ({rate:,.0f} rows/sec)")
+        except KeyboardInterrupt:
+            print("\n\nStopping backfill...")
+
+        self.stop()
+        elapsed = time.perf_counter() - run_start
+        rate = self.rows_written / elapsed if elapsed > 0 else 0.0
+        print(f"\nBackfill complete: {self.ticks} ticks, {self.rows_written} rows "
+              f"in {elapsed:.1f}s ({rate:,.0f} rows/sec, {self.workers} workers)")
+        if self.rows_failed:
+            print(f"Failed rows: {self.rows_failed}")
+
+    def print_summary(self):
+        """Print aggregated throughput statistics"""
+        print(f"Generated {self.ticks} ticks, {self.rows_written} rows across {self.workers} workers")
+        if self.missed_deadlines:
+            print(f"Missed deadlines: {self.missed_deadlines}")
+        if self.rows_failed:
+            print(f"Failed rows: {self.rows_failed}")
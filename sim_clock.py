@@ -0,0 +1,23 @@
+from datetime import datetime
+
+class SystemClock:
+    """Wall-clock time source used for real-time generation"""
+    
+    def now(self):
+        """Current wall-clock time"""
+        return datetime.now()
+
+class SimulatedClock:
+    """Manually advanced time source used for historical backfill"""
+    
+    def __init__(self, start):
+        self.current = start
+    
+    def now(self):
+        """Current simulated time"""
+        return self.current
+    
+    def advance(self, step):
+        """Move the clock forward by a timedelta"""
+        self.current += step
+        return self.current
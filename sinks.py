@@ -0,0 +1,265 @@
+from datetime import date, datetime
+from batch_writer import TABLE_COLUMNS, block_rows
+import numpy as np
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+# Output sinks the generator can write to (postgres: BatchWriter, parquet: ParquetDatasetWriter)
+SINK_KINDS = ('postgres', 'parquet', 'ndjson')
+
+# A producer blocked on a full sink queue for this long is reported right away
+SLOW_SINK_SECONDS = 1.0
+
+def parse_sinks(text, output_dir=None):
+    """Parse 'postgres,parquet:DIR,ndjson[:PATH]' into [(kind, target), ...]
+
+    parquet defaults to output_dir and ndjson to stdout (target None).
+    """
+    sinks = []
+    for item in (text or 'parquet').split(','):
+        kind, _, target = item.strip().partition(':')
+        if kind not in SINK_KINDS:
+            raise ValueError(f"Unknown sink '{kind}'. Use one of: {', '.join(SINK_KINDS)}")
+        if kind == 'parquet':
+            target = target or output_dir
+            if not target:
+                raise ValueError("The parquet sink needs a directory (parquet:DIR or --output-dir)")
+        if any(kind == existing for existing, _ in sinks):
+            raise ValueError(f"Sink '{kind}' given twice")
+        sinks.append((kind, target or None))
+    return sinks
+
+def _json_value(value):
+    """JSON encoding of values json does not handle natively"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+class NdjsonSink:
+    """Write readings as one JSON object per line, tagged with their table
+
+    Lines are encoded as rows arrive and written to the stream (stdout or a
+    file) in one call per flush.
+    """
+
+    def __init__(self, path=None, batch_size=5000, metrics=None):
+        self.path = path
+        self.stream = open(path, 'a', encoding='utf-8') if path else sys.__stdout__
+        self.batch_size = max(1, int(batch_size))
+        self.method = 'ndjson'
+
+        self.lines = []
+        self.pending_count = 0
+
+        # PipelineMetrics receiving rows per table (optional)
+        self.metrics = metrics
+        self.pending_tables = {}
+
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.write_seconds = 0.0
+
+    def _encode(self, table, rows):
+        """Queue JSON lines for rows of a table"""
+        columns = TABLE_COLUMNS[table]
+        self.lines.extend(
+            json.dumps({'table': table, **dict(zip(columns, row))}, default=_json_value, separators=(',', ':'))
+            for row in rows
+        )
+        self.pending_count += len(rows)
+        self.pending_tables[table] = self.pending_tables.get(table, 0) + len(rows)
+        if self.pending_count >= self.batch_size:
+            return self.flush()
+        return True
+
+    def add(self, table, row):
+        """Queue one row; flushes automatically once batch_size rows are pending"""
+        return self._encode(table, [row])
+
+    def add_columns(self, table, columns, count):
+        """Queue a block of count rows given as column arrays keyed by column name"""
+        if count == 0:
+            return True
+        return self._encode(table, block_rows([columns[name] for name in TABLE_COLUMNS[table]], count))
+
+    def flush(self):
+        """Write the pending lines"""
+        if self.pending_count == 0:
+            return True
+
+        lines, count, tables = self.lines, self.pending_count, self.pending_tables
+        self.lines = []
+        self.pending_count = 0
+        self.pending_tables = {}
+
+        start = time.perf_counter()
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+            self.rows_written += count
+            if self.metrics:
+                self.metrics.count_rows('ndjson', tables)
+            return True
+        except Exception as e:
+            print(f"Error writing {count} rows as NDJSON: {e}")
+            self.rows_failed += count
+            if self.metrics:
+                self.metrics.count_rows('ndjson', tables, failed=True)
+            return False
+        finally:
+            self.write_seconds += time.perf_counter() - start
+
+    def close(self):
+        """Write pending lines and close the file (stdout stays open)"""
+        result = self.flush()
+        if self.path:
+            self.stream.close()
+        return result
+
+    def stats(self):
+        """Write counters of this sink"""
+        return {'rows_written': self.rows_written, 'rows_failed': self.rows_failed,
+                'write_seconds': self.write_seconds}
+
+class BufferedSink:
+    """Run a sink on its own thread behind a bounded queue
+
+    add/add_columns/flush only enqueue while the queue has room. When the sink
+    falls behind and the queue is full, the caller blocks until there is room
+    again (backpressure): nothing is dropped, and the time generation spent
+    blocked is counted in stats() and reported when a wait is long.
+    """
+
+    def __init__(self, sink, name, max_queued=None):
+        self.sink = sink
+        self.name = name
+        self.batch_size = sink.batch_size
+        self.method = sink.method
+        self.queue = queue.Queue(maxsize=max_queued or int(os.getenv('SINK_QUEUE_BATCHES', '64')))
+
+        # Backpressure statistics
+        self.peak_queued = 0
+        self.blocked_puts = 0
+        self.blocked_seconds = 0.0
+
+        self.thread = threading.Thread(target=self._run, name=f'sink-{name}', daemon=True)
+        self.thread.start()
+
+    @property
+    def rows_written(self):
+        return self.sink.rows_written
+
+    @property
+    def rows_failed(self):
+        return self.sink.rows_failed
+
+    def _put(self, operation, *args):
+        """Enqueue a call for the sink thread, waiting while the queue is full"""
+        try:
+            self.queue.put_nowait((operation, args))
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put((operation, args))
+            waited = time.perf_counter() - start
+            self.blocked_puts += 1
+            self.blocked_seconds += waited
+            if waited >= SLOW_SINK_SECONDS:
+                print(f"[Sink] {self.name} is falling behind: generation waited {waited:.1f}s "
+                      f"for a full queue of {self.queue.maxsize} batches")
+        self.peak_queued = max(self.peak_queued, self.queue.qsize())
+        return True
+
+    def _run(self):
+        """Sink thread: apply queued calls in order until close"""
+        while True:
+            operation, args = self.queue.get()
+            try:
+                getattr(self.sink, operation)(*args)
+            except Exception as e:
+                print(f"[Sink] {self.name}: {operation} failed: {e}")
+            if operation == 'close':
+                return
+
+    def add(self, table, row):
+        return self._put('add', table, row)
+
+    def add_columns(self, table, columns, count):
+        return self._put('add_columns', table, columns, count)
+
+    def flush(self):
+        """Ask the sink to write its pending rows (does not wait for it)"""
+        return self._put('flush')
+
+    def close(self):
+        """Drain the queue, close the sink and stop its thread"""
+        self._put('close')
+        self.thread.join()
+        return True
+
+    def stats(self):
+        """Write counters of the sink plus queue depth and backpressure"""
+        stats = dict(self.sink.stats())
+        stats.update({
+            'queued': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'peak_queued': self.peak_queued,
+            'blocked_puts': self.blocked_puts,
+            'blocked_seconds': self.blocked_seconds
+        })
+        return stats
+
+class FanoutSink:
+    """Send every reading to several (buffered) sinks
+
+    rows_written counts rows accepted for every sink; rows_failed is the
+    largest failure count of any sink, i.e. rows missing from at least one.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+        self.batch_size = sinks[0].batch_size
+        self.method = '+'.join(sink.method for sink in sinks)
+        self.rows_written = 0
+
+    @property
+    def rows_failed(self):
+        return max(sink.rows_failed for sink in self.sinks)
+
+    def add(self, table, row):
+        for sink in self.sinks:
+            sink.add(table, row)
+        self.rows_written += 1
+        return True
+
+    def add_columns(self, table, columns, count):
+        for sink in self.sinks:
+            sink.add_columns(table, columns, count)
+        self.rows_written += count
+        return True
+
+    def flush(self):
+        return all([sink.flush() for sink in self.sinks])
+
+    def close(self):
+        return all([sink.close() for sink in self.sinks])
+
+    def stats(self):
+        """Accepted rows plus the stats of every sink by name"""
+        return {'rows_written': self.rows_written, 'rows_failed': self.rows_failed,
+                'sinks': {getattr(sink, 'name', sink.method): sink.stats() for sink in self.sinks}}
+
+    def print_summary(self):
+        """Print written/failed rows, queue depth and backpressure per sink"""
+        print(f"  {'Sink':<10} {'Written':>12} {'Failed':>8} {'Queued':>9} {'Peak':>6} "
+              f"{'Blocked':>9} {'Waits':>7}")
+        for name, stats in self.stats()['sinks'].items():
+            print(f"  {name:<10} {stats['rows_written']:>12} {stats['rows_failed']:>8} "
+                  f"{stats.get('queued', 0):>4}/{stats.get('queue_size', 0):<4} "
+                  f"{stats.get('peak_queued', 0):>6} {stats.get('blocked_seconds', 0.0):>8.1f}s "
+                  f"{stats.get('blocked_puts', 0):>7}")
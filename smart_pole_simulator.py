@@ -1,11 +1,13 @@
-import random
-from datetime import datetime
+import numpy as np
+from sim_clock import SystemClock
+from random_streams import RandomStreams
 
 class SmartPoleSimulator:
     """Simulate realistic smart pole energy consumption"""
     
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, clock=None, streams=None):
         self.db = db_connection
+        self.clock = clock or SystemClock()
         self.module_variations = {
             'lighting': 0.15,  # ±15% variation
             'camera': 0.10,    # ±10% variation
@@ -14,6 +16,19 @@ class SmartPoleSimulator:
             'display': 0.20,   # ±20% variation
             'charging': 0.30   # ±30% variation (highly variable)
         }
+        self.streams = streams or RandomStreams()
+        
+        # Base system power (control unit, etc.) and standby values for poles that are off
+        self.base_system_power = 10.0
+        self.standby = {
+            'power_consumption_w': 2.0,
+            'voltage_v': 230.0,
+            'current_a': 0.009,
+            'energy_kwh': 0.002
+        }
+        
+        # Compiled pole x module-type rated power matrix (see load_fleet)
+        self.fleet = None
     
     def get_pole_status(self, pole_id):
         """Get current status of a smart pole"""
@@ -31,92 +46,135 @@ class SmartPoleSimulator:
         modules = self.db.fetch_all(query, (pole_id,))
         return modules
     
-    def calculate_module_power(self, module_type, base_power, light_intensity):
-        """Calculate actual power consumption for a module based on conditions"""
-        hour = datetime.now().hour
+    def get_power_factor(self, module_type, light_intensity):
+        """Time/condition-based power factor of a module type (charging is drawn per pole)"""
+        hour = self.clock.now().hour
         
         # Lighting adjustment based on ambient light
         if module_type == 'lighting':
             if 6 <= hour < 18:  # Daytime
                 # Reduce power based on light intensity
                 if light_intensity > 50000:
-                    power_factor = 0.1  # 10% power during bright daylight
+                    return 0.1  # 10% power during bright daylight
                 elif light_intensity > 20000:
-                    power_factor = 0.3  # 30% power during cloudy day
+                    return 0.3  # 30% power during cloudy day
                 else:
-                    power_factor = 0.7  # 70% power during overcast
+                    return 0.7  # 70% power during overcast
             else:  # Nighttime
-                power_factor = 1.0  # Full power at night
+                return 1.0  # Full power at night
         
         # Display adjustment based on time of day
         elif module_type == 'display':
             if 6 <= hour < 22:
-                power_factor = 1.0  # Full power during active hours
+                return 1.0  # Full power during active hours
             else:
-                power_factor = 0.3  # Reduced power at night
-        
-        # Charging station - highly variable based on usage
-        elif module_type == 'charging':
-            # Random usage pattern (0-100% utilization)
-            power_factor = random.uniform(0.0, 1.0)
+                return 0.3  # Reduced power at night
         
         # Other modules have consistent power draw
-        else:
-            power_factor = 1.0
-        
-        # Apply module-specific variation
-        variation = self.module_variations.get(module_type, 0.05)
-        random_factor = random.uniform(1 - variation, 1 + variation)
-        
-        actual_power = base_power * power_factor * random_factor
-        return actual_power
+        return 1.0
     
-    def generate_energy_data(self, pole_id, weather_data):
-        """Generate energy consumption data for a smart pole"""
-        status = self.get_pole_status(pole_id)
+    def compile_fleet(self, pole_rows, module_rows):
+        """Compile (pole_id, status) and (pole_id, module_type, power_rating_w) rows
+        into a pole x module-type matrix of rated power"""
+        pole_ids = [row[0] for row in pole_rows]
+        position = {pole_id: i for i, pole_id in enumerate(pole_ids)}
+        
+        module_types = list(self.module_variations)
+        for row in module_rows:
+            if row[1] not in module_types:
+                module_types.append(row[1])
+        type_position = {module_type: j for j, module_type in enumerate(module_types)}
+        
+        rated_power = np.zeros((len(pole_ids), len(module_types)), dtype=np.float64)
+        for pole_id, module_type, power_rating in module_rows:
+            if pole_id in position:
+                rated_power[position[pole_id], type_position[module_type]] += float(power_rating)
         
-        # If pole is off, return minimal standby power
-        if status == 'off':
-            return {
-                'power_consumption_w': 2.0,  # Standby power
-                'voltage_v': 230.0,
-                'current_a': 0.009,
-                'energy_kwh': 0.002,
-                'status': 'off'
-            }
+        return {
+            'pole_id': np.array(pole_ids, dtype=object),
+            'stream_key': self.streams.device_keys(pole_ids),
+            'is_on': np.array([row[1] != 'off' for row in pole_rows], dtype=bool),
+            'module_types': module_types,
+            'variation': np.array([self.module_variations.get(t, 0.05) for t in module_types]),
+            'rated_power': rated_power
+        }
+    
+    def load_fleet(self, pole_rows=None, module_rows=None):
+        """Load all poles and their active modules with two bulk queries"""
+        if pole_rows is None:
+            pole_rows = self.db.fetch_all("SELECT pole_id, status FROM smart_poles ORDER BY pole_id")
+        if module_rows is None:
+            query = """
+                SELECT pole_id, module_type, power_rating_w
+                FROM smart_pole_modules
+                WHERE status = 'active'
+            """
+            module_rows = self.db.fetch_all(query)
+        self.fleet = self.compile_fleet(pole_rows, module_rows)
+        return len(self.fleet['pole_id'])
+    
+    def generate_batch(self, weather_data, fleet=None):
+        """Generate energy data for every pole in one vectorized pass
         
-        # Get all modules and calculate total power
-        modules = self.get_pole_modules(pole_id)
-        total_power = 0.0
+        Total power is the rated-power matrix scaled by the per-type time/light
+        factors and per-module noise, summed over module types.
+        """
+        fleet = fleet if fleet is not None else self.fleet
+        count = len(fleet['pole_id'])
+        module_types = fleet['module_types']
+        rng = self.streams.at(fleet['stream_key'], self.clock.now())
         
         light_intensity = weather_data.get('light_intensity_lux', 50000)
+        power_factor = np.tile(
+            [self.get_power_factor(t, light_intensity) for t in module_types], (count, 1)
+        )
+        
+        # Charging station - highly variable based on usage (0-100% utilization)
+        if 'charging' in module_types:
+            power_factor[:, module_types.index('charging')] = rng.uniform(0.0, 1.0, 'charging_utilization')
         
-        for module in modules:
-            module_type, module_name, power_rating, module_status = module
-            module_power = self.calculate_module_power(
-                module_type, 
-                float(power_rating), 
-                light_intensity
-            )
-            total_power += module_power
+        # Apply module-specific variation
+        variation = fleet['variation']
+        random_factor = rng.uniform(1 - variation, 1 + variation, [f'module_{t}' for t in module_types])
         
-        # Add base system power (control unit, etc.)
-        base_system_power = 10.0
-        total_power += base_system_power
+        total_power = (fleet['rated_power'] * power_factor * random_factor).sum(axis=1)
+        total_power += self.base_system_power
         
         # Calculate electrical parameters
-        voltage = random.uniform(220.0, 240.0)  # Grid voltage variation
+        voltage = rng.uniform(220.0, 240.0, 'voltage')  # Grid voltage variation
         current = total_power / voltage
         
         # Energy in kWh (for 1-hour interval, energy = power)
         energy_kwh = total_power / 1000.0
         
+        # Poles that are off only draw standby power
+        is_on = fleet['is_on']
+        standby = self.standby
+        return {
+            'pole_id': fleet['pole_id'],
+            'power_consumption_w': np.where(is_on, np.round(total_power, 2), standby['power_consumption_w']),
+            'voltage_v': np.where(is_on, np.round(voltage, 2), standby['voltage_v']),
+            'current_a': np.where(is_on, np.round(current, 4), standby['current_a']),
+            'energy_kwh': np.where(is_on, np.round(energy_kwh, 4), standby['energy_kwh']),
+            'status': np.where(is_on, 'on', 'off').astype(object)
+        }
+    
+    def generate_energy_data(self, pole_id, weather_data):
+        """Generate energy consumption data for a smart pole"""
+        status = self.get_pole_status(pole_id)
+        modules = self.get_pole_modules(pole_id) if status != 'off' else []
+        fleet = self.compile_fleet(
+            [(pole_id, status)],
+            [(pole_id, module[0], module[2]) for module in modules]
+        )
+        
+        batch = self.generate_batch(weather_data, fleet)
         return {
-            'power_consumption_w': round(total_power, 2),
-            'voltage_v': round(voltage, 2),
-            'current_a': round(current, 4),
-            'energy_kwh': round(energy_kwh, 4),
-            'status': 'on'
+            'power_consumption_w': float(batch['power_consumption_w'][0]),
+            'voltage_v': float(batch['voltage_v'][0]),
+            'current_a': float(batch['current_a'][0]),
+            'energy_kwh': float(batch['energy_kwh'][0]),
+            'status': batch['status'][0]
         }
     
     def get_all_poles(self):
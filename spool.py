@@ -0,0 +1,333 @@
+from batch_writer import BatchWriter, TABLE_COLUMNS, UNAVAILABLE_ERRORS
+from parquet_writer import table_schema, arrow_column
+from rollups import GROUP_COLUMN
+import pyarrow as pa
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Record framing: payload length and CRC-32, followed by an Arrow IPC stream of one block
+RECORD_HEADER = struct.Struct('<II')
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.spool'
+POSITION_FILE = 'position.json'
+QUARANTINE_FILE = 'quarantine.spool'
+
+def encode_block(table, values, count, groups=None):
+    """Serialize a column block (values in TABLE_COLUMNS order) as Arrow IPC bytes"""
+    schema = table_schema(table)
+    arrays = [arrow_column(column, count, field.type) for column, field in zip(values, schema)]
+    if groups is not None:
+        schema = schema.append(pa.field(GROUP_COLUMN, pa.string()))
+        arrays.append(arrow_column(groups, count, pa.string()))
+    schema = schema.with_metadata({'table': table})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression='zstd')) as writer:
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    return sink.getvalue().to_pybytes()
+
+def _numpy_column(column):
+    """An Arrow column as BatchWriter takes it: NaN for missing floats, a list when other values are missing"""
+    if pa.types.is_floating(column.type) or pa.types.is_timestamp(column.type) or column.null_count == 0:
+        return column.to_numpy()
+    return column.to_pylist()
+
+def decode_block(payload):
+    """(table, columns by name, count) of a serialized block"""
+    data = pa.ipc.open_stream(payload).read_all()
+    table = data.schema.metadata[b'table'].decode('utf-8')
+    columns = {name: _numpy_column(data.column(name)) for name in data.column_names}
+    return table, columns, data.num_rows
+
+class SpoolFullError(Exception):
+    """Raised when a block does not fit within the spool's disk limit"""
+
+class Spool:
+    """Append-only local spool of readings the database could not take
+
+    Blocks are appended to numbered segment files as framed, zstd-compressed
+    Arrow IPC records and fsynced, so they survive a crash of the generator.
+    A segment is rotated once it reaches segment_bytes, and appends are
+    refused beyond max_bytes on disk. Blocks are replayed in the order they
+    were spooled; position.json records how far replay has committed, and
+    fully replayed segments are deleted.
+    """
+
+    def __init__(self, directory, segment_bytes=None, max_bytes=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes or int(float(os.getenv('SPOOL_SEGMENT_MB', '64')) * 2**20)
+        self.max_bytes = max_bytes or int(float(os.getenv('SPOOL_MAX_MB', '10240')) * 2**20)
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Segment number -> size in bytes, and the replay position (segment, offset)
+        self.segments = {}
+        for name in os.listdir(directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                number = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                self.segments[number] = os.path.getsize(self._path(number))
+        self.position = self._load_position()
+        if self.segments:
+            self._recover(max(self.segments))
+        self.active = None
+
+        # Statistics
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.rows_quarantined = 0
+
+    def _path(self, number):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:012d}{SEGMENT_SUFFIX}")
+
+    def _load_position(self):
+        """Replay position saved by commit, or the start of the oldest segment"""
+        try:
+            with open(os.path.join(self.directory, POSITION_FILE), encoding='utf-8') as stream:
+                saved = json.load(stream)
+            position = (int(saved['segment']), int(saved['offset']))
+        except (OSError, ValueError, KeyError):
+            position = (min(self.segments), 0) if self.segments else (0, 0)
+        if self.segments and position[0] < min(self.segments):
+            position = (min(self.segments), 0)
+        return position
+
+    def _recover(self, number):
+        """Cut a record left incomplete by a crash off the end of the last segment"""
+        offset = 0
+        with open(self._path(number), 'rb') as stream:
+            while True:
+                header = stream.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, checksum = RECORD_HEADER.unpack(header)
+                payload = stream.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                offset += RECORD_HEADER.size + length
+        if offset < self.segments[number]:
+            print(f"[Spool] Dropping {self.segments[number] - offset} bytes of an incomplete record "
+                  f"at the end of {self._path(number)}")
+            with open(self._path(number), 'r+b') as stream:
+                stream.truncate(offset)
+            self.segments[number] = offset
+
+    def disk_bytes(self):
+        """Bytes of every segment on disk"""
+        return sum(self.segments.values())
+
+    def pending_bytes(self):
+        """Bytes not replayed yet"""
+        with self.lock:
+            segment, offset = self.position
+            pending = sum(size for number, size in self.segments.items() if number > segment)
+            return pending + max(0, self.segments.get(segment, 0) - offset)
+
+    def empty(self):
+        """Whether every spooled block has been replayed"""
+        return self.pending_bytes() <= 0
+
+    def append(self, table, values, count, groups=None):
+        """Durably append a column block; raises SpoolFullError beyond max_bytes"""
+        payload = encode_block(table, values, count, groups)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            if self.disk_bytes() + len(record) > self.max_bytes:
+                raise SpoolFullError(f"Spool {self.directory} is full ({self.disk_bytes()} bytes, "
+                                     f"limit {self.max_bytes})")
+            if self.active is None or self.segments[self.active[0]] >= self.segment_bytes:
+                self._rotate()
+            number, stream = self.active
+            stream.write(record)
+            stream.flush()
+            os.fsync(stream.fileno())
+            self.segments[number] += len(record)
+            self.rows_spooled += count
+
+    def append_rows(self, table, rows):
+        """Durably append row tuples in TABLE_COLUMNS order"""
+        self.append(table, list(zip(*rows)), len(rows))
+
+    def _rotate(self):
+        """Close the active segment and start the next one"""
+        if self.active is not None:
+            self.active[1].close()
+        number = (max(self.segments) if self.segments else self.position[0]) + 1
+        self.segments[number] = 0
+        self.active = (number, open(self._path(number), 'ab'))
+        if self.position[0] not in self.segments:
+            self.position = (number, 0)
+
+    def read(self, max_rows):
+        """Decode the next blocks after the replay position, up to about max_rows rows
+
+        Returns ([(table, columns, count), ...], position after them); pass the
+        position to commit once the blocks are stored. Stops at a segment's end.
+        """
+        with self.lock:
+            segment, offset = self.position
+            if offset >= self.segments.get(segment, 0):
+                # Move on to the next segment once this one is replayed (or gone)
+                later = [number for number in self.segments if number > segment]
+                if later:
+                    segment, offset = min(later), 0
+            end = self.segments.get(segment, 0)
+
+        blocks, rows = [], 0
+        if offset >= end:
+            return blocks, (segment, offset)
+        with open(self._path(segment), 'rb') as stream:
+            stream.seek(offset)
+            while offset < end and rows < max_rows:
+                length, checksum = RECORD_HEADER.unpack(stream.read(RECORD_HEADER.size))
+                payload = stream.read(length)
+                offset += RECORD_HEADER.size + length
+                if zlib.crc32(payload) != checksum:
+                    print(f"[Spool] Skipping a corrupt record in {self._path(segment)}")
+                    continue
+                table, columns, count = decode_block(payload)
+                blocks.append((table, columns, count))
+                rows += count
+        return blocks, (segment, offset)
+
+    def commit(self, position, rows=0):
+        """Record that blocks up to position are stored; delete fully replayed segments"""
+        with self.lock:
+            self.position = position
+            self.rows_replayed += rows
+            path = os.path.join(self.directory, POSITION_FILE)
+            with open(path + '.tmp', 'w', encoding='utf-8') as stream:
+                json.dump({'segment': position[0], 'offset': position[1]}, stream)
+                stream.flush()
+                os.fsync(stream.fileno())
+            os.replace(path + '.tmp', path)
+
+            active = self.active[0] if self.active else None
+            for number in [number for number in self.segments if number < position[0] and number != active]:
+                os.remove(self._path(number))
+                del self.segments[number]
+            segment, offset = position
+            if segment != active and segment in self.segments and offset >= self.segments[segment]:
+                os.remove(self._path(segment))
+                del self.segments[segment]
+
+    def quarantine(self, table, columns, count):
+        """Set aside a replayed block the database rejects, in QUARANTINE_FILE with the same framing
+
+        The block is kept for inspection (decode_block reads it back) instead of
+        holding up replay of everything spooled after it.
+        """
+        values = [columns[name] for name in TABLE_COLUMNS[table]]
+        payload = encode_block(table, values, count, columns.get(GROUP_COLUMN))
+        with self.lock:
+            with open(os.path.join(self.directory, QUARANTINE_FILE), 'ab') as stream:
+                stream.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+                stream.flush()
+                os.fsync(stream.fileno())
+            self.rows_quarantined += count
+        print(f"[Spool] Quarantined {count} rows of {table} the database rejected "
+              f"in {os.path.join(self.directory, QUARANTINE_FILE)}")
+
+    def close(self):
+        """Close the active segment"""
+        with self.lock:
+            if self.active is not None:
+                self.active[1].close()
+                self.active = None
+
+    def stats(self):
+        """Spool counters and disk usage"""
+        return {'rows_spooled': self.rows_spooled, 'rows_replayed': self.rows_replayed,
+                'rows_quarantined': self.rows_quarantined, 'pending_bytes': self.pending_bytes(),
+                'disk_bytes': self.disk_bytes(), 'segments': len(self.segments)}
+
+class SpoolDrainer:
+    """Replay a spool into PostgreSQL from a background thread once the database is back
+
+    Uses its own connection and a BatchWriter without a spool, so replayed
+    blocks are written with COPY, rollups and latest values in one transaction
+    per chunk of replay_rows rows, in the order they were spooled. A chunk that
+    fails because the database is unavailable stays in the spool and is
+    retried after retry_seconds; a chunk the database rejects (e.g. readings of
+    a since-deleted device) is replayed block by block and the rejected blocks
+    are quarantined. Replay is at least once: a crash between a commit and
+    saving the position replays that chunk again.
+    """
+
+    def __init__(self, spool, db_connection, replay_rows=None, retry_seconds=None, rollups=True,
+                 metrics=None):
+        self.spool = spool
+        self.db = db_connection
+        self.replay_rows = replay_rows or int(os.getenv('SPOOL_REPLAY_ROWS', '100000'))
+        self.retry_seconds = retry_seconds or float(os.getenv('SPOOL_RETRY_SECONDS', '5'))
+        # Only explicit flushes write, so a chunk is one transaction
+        self.writer = BatchWriter(db_connection, batch_size=2**62, rollups=rollups, metrics=metrics)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='spool-drainer', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        """Drain whenever the spool holds blocks, retrying while the database is unavailable"""
+        while not self.stopping.is_set():
+            if self.spool.empty() or not self.drain():
+                self.stopping.wait(self.retry_seconds)
+
+    def drain(self):
+        """Replay the spool until it is empty; returns False if the database refused a chunk"""
+        if (self.db.conn is None or self.db.conn.closed) and not self.db.connect():
+            return False
+
+        started = time.perf_counter()
+        replayed = 0
+        while not self.stopping.is_set():
+            blocks, position = self.spool.read(self.replay_rows)
+            if not blocks:
+                if position != self.spool.position:
+                    self.spool.commit(position)
+                    continue
+                break
+            rows = sum(count for _, _, count in blocks)
+            for table, columns, count in blocks:
+                self.writer.add_columns(table, columns, count)
+            if not self.writer.flush() and not self._replay_blocks(blocks):
+                print(f"[Spool] Replay paused, retrying in {self.retry_seconds:.0f}s "
+                      f"({self.spool.pending_bytes()} bytes pending)")
+                return False
+            self.spool.commit(position, rows)
+            replayed += rows
+
+        if replayed:
+            print(f"[Spool] Replayed {replayed} rows in {time.perf_counter() - started:.1f}s")
+        return True
+
+    def _replay_blocks(self, blocks):
+        """Replay a chunk one block per transaction after it failed, quarantining rejected blocks
+
+        Returns False if the chunk failed (or a block fails) because the database
+        is unavailable; the chunk is then retried as a whole, so blocks written
+        here may be written again.
+        """
+        if isinstance(self.writer.last_error, UNAVAILABLE_ERRORS):
+            return False
+        for table, columns, count in blocks:
+            self.writer.add_columns(table, columns, count)
+            if self.writer.flush():
+                continue
+            if isinstance(self.writer.last_error, UNAVAILABLE_ERRORS):
+                return False
+            self.spool.quarantine(table, columns, count)
+        return True
+
+    def stop(self):
+        """Stop after the chunk being replayed; the rest stays spooled for the next run"""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.db.disconnect()
@@ -8,6 +8,10 @@ echo "Smart City Data Generator - Test Suite"
 echo "========================================"
 echo ""
 
+# Scratch directory for the offline tests (no database needed), removed on exit
+TEST_DIR=$(mktemp -d)
+trap 'rm -rf "$TEST_DIR"' EXIT
+
 # Function to check exit status
 check_status() {
     if [ $? -eq 0 ]; then
@@ -72,6 +76,121 @@ docker compose exec -T postgres psql -U admin -d smart_city -c "SELECT COUNT(*)
 check_status "Database query"
 echo ""
 
+# Test 10: Parquet sink without a database
+echo "Test 10: Generating a cycle into a Parquet dataset (offline)..."
+python main.py generate --sink parquet:"$TEST_DIR/parquet" --devices 200 --seed 42 > /dev/null 2>&1 \
+    && [ -n "$(find "$TEST_DIR/parquet" -name '*.parquet')" ]
+check_status "Parquet sink"
+echo ""
+
+# Test 11: NDJSON sink without a database
+echo "Test 11: Generating a cycle as NDJSON (offline)..."
+python main.py generate --sink ndjson:"$TEST_DIR/readings.ndjson" --devices 200 --seed 42 > /dev/null 2>&1 \
+    && [ "$(wc -l < "$TEST_DIR/readings.ndjson")" -gt 0 ]
+check_status "NDJSON sink"
+echo ""
+
+# Test 12: Sharded backfill without a database
+echo "Test 12: Backfilling 10 minutes with 2 worker processes (offline)..."
+python main.py backfill --from 2024-01-01T00:00 --to 2024-01-01T00:10 --devices 300 --seed 42 --workers 2 \
+    --output-dir "$TEST_DIR/sharded" > /dev/null 2>&1 \
+    && [ -n "$(find "$TEST_DIR/sharded" -name '*.parquet')" ]
+check_status "Sharded backfill"
+echo ""
+
+# Test 13: Reproducible readings
+echo "Test 13: Checking that a seed gives the same readings with 1 and 2 workers (offline)..."
+for workers in 1 2; do
+    python main.py backfill --from 2024-01-01T00:00 --to 2024-01-01T00:10 --devices 300 --seed 7 \
+        --workers $workers --sink ndjson:"$TEST_DIR/seed7-w$workers.ndjson" > /dev/null 2>&1 || break
+done
+python main.py backfill --from 2024-01-01T00:00 --to 2024-01-01T00:10 --devices 300 --seed 8 \
+    --sink ndjson:"$TEST_DIR/seed8.ndjson" > /dev/null 2>&1 \
+    && cmp -s <(sort "$TEST_DIR/seed7-w1.ndjson") <(cat "$TEST_DIR"/seed7-w2-*.ndjson | sort) \
+    && ! cmp -s <(sort "$TEST_DIR/seed7-w1.ndjson") <(sort "$TEST_DIR/seed8.ndjson")
+check_status "Reproducible readings"
+echo ""
+
+# Test 14: Spool framing and crash recovery
+echo "Test 14: Spooling blocks, cutting a torn record and replaying (offline)..."
+SPOOL_TEST_DIR="$TEST_DIR/spool" python - > /dev/null 2>&1 <<'PYTHON'
+import os
+from datetime import datetime
+from spool import Spool
+
+directory = os.environ['SPOOL_TEST_DIR']
+columns = [['WS001', 'WS002'], [datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 1, 0, 1)],
+           [28.5, 28.6], [65.0, 64.0], [1013.25, 1013.2], [2.5, 2.4], [180, 90], [0.0, 0.0], [50000, 51000]]
+spool = Spool(directory)
+spool.append('weather_station', columns, 2)
+spool.append('weather_station', columns, 2)
+spool.close()
+
+# A crash in the middle of an append leaves a torn record at the end of the segment
+segment = os.path.join(directory, sorted(name for name in os.listdir(directory) if name.endswith('.spool'))[-1])
+intact = os.path.getsize(segment)
+with open(segment, 'ab') as stream:
+    stream.write(b'\x40\x00\x00\x00torn')
+
+spool = Spool(directory)
+assert os.path.getsize(segment) == intact, 'torn record not cut off'
+blocks, position = spool.read(10)
+assert [(table, count) for table, _, count in blocks] == [('weather_station', 2)] * 2
+assert list(blocks[0][1]['station_id']) == ['WS001', 'WS002']
+spool.commit(position, 4)
+assert spool.empty()
+PYTHON
+check_status "Spool recovery"
+echo ""
+
+# Test 15: Keyset pagination cursors
+echo "Test 15: Round-tripping pagination cursors (offline)..."
+python - > /dev/null 2>&1 <<'PYTHON'
+from datetime import datetime
+from pagination import encode_cursor, decode_cursor, InvalidCursorError
+
+moment = datetime(2024, 1, 1, 12, 30, 15, 250000)
+assert decode_cursor(encode_cursor(moment, 42), datetime, int) == (moment, 42)
+assert decode_cursor(encode_cursor('PM1P001'), str) == ('PM1P001',)
+for cursor, types in (('not a cursor', (datetime, int)), (encode_cursor(moment, 42), (datetime,)),
+                      (encode_cursor('yesterday', 1), (datetime, int))):
+    try:
+        decode_cursor(cursor, *types)
+    except InvalidCursorError:
+        continue
+    raise AssertionError(f'{cursor!r} decoded')
+PYTHON
+check_status "Pagination cursors"
+echo ""
+
+# Test 16: LTTB downsampling
+echo "Test 16: Downsampling a series with LTTB (offline)..."
+python - > /dev/null 2>&1 <<'PYTHON'
+import numpy as np
+from downsampling import lttb_indices
+
+x = np.arange(1000, dtype=np.float64)
+y = np.sin(x / 50.0)
+y[500] = 10.0
+kept = lttb_indices(x, y, 50)
+assert len(kept) == 50 and kept[0] == 0 and kept[-1] == 999
+assert np.all(np.diff(kept) > 0), 'indices not increasing'
+assert 500 in kept, 'spike dropped'
+assert list(lttb_indices(x[:10], y[:10], 50)) == list(range(10))
+PYTHON
+check_status "LTTB downsampling"
+echo ""
+
+# Test 17: Partition maintenance and migration
+echo "Test 17: Maintaining partitions and running the (no-op) partition migration..."
+python main.py partitions > /dev/null 2>&1 \
+    && python main.py migrate-partitions > /dev/null 2>&1 \
+    && [ "$(docker compose exec -T postgres psql -U admin -d smart_city -tAc \
+        "SELECT COUNT(*) FROM pg_partitioned_table WHERE partrelid::regclass::text IN \
+         ('weather_station', 'smart_pole_energy', 'power_meter_readings', 'flow_meter_readings');" 2> /dev/null)" = "4" ]
+check_status "Partitions"
+echo ""
+
 echo "========================================"
 echo "All tests passed! ✓"
 echo "========================================"